@@ -1,13 +1,48 @@
 import streamlit as st
-import pandas as pd
 import os
-import plotly.graph_objects as go
 
-from services.document_service import upload_document_both
-from db.queries import search_documents, delete_document_by_filename, delete_blob_by_filename
-from storage.gcs import download_file_timed, delete_file
+# pandas and plotly are imported where results are rendered, and the asyncio
+# engine inside the Compare Engines handler. The services below, benchmark,
+# history and hedge included, load on every start; their cost is what
+# utils/import_profile.py reports.
+from services.document_service import upload_document_both, upload_document_streaming, delete_documents
+from services.document_service import download_document, read_document_range
+from services.ingest_service import bulk_ingest, items_from_uploads, items_from_zip, items_from_manifest
+from db.queries import search_documents_page
 from utils.cost_calculator import estimate_cost
-from services.benchmark_service import run_benchmark, results_to_excel, BENCHMARK_SIZES
+from services.benchmark_service import run_benchmark, BENCHMARK_SIZES, RANGE_READ_BYTES
+from services.export_service import export_results
+from services.benchmark_service import summarize_results, summarize_phases, summarize_averages, results_digest
+from storage.backends import MemoryBackend, LocalFSBackend, LATENCY_PROFILES, backend_from_env
+from storage.gcs import set_backend_factory
+from services.history_service import environment_fingerprint, save_run, list_runs, compare_runs
+from services.benchmark_service import run_pool_comparison, run_concurrency_benchmark
+from services.benchmark_service import CONCURRENCY_LEVELS, ENGINE_CONCURRENCY_LEVELS
+from db.connection import pool_stats, POOL_MAX_SIZE
+from db.search_cache import search_cache
+from storage.download_cache import download_cache
+from services.placement_service import placement_policy, set_placement_policy, thresholds_from_results
+from services.hedge_service import hedged_reader, run_hedge_benchmark, HEDGE_READS, HEDGE_PREFERRED
+from services.write_behind_service import write_behind_queue
+
+
+@st.cache_resource
+def shared_storage_backend():
+    """One storage client per server process, built on first use and shared by every session."""
+    return backend_from_env()
+
+
+set_backend_factory(shared_storage_backend)
+
+
+@st.cache_resource
+def started_write_behind_queue():
+    """Re-queue jobs left in the write-behind spool and start its workers, once per server process."""
+    write_behind_queue.start()
+    return write_behind_queue
+
+
+started_write_behind_queue()
 
 
 st.set_page_config(page_title="Student Document Manager", layout="wide")
@@ -490,6 +525,9 @@ PLOT_LAYOUT = dict(
 C_SQL = "#C9B59C"   # warm tan — Cloud SQL
 C_GCS = "#8a9fae"   # muted steel — GCS
 
+# Bytes shown by the per-document preview (a byte-range read)
+PREVIEW_BYTES = 4 * 1024
+
 # ─── Page title ────────────────────────────────────────────────────────────
 st.title("Student Document Manager")
 st.caption("Compare Cloud SQL and Google Cloud Storage — upload speed, download speed, and cost.")
@@ -512,6 +550,52 @@ with col2:
     doc_type = st.selectbox("Document Type", ["ID", "Transcript", "Certificate", "Other"])
     file     = st.file_uploader("Choose a file")
 
+up1, up2 = st.columns(2)
+with up1:
+    concurrent_upload = st.checkbox(
+        "Write to Cloud SQL and GCS concurrently", value=True,
+        help="Untick to run the two writes one after another and compare the wall-clock total."
+    )
+    stream_upload = st.checkbox(
+        "Stream in chunks (bounded memory)", value=False,
+        help="Reads the upload chunk by chunk into a resumable GCS upload and a chunked SQL write."
+    )
+    compress_upload = st.checkbox(
+        "Compress by document type", value=True,
+        help="Applies the compression policy (e.g. zstd for transcripts) to the bytes written to "
+             "both stores; downloads are decompressed transparently."
+    )
+    dedup_upload = st.checkbox(
+        "Deduplicate identical content", value=True,
+        help="Hashes the file (SHA-256). If the same bytes are already stored, no data is "
+             "transferred and the new document points at the existing object."
+    )
+with up2:
+    chunk_mb = st.select_slider("Chunk size (MB)", options=[0.25, 0.5, 1, 2, 4, 8], value=1,
+                                disabled=not stream_upload)
+    policy = placement_policy()
+    policy_label = ("both stores" if policy["mode"] == "both"
+                    else f"≤ {round(policy['sql_max_bytes'] / 1024, 1)} KB → Cloud SQL, larger → GCS")
+    placement_choice = st.selectbox(
+        "Store in", [f"Policy ({policy_label})", "Both", "Cloud SQL only", "GCS only"],
+        help=f"Placement policy source: {policy['source']}. Set PLACEMENT_MODE, or apply a "
+             "benchmark's thresholds in Section 3. Comparisons below need both."
+    )
+    upload_placement = {"Both": "both", "Cloud SQL only": "sql", "GCS only": "gcs"}.get(placement_choice)
+    write_behind_upload = st.checkbox(
+        "Write-behind to GCS", value=False, disabled=stream_upload,
+        help="Returns once the bytes are in the local spool; background workers upload them to GCS "
+             "(with retries) and mark the document committed."
+    )
+    queue_stats = write_behind_queue.stats()
+    if queue_stats["spooled"] or queue_stats["recovered"]:
+        st.caption(
+            f"Write-behind queue: {queue_stats['depth']} pending ({queue_stats['in_flight']} uploading, "
+            f"{queue_stats['pending_bytes'] / 1024:.1f} KB), oldest {queue_stats['oldest_pending_s']} s — "
+            f"draining {queue_stats['drain_rate'] * 60:.1f}/min on {queue_stats['workers']} workers; "
+            f"{queue_stats['committed']} committed, {queue_stats['retries']} retries, {queue_stats['failed']} failed"
+        )
+
 if st.button("Upload to Both and Compare", type="primary"):
     if not student_id:
         st.error("Student ID is required.")
@@ -522,13 +606,37 @@ if st.button("Upload to Both and Compare", type="primary"):
 
     with st.spinner("Uploading to Cloud SQL and GCS..."):
         try:
-            result     = upload_document_both(student_id, student_name, doc_type, file)
+            if stream_upload:
+                result = upload_document_streaming(student_id, student_name, doc_type, file,
+                                                   chunk_size=int(chunk_mb * 1024 * 1024),
+                                                   dedup=dedup_upload, compress=compress_upload,
+                                                   placement=upload_placement)
+            else:
+                result = upload_document_both(student_id, student_name, doc_type, file,
+                                              concurrent=concurrent_upload, dedup=dedup_upload,
+                                              compress=compress_upload, placement=upload_placement,
+                                              write_behind=write_behind_upload)
             sql_ms     = result["sql_upload_ms"]
             gcs_ms     = result["gcs_upload_ms"]
             size_bytes = result["file_size_bytes"]
-            cost       = estimate_cost(size_bytes)
-
-            st.success(f"'{result['filename']}' uploaded to both destinations.")
+            # Storage is billed on what is actually stored
+            cost       = estimate_cost(result["stored_size_bytes"])
+
+            stored_in = {"both": "both destinations", "sql": "Cloud SQL only", "gcs": "GCS only"}
+            st.success(f"'{result['filename']}' uploaded to {stored_in[result['storage_backend']]}.")
+            if result.get("upload_status") == "pending":
+                st.info(
+                    f"GCS upload queued (write-behind): the bytes were spooled locally in "
+                    f"{result['gcs_upload_ms']} ms, so the GCS time below is the spool write. "
+                    "The document is marked committed once a background worker has uploaded it."
+                )
+            if result["deduplicated"]:
+                st.info(
+                    f"Identical content is already stored (SHA-256 {result['content_hash'][:12]}…), "
+                    f"so nothing was transferred — the document points at "
+                    f"{result['gcs_path'] or 'the existing Cloud SQL copy'}. "
+                    f"Done in {result['total_ms']} ms."
+                )
 
             st.subheader("Upload Speed")
             c1, c2 = st.columns(2)
@@ -547,6 +655,14 @@ if st.button("Upload to Both and Compare", type="primary"):
                     delta_color="inverse"
                 )
 
+            mode_label = "concurrent" if result["concurrent"] else "sequential"
+            if "chunks" in result:
+                mode_label += f", streamed in {result['chunks']} chunk(s)"
+            st.caption(
+                f"Wall-clock total ({mode_label}, incl. metadata insert): {result['total_ms']} ms — "
+                f"overlapping the writes saved {result['overlap_saved_ms']} ms."
+            )
+
             winner_upload = "Cloud SQL" if sql_ms < gcs_ms else "GCS"
             st.markdown(
                 f'<div class="result-banner">Faster upload: '
@@ -569,14 +685,78 @@ if st.button("Upload to Both and Compare", type="primary"):
                     help=f"${cost['gcs_price_per_gb']}/GB/month (Standard)"
                 )
 
-            st.info(
-                f"File size: {cost['size_kb']} KB — "
-                f"GCS is {cost['gcs_cheaper_by_x']}x cheaper than Cloud SQL for storage."
-            )
+            if result["codec"] != "none":
+                st.info(
+                    f"File size: {round(size_bytes / 1024, 2)} KB, stored as {cost['size_kb']} KB "
+                    f"({result['codec']}, {round(size_bytes / max(result['stored_size_bytes'], 1), 1)}x smaller) — "
+                    f"GCS is {cost['gcs_cheaper_by_x']}x cheaper than Cloud SQL for storage."
+                )
+            else:
+                st.info(
+                    f"File size: {cost['size_kb']} KB — "
+                    f"GCS is {cost['gcs_cheaper_by_x']}x cheaper than Cloud SQL for storage."
+                )
 
         except Exception as e:
             st.error(f"Upload failed: {e}")
 
+# ── Bulk ingest ────────────────────────────────────────────────────────────
+with st.expander("Bulk ingest — many files, a zip archive, or a manifest CSV"):
+    st.caption(
+        "Plain files are stored under the student below. A zip is read as <student_id>/<filename> "
+        "unless it contains manifest.csv. A manifest CSV (student_id, name, doc_type, filename[, path]) "
+        "maps the uploaded files to students."
+    )
+    bi1, bi2 = st.columns(2)
+    with bi1:
+        bulk_files = st.file_uploader("Files or .zip archives", accept_multiple_files=True, key="bulk_files")
+        bulk_manifest = st.file_uploader("Manifest CSV (optional)", type=["csv"], key="bulk_manifest")
+    with bi2:
+        bulk_sid      = st.text_input("Student ID for plain files", key="bulk_sid")
+        bulk_name     = st.text_input("Student name for plain files", key="bulk_name")
+        bulk_doc_type = st.selectbox("Document type for plain files / zip",
+                                     ["ID", "Transcript", "Certificate", "Other"], key="bulk_doc_type")
+        bulk_workers  = st.slider("GCS upload workers", min_value=1, max_value=32, value=8)
+
+    if st.button("Ingest All", key="bulk_ingest"):
+        try:
+            zips  = [f for f in bulk_files if f.name.lower().endswith(".zip")]
+            plain = [f for f in bulk_files if not f.name.lower().endswith(".zip")]
+            items = []
+            for z in zips:
+                items += items_from_zip(z, default_doc_type=bulk_doc_type)
+            if bulk_manifest is not None:
+                items += items_from_manifest(bulk_manifest, plain)
+            elif plain:
+                if not bulk_sid:
+                    st.error("Student ID is required for plain files without a manifest.")
+                    st.stop()
+                items += items_from_uploads(plain, bulk_sid, bulk_name, bulk_doc_type)
+            if not items:
+                st.error("Nothing to ingest.")
+                st.stop()
+
+            bulk_progress = st.progress(0, text="Starting ingest...")
+
+            def update_bulk_progress(current, total, label):
+                bulk_progress.progress(int((current / total) * 100), text=f"[{current}/{total}] {label}")
+
+            job = bulk_ingest(items, max_workers=bulk_workers, progress_callback=update_bulk_progress)
+            bulk_progress.progress(100, text="Ingest complete.")
+
+            st.success(
+                f"Ingested {job['files']} file(s) for {job['students']} student(s) in {job['total_ms']} ms."
+            )
+            m1, m2, m3 = st.columns(3)
+            m1.metric("Files / s", job["files_per_s"])
+            m2.metric("MB / s", job["mb_per_s"])
+            m3.metric("Failed", len(job["failed"]))
+            if job["failed"]:
+                import pandas as pd
+                st.dataframe(pd.DataFrame(job["failed"]), use_container_width=True)
+        except Exception as e:
+            st.error(f"Bulk ingest failed: {e}")
+
 st.divider()
 
 # ═══════════════════════════════════════════════════════════════════════════
@@ -594,42 +774,151 @@ with st.form("search_form"):
     with sf1:
         s_student_id = st.text_input("Student ID (optional)")
         s_filename   = st.text_input("Filename contains (optional)")
+        s_page_size  = st.selectbox("Results per page", [25, 50, 100, 200], index=1)
     with sf2:
-        s_doc_type = st.selectbox("Document Type", ["All", "ID", "Transcript", "Certificate", "Other"])
+        s_doc_type  = st.selectbox("Document Type", ["All", "ID", "Transcript", "Certificate", "Other"])
+        s_date_from = st.date_input("Uploaded from (optional)", value=None)
+        s_date_to   = st.date_input("Uploaded to (optional)", value=None)
 
     submitted = st.form_submit_button("Search", type="primary")
 
+
+def load_search_page(cursor):
+    """Fetch one page for the stored search filters, starting after `cursor`."""
+    params = st.session_state["search_params"]
+    rows, next_cursor = search_documents_page(
+        student_id=params["student_id"] or None,
+        doc_type=params["doc_type"],
+        filename_query=params["filename"] or None,
+        date_from=params["date_from"],
+        date_to=params["date_to"],
+        limit=params["page_size"],
+        cursor=cursor,
+    )
+    # Store results in session_state so they survive reruns (e.g. after delete)
+    st.session_state["search_results"] = rows
+    st.session_state["search_next_cursor"] = next_cursor
+    # Bytes fetched on demand for the previous page are no longer needed
+    st.session_state["downloads"] = {}
+    st.session_state["previews"] = {}
+
+
+def apply_delete_report(report):
+    """Drop deleted rows from the current page and remember the report for display."""
+    removed = {item["row_key"] for item in report if item["sql_deleted"] or item["gcs_deleted"]}
+    st.session_state["search_results"] = [
+        r for r in st.session_state["search_results"] if r["row_key"] not in removed
+    ]
+    for key in removed:
+        st.session_state.get("downloads", {}).pop(key, None)
+        st.session_state.get("previews", {}).pop(key, None)
+    st.session_state["delete_report"] = report
+
+
 if submitted:
     try:
-        results = search_documents(
-            student_id=s_student_id or None,
-            doc_type=s_doc_type,
-            filename_query=s_filename or None,
-        )
-        # Store results in session_state so they survive reruns (e.g. after delete)
-        st.session_state["search_results"] = results
         st.session_state["search_params"] = {
             "student_id": s_student_id,
             "doc_type": s_doc_type,
             "filename": s_filename,
+            "date_from": s_date_from,
+            "date_to": s_date_to,
+            "page_size": s_page_size,
         }
+        # Cursor that starts each visited page; page 1 starts at None
+        st.session_state["search_page_cursors"] = [None]
+        load_search_page(None)
     except Exception as e:
         st.error(f"Search error: {e}")
 
 # ── Render results from session_state (persists after delete reruns) ─────────
 if "search_results" in st.session_state:
-    results = st.session_state["search_results"]
     params  = st.session_state.get("search_params", {})
+    cursors = st.session_state.setdefault("search_page_cursors", [None])
+
+    nav_prev, nav_label, nav_next = st.columns([1, 4, 1])
+    with nav_prev:
+        if st.button("Previous page", disabled=len(cursors) <= 1, key="search_prev"):
+            try:
+                cursors.pop()
+                load_search_page(cursors[-1])
+            except Exception as e:
+                st.error(f"Search error: {e}")
+    with nav_next:
+        if st.button("Next page", disabled=st.session_state.get("search_next_cursor") is None,
+                     key="search_next"):
+            try:
+                cursors.append(st.session_state["search_next_cursor"])
+                load_search_page(cursors[-1])
+            except Exception as e:
+                st.error(f"Search error: {e}")
+    with nav_label:
+        more = " — more on the next page" if st.session_state.get("search_next_cursor") else ""
+        cache = search_cache.stats()
+        st.caption(
+            f"Page {len(cursors)}{more} · search cache: {cache['hit_ratio']:.0%} hit ratio "
+            f"({cache['hits']} hits / {cache['misses']} misses, {cache['size']}/{cache['max_entries']} entries, "
+            f"{cache['invalidations']} invalidated, {cache['evictions']} evicted)"
+        )
+        dl_cache = download_cache.stats()
+        st.caption(
+            f"Download cache: {dl_cache['hit_ratio']:.0%} hit ratio "
+            f"({dl_cache['memory_hits']} memory / {dl_cache['disk_hits']} disk hits, {dl_cache['misses']} misses), "
+            f"{dl_cache['memory_bytes'] / 1024 ** 2:.1f}/{dl_cache['max_bytes'] / 1024 ** 2:.0f} MB in memory"
+            + (f", {dl_cache['disk_bytes'] / 1024 ** 2:.1f} MB on disk" if dl_cache["disk_max_bytes"] else "")
+        )
+        hedge_downloads = st.checkbox(
+            "Hedge downloads across Cloud SQL and GCS", value=HEDGE_READS, key="hedge_downloads",
+            help=f"Reads {HEDGE_PREFERRED.upper()} first and, if it is slower than usual, races the other "
+                 "store; documents stored in only one place are read from there."
+        )
+        hedge = hedged_reader.stats()
+        if hedge["reads"]:
+            st.caption(
+                f"Hedged reads: {hedge['reads']} — {hedge['hedge_rate']:.0%} sent a second request, "
+                f"{hedge['secondary_wins']} won by the other store, {hedge['cancelled']} cancelled, "
+                f"{hedge['abandoned']} abandoned in flight"
+            )
+
+    results = st.session_state["search_results"]
 
     if results:
-        st.success(f"Found {len(results)} document(s) matching your filters.")
+        import pandas as pd
+
+        st.success(f"Showing {len(results)} document(s) matching your filters (page {len(cursors)}).")
 
         df_search = pd.DataFrame(results)
         df_search.columns = [
             "Row Key", "Student ID", "Student Name", "Doc Type",
-            "Filename", "GCS Path", "Size (KB)", "Uploaded At"
+            "Filename", "GCS Path", "Size (KB)", "Stored (KB)", "Codec", "Stored In", "Content Hash",
+            "Upload Status", "Uploaded At"
         ]
-        st.dataframe(df_search.drop(columns=["Row Key", "GCS Path"]), use_container_width=True)
+        st.dataframe(df_search.drop(columns=["Row Key", "GCS Path", "Content Hash"]), use_container_width=True)
+
+        # ── Bulk delete ──
+        by_key = {r["row_key"]: r for r in results}
+        selected = st.multiselect(
+            "Select documents to delete",
+            options=list(by_key),
+            format_func=lambda k: f"{by_key[k]['filename']} · {by_key[k]['student_id']}",
+            key="bulk_delete_selection",
+        )
+        if st.button(f"Delete selected ({len(selected)})", disabled=not selected,
+                     key="bulk_delete", type="secondary"):
+            with st.spinner(f"Deleting {len(selected)} document(s)..."):
+                apply_delete_report(delete_documents([by_key[k] for k in selected]))
+            st.session_state.pop("bulk_delete_selection", None)
+            st.rerun()
+
+        report = st.session_state.pop("delete_report", None)
+        if report:
+            ok = [r for r in report if r["sql_deleted"] and r["gcs_deleted"]]
+            failed = [r for r in report if not (r["sql_deleted"] and r["gcs_deleted"])]
+            if ok:
+                st.success(f"{len(ok)} document(s) deleted from Cloud SQL and GCS in {report[0]['batch_ms']} ms.")
+            for r in failed:
+                where = "GCS" if r["sql_deleted"] else "Cloud SQL"
+                st.error(f"'{r['filename']}' — {where} delete failed: {r['error'] or 'no matching row'}")
 
         st.markdown("**Actions per document**")
 
@@ -641,39 +930,55 @@ if "search_results" in st.session_state:
                     f"**{doc['filename']}** &nbsp;·&nbsp; "
                     f"{doc['student_id']} &nbsp;·&nbsp; "
                     f"{doc['doc_type']} &nbsp;·&nbsp; "
-                    f"{doc['size_kb']} KB",
+                    f"{doc['size_kb']} KB"
+                    + (f" ({doc['codec']}, {doc['stored_kb']} KB stored)" if doc.get("codec", "none") != "none" else "")
+                    + (f" &nbsp;·&nbsp; {doc['storage_backend']} only" if doc.get("storage_backend", "both") != "both"
+                       else ""),
                     unsafe_allow_html=True
                 )
 
             with col_dl:
-                try:
-                    data, elapsed = download_file_timed(doc["gcs_object_name"])
+                # Objects are only pulled when the user asks for them
+                downloads = st.session_state.setdefault("downloads", {})
+                source = "Cloud SQL" if doc.get("storage_backend") == "sql" else "GCS"
+                if doc["row_key"] not in downloads:
+                    if st.button(f"Fetch from {source}", key=f"fetch_{doc['row_key']}"):
+                        try:
+                            downloads[doc["row_key"]] = download_document(doc, hedge=hedge_downloads)
+                        except Exception:
+                            st.warning(f"{source} unavailable")
+                if doc["row_key"] in downloads:
+                    data, elapsed, miss_ms = downloads[doc["row_key"]]
                     st.download_button(
-                        label=f"Download ({elapsed} ms)",
+                        label=(f"Download (cache hit {elapsed} ms · miss {miss_ms} ms)" if miss_ms is not None
+                               else f"Download ({elapsed} ms)"),
                         data=data,
                         file_name=doc["filename"],
                         key=f"dl_{doc['row_key']}"
                     )
-                except Exception:
-                    st.warning("GCS unavailable")
+                # Byte-range read: only the first PREVIEW_BYTES leave the store
+                previews = st.session_state.setdefault("previews", {})
+                if doc["row_key"] not in previews:
+                    if st.button(f"Preview first {PREVIEW_BYTES // 1024} KB", key=f"preview_{doc['row_key']}"):
+                        try:
+                            previews[doc["row_key"]] = read_document_range(doc, 0, PREVIEW_BYTES)
+                        except Exception:
+                            st.warning(f"{source} unavailable")
 
             with col_del:
                 if st.button("Delete", key=f"del_{doc['row_key']}",
                              help=f"Permanently delete {doc['filename']} from Cloud SQL and GCS",
                              type="secondary"):
-                    try:
-                        delete_document_by_filename(doc["student_id"], doc["filename"])
-                        delete_blob_by_filename(doc["student_id"], doc["filename"])
-                        delete_file(doc["gcs_object_name"])
-                        # Remove from session_state immediately so rerun shows updated list
-                        st.session_state["search_results"] = [
-                            r for r in st.session_state["search_results"]
-                            if r["row_key"] != doc["row_key"]
-                        ]
-                        st.success(f"'{doc['filename']}' deleted from Cloud SQL and GCS.")
-                        st.rerun()
-                    except Exception as ex:
-                        st.error(f"Delete failed: {ex}")
+                    # Same path as bulk delete: one SQL transaction, then GCS
+                    apply_delete_report(delete_documents([doc]))
+                    st.rerun()
+
+            if doc["row_key"] in st.session_state.get("previews", {}):
+                head, elapsed = st.session_state["previews"][doc["row_key"]]
+                st.caption(f"First {len(head)} bytes of {doc['filename']} — read in {elapsed} ms")
+                text = head.decode("utf-8", errors="replace")
+                # Show binary headers (PDF, images) as hex rather than replacement characters
+                st.code(text if text.count("\ufffd") < len(text) // 20 + 1 else head[:512].hex(" ", 16))
 
             st.divider()
 
@@ -685,14 +990,22 @@ if "search_results" in st.session_state:
                 conditions_display.append(f"d.doc_type = '{params['doc_type']}'")
             if params.get("filename"):
                 conditions_display.append(f"d.filename ILIKE '%{params['filename']}%'")
+            if params.get("date_from"):
+                conditions_display.append(f"d.uploaded_at >= '{params['date_from']}'")
+            if params.get("date_to"):
+                conditions_display.append(f"d.uploaded_at < '{params['date_to']}'::date + 1")
+            if len(cursors) > 1:
+                conditions_display.append("(d.uploaded_at, d.student_id, d.filename) < (<cursor>)")
             where = ("WHERE " + " AND ".join(conditions_display)) if conditions_display else "(no filters — all records)"
             st.code(f"""
 SELECT d.student_id, s.name, d.doc_type, d.filename,
-       d.file_size_bytes / 1024.0 AS size_kb, d.uploaded_at
+       d.file_size_bytes / 1024.0 AS size_kb,
+       d.stored_size_bytes / 1024.0 AS stored_kb, d.codec, d.uploaded_at
 FROM documents d
 JOIN students s ON d.student_id = s.student_id
 {where}
-ORDER BY d.uploaded_at DESC;
+ORDER BY d.uploaded_at DESC, d.student_id DESC, d.filename DESC
+LIMIT {params.get('page_size', 50)};
             """, language="sql")
     else:
         st.warning("No documents found matching your filters.")
@@ -715,15 +1028,44 @@ st.info(
     + ", ".join(s[0] for s in BENCHMARK_SIZES)
 )
 
-runs_per_size = st.slider(
-    "Runs per file size — more runs produce more accurate averages",
-    min_value=1, max_value=5, value=3
-)
+rs1, rs2 = st.columns([3, 1])
+with rs1:
+    runs_per_size = st.slider(
+        "Runs per file size — more runs produce more accurate percentiles",
+        min_value=1, max_value=100, value=10
+    )
+with rs2:
+    warmup_runs = st.number_input(
+        "Warmup runs per size (not recorded)", min_value=0, max_value=10, value=1
+    )
+
+sb1, sb2, sb3 = st.columns(3)
+with sb1:
+    bench_storage = st.selectbox(
+        "Object storage for this run",
+        ["Configured backend", "In-memory stand-in", "Local filesystem"],
+        help="The stand-ins run without GCP credentials or network, for reproducible regression runs."
+    )
+with sb2:
+    bench_profile = st.selectbox(
+        "Stand-in latency profile", list(LATENCY_PROFILES), index=list(LATENCY_PROFILES).index("same-region"),
+        disabled=bench_storage != "In-memory stand-in"
+    )
+with sb3:
+    bench_include_sql = st.checkbox("Include Cloud SQL", value=True)
+    bench_compression = st.selectbox(
+        "Compare compression", ["Off", "zstd", "gzip"],
+        help="Also time every operation on the compressed file (compression and decompression "
+             "included). zstd falls back to gzip if zstandard isn't installed."
+    )
+    bench_save = st.checkbox("Save run to history", value=True)
+    bench_label = st.text_input("Run label (optional)", placeholder="e.g. after adding indexes")
 
+iterations = len(BENCHMARK_SIZES) * (runs_per_size + warmup_runs)
 st.warning(
-    f"This will perform {len(BENCHMARK_SIZES) * runs_per_size * 4} real network operations "
-    f"({len(BENCHMARK_SIZES) * runs_per_size} uploads and downloads to each service). "
-    "Expect 1 to 3 minutes depending on your connection."
+    f"This will perform {iterations * 5} real network operations "
+    f"({iterations} uploads to each service and {iterations * 3} downloads, warmups included). "
+    "Expect a few minutes for larger run counts, depending on your connection."
 )
 
 btn_col1, btn_col2 = st.columns([3, 1])
@@ -732,6 +1074,7 @@ with btn_col1:
 with btn_col2:
     if st.button("Reset Results", key="reset_benchmark"):
         st.session_state.pop("benchmark_results", None)
+        st.session_state.pop("benchmark_digest", None)
         st.rerun()
 
 if run_clicked:
@@ -745,119 +1088,336 @@ if run_clicked:
 
     try:
         with st.spinner("Running benchmark — please wait..."):
+            if bench_storage == "In-memory stand-in":
+                storage_backend = MemoryBackend.from_profile(bench_profile)
+            elif bench_storage == "Local filesystem":
+                storage_backend = LocalFSBackend(os.getenv("LOCAL_STORAGE_DIR", "local_storage"))
+            else:
+                storage_backend = None
             bench_results = run_benchmark(
                 runs_per_size=runs_per_size,
-                progress_callback=update_progress
+                progress_callback=update_progress,
+                warmup_runs=int(warmup_runs),
+                include_sql=bench_include_sql,
+                storage_backend=storage_backend,
+                compression=None if bench_compression == "Off" else bench_compression,
             )
         st.session_state["benchmark_results"] = bench_results
+        st.session_state["benchmark_digest"] = results_digest(bench_results)
         progress_bar.progress(100, text="Benchmark complete.")
         status_text.empty()
 
+        if bench_save:
+            try:
+                run_id = save_run(
+                    bench_results, runs_per_size, int(warmup_runs),
+                    environment_fingerprint(storage_backend, bench_include_sql),
+                    label=bench_label or None,
+                )
+                st.caption(f"Saved to benchmark history as run #{run_id}.")
+            except Exception as e:
+                st.warning(f"Could not save run to history: {e}")
+
     except Exception as e:
         st.error(f"Benchmark failed: {e}")
 
+# ── Derived views (cached per result set) ─────────────────────────────────
+@st.cache_data(max_entries=4, show_spinner=False)
+def benchmark_views(digest, _results):
+    """
+    Tables, chart specs and export summaries for one benchmark result set.
+    Cached on the results digest, so reruns triggered by any other widget
+    reuse them instead of re-aggregating and rebuilding every figure.
+    """
+    import pandas as pd
+    import plotly.graph_objects as go
+
+    averages = summarize_averages(_results)
+    percentiles = summarize_results(_results)
+    df_raw = pd.DataFrame(_results)
+    df_avg = pd.DataFrame(averages)
+    size_labels = df_avg["size_label"].tolist()
+    figures = {}
+
+    for operation in ["upload", "download"]:
+        fig = go.Figure(data=[
+            go.Box(name="Cloud SQL", x=df_raw["size_label"].tolist(),
+                   y=df_raw[f"sql_{operation}_ms"].tolist(), marker_color=C_SQL, boxpoints="outliers"),
+            go.Box(name="GCS",       x=df_raw["size_label"].tolist(),
+                   y=df_raw[f"gcs_{operation}_ms"].tolist(), marker_color=C_GCS, boxpoints="outliers"),
+        ])
+        fig.update_layout(boxmode="group", xaxis_title="File Size",
+                          yaxis_title=f"{operation.title()} Latency (ms)", height=400, **PLOT_LAYOUT)
+        figures[f"box_{operation}"] = fig.to_dict()
+
+        fig = go.Figure(data=[
+            go.Bar(name="Cloud SQL", x=size_labels, y=df_avg[f"avg_sql_{operation}"].tolist(),
+                   marker_color=C_SQL),
+            go.Bar(name="GCS",       x=size_labels, y=df_avg[f"avg_gcs_{operation}"].tolist(),
+                   marker_color=C_GCS),
+        ])
+        fig.update_layout(barmode="group", xaxis_title="File Size",
+                          yaxis_title=f"Avg {operation.title()} Time (ms)", height=380, **PLOT_LAYOUT)
+        figures[operation] = fig.to_dict()
+
+    # Byte-range reads (not measured by the asyncio engine)
+    if df_avg["avg_gcs_range"].notna().any():
+        fig = go.Figure(data=[
+            go.Bar(name="Cloud SQL substring()", x=size_labels, y=df_avg["avg_sql_range"].tolist(),
+                   marker_color=C_SQL),
+            go.Bar(name="GCS ranged GET",        x=size_labels, y=df_avg["avg_gcs_range"].tolist(),
+                   marker_color=C_GCS),
+        ])
+        fig.update_layout(barmode="group", xaxis_title="File Size",
+                          yaxis_title="Avg Range Read Time (ms)", height=380, **PLOT_LAYOUT)
+        figures["range"] = fig.to_dict()
+
+    compressed = df_avg["compression_ratio"].notna().any()
+    if compressed:
+        fig = go.Figure(data=[
+            go.Bar(name="GCS upload (raw)",        x=size_labels, y=df_avg["avg_gcs_upload"],
+                   marker_color=C_GCS),
+            go.Bar(name="GCS upload (compressed)", x=size_labels, y=df_avg["avg_gcs_upload_compressed"],
+                   marker_color=C_GCS, opacity=0.55),
+            go.Bar(name="SQL upload (raw)",        x=size_labels, y=df_avg["avg_sql_upload"],
+                   marker_color=C_SQL),
+            go.Bar(name="SQL upload (compressed)", x=size_labels, y=df_avg["avg_sql_upload_compressed"],
+                   marker_color=C_SQL, opacity=0.55),
+        ])
+        fig.update_layout(barmode="group", xaxis_title="File Size",
+                          yaxis_title="Avg Upload Time (ms)", height=380, **PLOT_LAYOUT)
+        figures["compressed"] = fig.to_dict()
+
+    fig = go.Figure(data=[
+        go.Bar(name="First byte", x=size_labels, y=df_avg["avg_sql_first_byte"].tolist(),
+               marker_color=C_GCS),
+        go.Bar(name="Last byte",  x=size_labels, y=df_avg["avg_sql_last_byte"].tolist(),
+               marker_color=C_SQL),
+    ])
+    fig.update_layout(barmode="group", xaxis_title="File Size",
+                      yaxis_title="Avg Time (ms)", height=380, **PLOT_LAYOUT)
+    figures["stream"] = fig.to_dict()
+
+    df_phase = pd.DataFrame(summarize_phases(_results))
+    if not df_phase.empty:
+        for operation, df_op in df_phase.groupby("operation", sort=False):
+            fig = go.Figure(data=[
+                go.Bar(name=phase, x=grp["size_label"].tolist(), y=grp["wall_ms"].tolist(),
+                       customdata=grp["cpu_ms"].tolist(),
+                       hovertemplate="%{x}: %{y} ms wall, %{customdata} ms CPU")
+                for phase, grp in df_op.groupby("phase", sort=False)
+            ])
+            fig.update_layout(barmode="stack", xaxis_title="File Size",
+                              yaxis_title="Avg Time (ms)", height=400, **PLOT_LAYOUT)
+            figures[f"phase_{operation}"] = fig.to_dict()
+
+    sql_costs_micro = [round(v * 1_000_000, 4) for v in df_avg["sql_cost"].tolist()]
+    gcs_costs_micro = [round(v * 1_000_000, 4) for v in df_avg["gcs_cost"].tolist()]
+    fig = go.Figure(data=[
+        go.Bar(
+            name="Cloud SQL (~$0.17/GB)",
+            x=size_labels, y=sql_costs_micro,
+            marker_color=C_SQL,
+            text=[f"${v:.4f}" for v in sql_costs_micro],
+            textposition="outside",
+            textfont=dict(color="#111111"),
+        ),
+        go.Bar(
+            name="GCS (~$0.023/GB)",
+            x=size_labels, y=gcs_costs_micro,
+            marker_color=C_GCS,
+            text=[f"${v:.4f}" for v in gcs_costs_micro],
+            textposition="outside",
+            textfont=dict(color="#111111"),
+        ),
+    ])
+    fig.update_layout(
+        barmode="group",
+        xaxis_title="File Size",
+        yaxis_title="Monthly Cost (millionths of a dollar)",
+        height=400,
+        **PLOT_LAYOUT
+    )
+    figures["cost"] = fig.to_dict()
+
+    return {
+        "raw": df_raw,
+        "avg": df_avg,
+        "pct": pd.DataFrame(percentiles),
+        "codec": df_raw["codec"].iloc[0] if compressed else None,
+        "phase_operations": [op for op in ["sql_upload", "gcs_upload", "sql_download", "gcs_download"]
+                             if f"phase_{op}" in figures],
+        "figures": figures,
+        "summaries": (averages, percentiles),
+    }
+
+
+@st.cache_data(max_entries=4, show_spinner=False)
+def benchmark_export(digest, fmt, _results, _summaries):
+    """Export bytes for one result set and format, built once per digest."""
+    return export_results(_results, fmt, *_summaries)
+
+
+# (label, file name, MIME type) per export format
+EXPORT_FILES = {
+    "excel":   ("Excel", "benchmark_results.xlsx",
+                "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"),
+    "csv":     ("CSV", "benchmark_results.csv", "text/csv"),
+    "parquet": ("Parquet", "benchmark_results.parquet", "application/vnd.apache.parquet"),
+}
+
+
 # ── Results (persisted in session_state) ──────────────────────────────────
 if "benchmark_results" in st.session_state:
     bench_results = st.session_state["benchmark_results"]
+    if "benchmark_digest" not in st.session_state:
+        st.session_state["benchmark_digest"] = results_digest(bench_results)
+    views = benchmark_views(st.session_state["benchmark_digest"], bench_results)
+    figures = views["figures"]
+    df_raw, df_avg = views["raw"], views["avg"]
     st.success(f"Benchmark complete — {len(bench_results)} measurements recorded.")
 
-    df_raw = pd.DataFrame(bench_results)
-
     st.subheader("Raw Results")
     df_display = df_raw[[
         "size_label", "run",
         "sql_upload_ms", "gcs_upload_ms",
         "sql_download_ms", "gcs_download_ms",
+        "sql_stream_first_byte_ms", "sql_stream_last_byte_ms",
+        "sql_range_ms", "gcs_range_ms",
         "faster_upload", "faster_download"
     ]].copy()
     df_display.columns = [
         "Size", "Run",
         "SQL Upload (ms)", "GCS Upload (ms)",
         "SQL Download (ms)", "GCS Download (ms)",
+        "SQL Stream First Byte (ms)", "SQL Stream Last Byte (ms)",
+        "SQL Range Read (ms)", "GCS Range Read (ms)",
         "Faster Upload", "Faster Download"
     ]
     st.dataframe(df_display, use_container_width=True, height=350)
 
     st.subheader("Averages per File Size")
-    df_avg = df_raw.groupby("size_label", sort=False).agg(
-        avg_sql_upload=("sql_upload_ms", "mean"),
-        avg_gcs_upload=("gcs_upload_ms", "mean"),
-        avg_sql_download=("sql_download_ms", "mean"),
-        avg_gcs_download=("gcs_download_ms", "mean"),
-        sql_cost=("sql_cost_usd", "first"),
-        gcs_cost=("gcs_cost_usd", "first"),
-    ).round(6).reset_index()
-
-    size_order = [s[0] for s in BENCHMARK_SIZES]
-    df_avg["size_label"] = pd.Categorical(df_avg["size_label"], categories=size_order, ordered=True)
-    df_avg = df_avg.sort_values("size_label")
-    size_labels = df_avg["size_label"].tolist()
-
-    st.dataframe(df_avg.rename(columns={
+    st.dataframe(df_avg[[
+        "size_label", "avg_sql_upload", "avg_gcs_upload", "avg_sql_download", "avg_gcs_download",
+        "avg_sql_first_byte", "avg_sql_last_byte", "avg_sql_range", "avg_gcs_range", "sql_cost", "gcs_cost",
+    ]].rename(columns={
         "size_label":       "Size",
         "avg_sql_upload":   "Avg SQL Upload (ms)",
         "avg_gcs_upload":   "Avg GCS Upload (ms)",
         "avg_sql_download": "Avg SQL Download (ms)",
         "avg_gcs_download": "Avg GCS Download (ms)",
+        "avg_sql_first_byte": "Avg SQL Stream First Byte (ms)",
+        "avg_sql_last_byte":  "Avg SQL Stream Last Byte (ms)",
+        "avg_sql_range":    "Avg SQL Range Read (ms)",
+        "avg_gcs_range":    "Avg GCS Range Read (ms)",
         "sql_cost":         "SQL Cost/mo ($)",
         "gcs_cost":         "GCS Cost/mo ($)",
     }), use_container_width=True)
 
+    # ── Placement thresholds ──
+    thresholds = thresholds_from_results(bench_results)
+    sql_sizes = [s["size_label"] for s in thresholds["sizes"] if s["placement"] == "sql"]
+    st.caption(
+        "Placement from this run: " + (
+            f"Cloud SQL up to {sql_sizes[-1]} ({round(thresholds['sql_max_bytes'] / 1024, 1)} KB), GCS above"
+            if sql_sizes else "GCS for every size (Cloud SQL never won on both latency and cost)"
+        )
+    )
+    if st.button("Use these thresholds for uploads", key="apply_placement"):
+        set_placement_policy("size", thresholds["sql_max_bytes"], source="Section 3 benchmark")
+        st.rerun()
+
+    # ── Tail latency ──
+    st.subheader("Latency Percentiles per File Size")
+    st.caption("Warmup runs are excluded. CI = bootstrap 95% confidence interval of the mean.")
+    st.dataframe(views["pct"].drop(columns=["metric"]).rename(columns={
+        "size_label":   "Size",
+        "metric_label": "Operation",
+        "n":            "Samples",
+        "mean":         "Mean (ms)",
+        "stddev":       "Std Dev (ms)",
+        "min":          "Min (ms)",
+        "max":          "Max (ms)",
+        "p50":          "p50 (ms)",
+        "p90":          "p90 (ms)",
+        "p95":          "p95 (ms)",
+        "p99":          "p99 (ms)",
+        "ci95_low":     "Mean CI Low (ms)",
+        "ci95_high":    "Mean CI High (ms)",
+    }), use_container_width=True, height=350)
+
+    box_col1, box_col2 = st.columns(2)
+    for col, operation in [(box_col1, "upload"), (box_col2, "download")]:
+        with col:
+            st.plotly_chart(figures[f"box_{operation}"], use_container_width=True)
+
     # ── Upload time chart ──
     st.subheader("Upload Time by File Size")
-    fig_up = go.Figure(data=[
-        go.Bar(name="Cloud SQL", x=size_labels, y=df_avg["avg_sql_upload"].tolist(),
-               marker_color=C_SQL),
-        go.Bar(name="GCS",       x=size_labels, y=df_avg["avg_gcs_upload"].tolist(),
-               marker_color=C_GCS),
-    ])
-    fig_up.update_layout(barmode="group", xaxis_title="File Size",
-                         yaxis_title="Avg Upload Time (ms)", height=380, **PLOT_LAYOUT)
-    st.plotly_chart(fig_up, use_container_width=True)
+    st.plotly_chart(figures["upload"], use_container_width=True)
 
     # ── Download time chart ──
     st.subheader("Download Time by File Size")
-    fig_dl = go.Figure(data=[
-        go.Bar(name="Cloud SQL", x=size_labels, y=df_avg["avg_sql_download"].tolist(),
-               marker_color=C_SQL),
-        go.Bar(name="GCS",       x=size_labels, y=df_avg["avg_gcs_download"].tolist(),
-               marker_color=C_GCS),
-    ])
-    fig_dl.update_layout(barmode="group", xaxis_title="File Size",
-                         yaxis_title="Avg Download Time (ms)", height=380, **PLOT_LAYOUT)
-    st.plotly_chart(fig_dl, use_container_width=True)
+    st.plotly_chart(figures["download"], use_container_width=True)
+
+    # ── Range read chart ──
+    if "range" in figures:
+        st.subheader("Byte-Range Read by File Size")
+        st.caption(
+            f"Reads only the first {RANGE_READ_BYTES // 1024} KB (e.g. a header or first-page preview): "
+            "a ranged GET on GCS, substring() on the BYTEA column."
+        )
+        st.plotly_chart(figures["range"], use_container_width=True)
+
+    # ── Compressed vs raw ──
+    if views["codec"]:
+        st.subheader(f"Compressed ({views['codec']}) vs Raw")
+        st.caption(
+            "Compressed timings include compressing before upload and decompressing after download. "
+            "The generated test files are repetitive text, so their ratio is a best case."
+        )
+        st.dataframe(df_avg[[
+            "size_label", "compression_ratio",
+            "avg_sql_upload", "avg_sql_upload_compressed", "avg_gcs_upload", "avg_gcs_upload_compressed",
+            "avg_sql_download", "avg_sql_download_compressed",
+            "avg_gcs_download", "avg_gcs_download_compressed",
+            "sql_cost", "sql_cost_compressed", "gcs_cost", "gcs_cost_compressed",
+        ]].rename(columns={
+            "size_label": "Size", "compression_ratio": "Ratio",
+            "avg_sql_upload": "SQL Upload Raw (ms)", "avg_sql_upload_compressed": "SQL Upload Compressed (ms)",
+            "avg_gcs_upload": "GCS Upload Raw (ms)", "avg_gcs_upload_compressed": "GCS Upload Compressed (ms)",
+            "avg_sql_download": "SQL Download Raw (ms)",
+            "avg_sql_download_compressed": "SQL Download Compressed (ms)",
+            "avg_gcs_download": "GCS Download Raw (ms)",
+            "avg_gcs_download_compressed": "GCS Download Compressed (ms)",
+            "sql_cost": "SQL Cost/mo Raw ($)", "sql_cost_compressed": "SQL Cost/mo Compressed ($)",
+            "gcs_cost": "GCS Cost/mo Raw ($)", "gcs_cost_compressed": "GCS Cost/mo Compressed ($)",
+        }), use_container_width=True)
+        st.plotly_chart(figures["compressed"], use_container_width=True)
+
+    # ── Streamed SQL read chart ──
+    st.subheader("Cloud SQL Streamed Read: First vs Last Byte")
+    st.caption("Ranged substring() reads — time to the first chunk vs time to the whole blob.")
+    st.plotly_chart(figures["stream"], use_container_width=True)
+
+    # ── Phase breakdown ──
+    st.subheader("Where the Time Goes")
+    st.caption(
+        "Average time per phase. Cloud SQL: connect (pool checkout or new connection), serialize "
+        "(BYTEA escaping), execute (send + server + receive), decode, copy, commit. "
+        "GCS: prepare, send / fetch. Hover for CPU time on this thread vs wall time."
+    )
+    if views["phase_operations"]:
+        phase_op = st.selectbox(
+            "Operation", views["phase_operations"],
+            format_func=lambda o: o.replace("_", " ").replace("sql", "Cloud SQL").replace("gcs", "GCS"),
+            key="phase_operation",
+        )
+        st.plotly_chart(figures[f"phase_{phase_op}"], use_container_width=True)
 
     # ── Cost chart ──
     st.subheader("Monthly Storage Cost Estimate")
     st.caption("Cost per file stored for one month — Cloud SQL (SSD) vs GCS (Standard).")
-    sql_costs_micro = [round(v * 1_000_000, 4) for v in df_avg["sql_cost"].tolist()]
-    gcs_costs_micro = [round(v * 1_000_000, 4) for v in df_avg["gcs_cost"].tolist()]
-    fig_cost = go.Figure(data=[
-        go.Bar(
-            name="Cloud SQL (~$0.17/GB)",
-            x=size_labels, y=sql_costs_micro,
-            marker_color=C_SQL,
-            text=[f"${v:.4f}" for v in sql_costs_micro],
-            textposition="outside",
-            textfont=dict(color="#111111"),
-        ),
-        go.Bar(
-            name="GCS (~$0.023/GB)",
-            x=size_labels, y=gcs_costs_micro,
-            marker_color=C_GCS,
-            text=[f"${v:.4f}" for v in gcs_costs_micro],
-            textposition="outside",
-            textfont=dict(color="#111111"),
-        ),
-    ])
-    fig_cost.update_layout(
-        barmode="group",
-        xaxis_title="File Size",
-        yaxis_title="Monthly Cost (millionths of a dollar)",
-        height=400,
-        **PLOT_LAYOUT
-    )
-    st.plotly_chart(fig_cost, use_container_width=True)
+    st.plotly_chart(figures["cost"], use_container_width=True)
 
     gcs_cheaper = round(0.17 / 0.023, 1)
     st.markdown(
@@ -867,11 +1427,415 @@ if "benchmark_results" in st.session_state:
     )
 
     st.subheader("Export Results")
-    excel_bytes = results_to_excel(bench_results)
-    st.download_button(
-        label="Download benchmark_results.xlsx",
-        data=excel_bytes,
-        file_name="benchmark_results.xlsx",
-        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    export_fmt = st.radio("Format", list(EXPORT_FILES), format_func=lambda f: EXPORT_FILES[f][0],
+                          horizontal=True, key="export_format")
+    _, export_name, export_mime = EXPORT_FILES[export_fmt]
+    try:
+        st.download_button(
+            label=f"Download {export_name}",
+            data=benchmark_export(st.session_state["benchmark_digest"], export_fmt,
+                                  bench_results, views["summaries"]),
+            file_name=export_name,
+            mime=export_mime,
+        )
+    except ImportError as e:
+        st.warning(f"{EXPORT_FILES[export_fmt][0]} export unavailable: {e}")
+    if export_fmt == "excel":
+        st.caption("Three sheets: Raw Results (every individual run), Averages by Size, and Percentiles by Size.")
+    else:
+        st.caption("One row per run with every measured field — better suited to large runs and further analysis.")
+
+# ── Benchmark history ──────────────────────────────────────────────────────
+st.subheader("Benchmark History")
+st.caption(
+    "Saved runs with their environment fingerprint. Compare two runs per size and operation; "
+    "a change is flagged when the median moves by at least 5% and a Mann-Whitney U test is significant."
+)
+try:
+    history = list_runs()
+except Exception as e:
+    history = []
+    st.warning(f"Benchmark history unavailable: {e}")
+
+if len(history) >= 2:
+    import pandas as pd
+
+    def run_name(run):
+        fp = run["fingerprint"] or {}
+        label = f" — {run['label']}" if run["label"] else ""
+        return (f"#{run['run_id']} · {run['created_at']:%Y-%m-%d %H:%M} · "
+                f"{fp.get('storage_backend', '?')} · {fp.get('git_rev') or 'no git rev'}{label}")
+
+    runs_by_id = {r["run_id"]: r for r in history}
+    hc1, hc2 = st.columns(2)
+    with hc1:
+        baseline_id = st.selectbox("Baseline run", list(runs_by_id), index=1,
+                                   format_func=lambda i: run_name(runs_by_id[i]), key="hist_base")
+    with hc2:
+        candidate_id = st.selectbox("Candidate run", list(runs_by_id), index=0,
+                                    format_func=lambda i: run_name(runs_by_id[i]), key="hist_cand")
+
+    with st.expander("Environment fingerprints"):
+        fc1, fc2 = st.columns(2)
+        fc1.json(runs_by_id[baseline_id]["fingerprint"] or {})
+        fc2.json(runs_by_id[candidate_id]["fingerprint"] or {})
+
+    df_cmp = pd.DataFrame(compare_runs(baseline_id, candidate_id))
+    if df_cmp.empty:
+        st.info("The two runs have no size/operation in common.")
+    else:
+        n_reg = int((df_cmp["verdict"] == "regression").sum())
+        n_imp = int((df_cmp["verdict"] == "improvement").sum())
+        if n_reg:
+            st.error(f"{n_reg} significant regression(s) between run #{baseline_id} and run #{candidate_id}.")
+        else:
+            st.success(f"No significant regressions ({n_imp} significant improvement(s)).")
+
+        def verdict_style(v):
+            return {"regression": "background-color: #FFCCCC", "improvement": "background-color: #C6EFCE"}.get(v, "")
+
+        st.dataframe(
+            df_cmp.drop(columns=["metric"]).rename(columns={
+                "size_label": "Size", "metric_label": "Operation",
+                "baseline_n": "Base n", "candidate_n": "Cand n",
+                "baseline_p50": "Base p50 (ms)", "candidate_p50": "Cand p50 (ms)",
+                "baseline_p95": "Base p95 (ms)", "candidate_p95": "Cand p95 (ms)",
+                "baseline_mean": "Base Mean (ms)", "candidate_mean": "Cand Mean (ms)",
+                "p50_change_pct": "p50 Change (%)", "p_value": "p-value", "verdict": "Verdict",
+            }).style.map(verdict_style, subset=["Verdict"]),
+            use_container_width=True, height=350,
+        )
+elif history:
+    st.info("Save at least two runs to compare them.")
+
+# ── Throughput vs concurrency ──────────────────────────────────────────────
+st.subheader("Throughput vs Concurrency")
+st.caption(
+    "Runs each selected size with several concurrent clients (worker threads) and reports "
+    "aggregate ops/s, MB/s and latency under load for each backend."
+)
+
+cc1, cc2, cc3 = st.columns(3)
+with cc1:
+    conc_levels = st.multiselect(
+        "Concurrent clients", [1, 2, 4, 8, 16, 32, 64], default=CONCURRENCY_LEVELS
+    )
+with cc2:
+    conc_sizes = st.multiselect(
+        "File sizes", [s[0] for s in BENCHMARK_SIZES], default=["10 KB", "1 MB"]
+    )
+with cc3:
+    ops_per_client = st.slider("Operations per client", min_value=1, max_value=10, value=4)
+
+if st.button("Run Concurrency Sweep", key="run_concurrency"):
+    if not conc_levels or not conc_sizes:
+        st.error("Pick at least one client count and one file size.")
+        st.stop()
+
+    progress_bar = st.progress(0, text="Starting sweep...")
+
+    def update_conc_progress(current, total, label):
+        progress_bar.progress(int((current / total) * 100), text=f"[{current}/{total}] {label}")
+
+    try:
+        with st.spinner("Running concurrency sweep — please wait..."):
+            st.session_state["concurrency_results"] = run_concurrency_benchmark(
+                concurrency_levels=sorted(conc_levels),
+                ops_per_client=ops_per_client,
+                sizes=[s for s in BENCHMARK_SIZES if s[0] in conc_sizes],
+                progress_callback=update_conc_progress,
+            )
+        progress_bar.progress(100, text="Sweep complete.")
+    except Exception as e:
+        st.error(f"Concurrency sweep failed: {e}")
+
+if "concurrency_results" in st.session_state:
+    import pandas as pd
+    import plotly.graph_objects as go
+
+    df_conc = pd.DataFrame(st.session_state["concurrency_results"])
+    st.dataframe(df_conc.drop(columns=["size_bytes"]).rename(columns={
+        "size_label":     "Size",
+        "concurrency":    "Clients",
+        "backend":        "Backend",
+        "operation":      "Operation",
+        "ops":            "Ops",
+        "errors":         "Errors",
+        "wall_ms":        "Wall (ms)",
+        "ops_per_s":      "Ops/s",
+        "mb_per_s":       "MB/s",
+        "avg_latency_ms": "Avg Latency (ms)",
+        "p50_latency_ms": "p50 (ms)",
+        "p95_latency_ms": "p95 (ms)",
+        "max_latency_ms": "Max (ms)",
+        "pool_waits":     "Pool Waits",
+    }), use_container_width=True, height=300)
+
+    conc_size = st.selectbox("Chart size", df_conc["size_label"].unique().tolist(), key="conc_chart_size")
+    df_c = df_conc[df_conc["size_label"] == conc_size]
+
+    chart_col1, chart_col2 = st.columns(2)
+    for col, metric, title in [
+        (chart_col1, "ops_per_s", "Throughput (ops/s)"),
+        (chart_col2, "p95_latency_ms", "p95 Latency under Load (ms)"),
+    ]:
+        fig = go.Figure()
+        for backend, colour in [("SQL", C_SQL), ("GCS", C_GCS)]:
+            for operation, dash in [("upload", "solid"), ("download", "dot")]:
+                sel = df_c[(df_c["backend"] == backend) & (df_c["operation"] == operation)]
+                fig.add_trace(go.Scatter(
+                    name=f"{'Cloud SQL' if backend == 'SQL' else 'GCS'} {operation}",
+                    x=sel["concurrency"].tolist(), y=sel[metric].tolist(),
+                    mode="lines+markers", line=dict(color=colour, dash=dash),
+                ))
+        fig.update_layout(xaxis_title="Concurrent Clients", yaxis_title=title, height=380, **PLOT_LAYOUT)
+        fig.update_xaxes(type="log")
+        with col:
+            st.plotly_chart(fig, use_container_width=True)
+
+# ── Threaded vs asyncio engine ─────────────────────────────────────────────
+st.subheader("Threaded vs asyncio Engine")
+st.caption(
+    "Runs the same uploads and downloads on the threaded engine (one worker thread per client) and "
+    "on the asyncio engine (asyncpg + aiohttp on one event loop). CPU is process CPU time per step. "
+    "Both engines get a database pool of the same size, and each level's uploads are deleted afterwards."
+)
+
+ec1, ec2, ec3 = st.columns(3)
+with ec1:
+    engine_levels = st.multiselect(
+        "Operations in flight", [1, 8, 32, 64, 128, 256, 512], default=ENGINE_CONCURRENCY_LEVELS
+    )
+with ec2:
+    engine_sizes = st.multiselect(
+        "File sizes", [s[0] for s in BENCHMARK_SIZES], default=["100 KB", "1 MB"], key="engine_sizes"
+    )
+with ec3:
+    engine_ops = st.slider("Operations per client", min_value=1, max_value=10, value=2, key="engine_ops")
+    engine_storage = st.selectbox(
+        "Object storage", ["Configured backend", "In-memory stand-in"], key="engine_storage",
+        help="The stand-in uses the same-region latency profile and needs no network."
+    )
+    engine_sql = st.checkbox("Include Cloud SQL", value=True, key="engine_sql")
+    engine_pool = st.number_input("DB connections per engine", min_value=1, max_value=200,
+                                  value=POOL_MAX_SIZE, key="engine_pool")
+
+if st.button("Compare Engines", key="run_engine_comparison"):
+    if not engine_levels or not engine_sizes:
+        st.error("Pick at least one concurrency level and one file size.")
+        st.stop()
+
+    progress_bar = st.progress(0, text="Starting comparison...")
+
+    def update_engine_progress(current, total, label):
+        progress_bar.progress(int((current / total) * 100), text=f"[{current}/{total}] {label}")
+
+    # Pulls in asyncio and the optional asyncpg/aiohttp drivers
+    from services.async_service import run_engine_comparison
+
+    try:
+        with st.spinner("Comparing engines — please wait..."):
+            st.session_state["engine_results"] = run_engine_comparison(
+                concurrency_levels=sorted(engine_levels),
+                ops_per_client=engine_ops,
+                sizes=[s for s in BENCHMARK_SIZES if s[0] in engine_sizes],
+                include_sql=engine_sql,
+                storage_backend=(MemoryBackend.from_profile("same-region")
+                                 if engine_storage == "In-memory stand-in" else None),
+                pool_size=int(engine_pool),
+                progress_callback=update_engine_progress,
+            )
+        progress_bar.progress(100, text="Comparison complete.")
+    except Exception as e:
+        st.error(f"Engine comparison failed: {e}")
+
+if "engine_results" in st.session_state:
+    import pandas as pd
+    import plotly.graph_objects as go
+
+    df_eng = pd.DataFrame(st.session_state["engine_results"])
+    st.dataframe(df_eng.drop(columns=["size_bytes"]).rename(columns={
+        "engine":         "Engine",
+        "size_label":     "Size",
+        "concurrency":    "In Flight",
+        "backend":        "Backend",
+        "operation":      "Operation",
+        "ops":            "Ops",
+        "errors":         "Errors",
+        "wall_ms":        "Wall (ms)",
+        "ops_per_s":      "Ops/s",
+        "mb_per_s":       "MB/s",
+        "avg_latency_ms": "Avg Latency (ms)",
+        "p50_latency_ms": "p50 (ms)",
+        "p95_latency_ms": "p95 (ms)",
+        "cpu_ms":         "CPU (ms)",
+        "pool_size":      "DB Pool",
+    }), use_container_width=True, height=300)
+
+    eng_size = st.selectbox("Chart size", df_eng["size_label"].unique().tolist(), key="engine_chart_size")
+    df_e = df_eng[df_eng["size_label"] == eng_size]
+
+    eng_col1, eng_col2 = st.columns(2)
+    for col, metric, title in [
+        (eng_col1, "ops_per_s", "Throughput (ops/s)"),
+        (eng_col2, "cpu_ms", "Process CPU per Step (ms)"),
+    ]:
+        fig = go.Figure()
+        for backend, colour in [("SQL", C_SQL), ("GCS", C_GCS)]:
+            for engine, dash in [("threaded", "dot"), ("asyncio", "solid")]:
+                sel = df_e[(df_e["backend"] == backend) & (df_e["engine"] == engine)]
+                if sel.empty:
+                    continue
+                sel = sel.groupby("concurrency", as_index=False)[metric].mean()
+                fig.add_trace(go.Scatter(
+                    name=f"{'Cloud SQL' if backend == 'SQL' else 'GCS'} — {engine}",
+                    x=sel["concurrency"].tolist(), y=sel[metric].tolist(),
+                    mode="lines+markers", line=dict(color=colour, dash=dash),
+                ))
+        fig.update_layout(xaxis_title="Operations in Flight", yaxis_title=title, height=380, **PLOT_LAYOUT)
+        fig.update_xaxes(type="log")
+        with col:
+            st.plotly_chart(fig, use_container_width=True)
+
+# ── Hedged reads ──────────────────────────────────────────────────────────
+st.subheader("Hedged Reads")
+st.caption(
+    "Reads one file per size from the preferred store alone, then hedged: if the read is slower than "
+    "that store's chosen latency percentile, the other store is raced and the loser cancelled. "
+    "Extra load is the share of reads that sent a second request."
+)
+
+hc1, hc2, hc3 = st.columns(3)
+with hc1:
+    hedge_sizes = st.multiselect(
+        "File sizes", [s[0] for s in BENCHMARK_SIZES], default=["10 KB", "100 KB", "1 MB"], key="hedge_sizes"
+    )
+with hc2:
+    hedge_reads = st.slider("Reads per size", min_value=20, max_value=500, value=100, step=20, key="hedge_reads")
+    hedge_pct = st.select_slider("Hedge after percentile", options=[50, 75, 90, 95, 99], value=95,
+                                 key="hedge_pct")
+with hc3:
+    hedge_preferred = st.selectbox("Preferred store", ["gcs", "sql"], key="hedge_preferred",
+                                   index=["gcs", "sql"].index(HEDGE_PREFERRED),
+                                   format_func=lambda s: "GCS" if s == "gcs" else "Cloud SQL")
+    hedge_storage = st.selectbox(
+        "Object storage", ["Configured backend", "In-memory stand-in"], key="hedge_storage",
+        help="The stand-in uses the cross-region latency profile and needs no object-storage network."
     )
-    st.caption("Two sheets: Raw Results (every individual run) and Averages by Size.")
+
+if st.button("Run Hedged Read Benchmark", key="run_hedge_benchmark"):
+    if not hedge_sizes:
+        st.error("Pick at least one file size.")
+        st.stop()
+
+    progress_bar = st.progress(0, text="Starting hedged reads...")
+
+    def update_hedge_progress(current, total, label):
+        progress_bar.progress(int((current / total) * 100), text=f"[{current}/{total}] {label}")
+
+    try:
+        with st.spinner("Running hedged reads — please wait..."):
+            st.session_state["hedge_results"] = run_hedge_benchmark(
+                reads_per_size=hedge_reads,
+                sizes=[s for s in BENCHMARK_SIZES if s[0] in hedge_sizes],
+                preferred=hedge_preferred,
+                pct=hedge_pct,
+                storage_backend=(MemoryBackend.from_profile("cross-region")
+                                 if hedge_storage == "In-memory stand-in" else None),
+                progress_callback=update_hedge_progress,
+            )
+        progress_bar.progress(100, text="Hedged reads complete.")
+    except Exception as e:
+        st.error(f"Hedged read benchmark failed: {e}")
+
+if "hedge_results" in st.session_state:
+    import pandas as pd
+    import plotly.graph_objects as go
+
+    df_hedge = pd.DataFrame(st.session_state["hedge_results"])
+    st.dataframe(df_hedge.drop(columns=["size_bytes"]).rename(columns={
+        "size_label":          "Size",
+        "preferred":           "Preferred",
+        "reads":               "Reads",
+        "hedge_delay_ms":      "Hedge Delay (ms)",
+        "baseline_p50_ms":     "Baseline p50 (ms)",
+        "baseline_p99_ms":     "Baseline p99 (ms)",
+        "hedged_p50_ms":       "Hedged p50 (ms)",
+        "hedged_p99_ms":       "Hedged p99 (ms)",
+        "p99_improvement_pct": "p99 Improvement (%)",
+        "hedged_reads":        "Second Requests",
+        "extra_load_pct":      "Extra Load (%)",
+        "secondary_wins":      "Won by Other Store",
+        "cancelled":           "Cancelled",
+        "abandoned":           "Abandoned",
+    }), use_container_width=True)
+
+    fig_hedge = go.Figure(data=[
+        go.Bar(name="Baseline p99", x=df_hedge["size_label"].tolist(),
+               y=df_hedge["baseline_p99_ms"].tolist(), marker_color=C_GCS),
+        go.Bar(name="Hedged p99", x=df_hedge["size_label"].tolist(),
+               y=df_hedge["hedged_p99_ms"].tolist(), marker_color=C_SQL),
+    ])
+    fig_hedge.update_layout(barmode="group", xaxis_title="File Size", yaxis_title="p99 Read Latency (ms)",
+                            height=380, **PLOT_LAYOUT)
+    st.plotly_chart(fig_hedge, use_container_width=True)
+
+# ── Connection pooling comparison ────────────────────────────────────────
+st.subheader("Pooled vs Unpooled Connections")
+st.caption(
+    "Runs the Cloud SQL upload, metadata insert and download with and without the shared "
+    "connection pool. Timings include connection setup, so the TLS handshake cost is visible."
+)
+
+if st.button("Compare Pooled vs Unpooled", key="run_pool_comparison"):
+    progress_bar = st.progress(0, text="Starting comparison...")
+
+    def update_pool_progress(current, total, label):
+        progress_bar.progress(int((current / total) * 100), text=f"[{current}/{total}] {label}")
+
+    try:
+        with st.spinner("Comparing connection modes — please wait..."):
+            st.session_state["pool_comparison"] = run_pool_comparison(
+                runs_per_size=runs_per_size,
+                progress_callback=update_pool_progress
+            )
+        progress_bar.progress(100, text="Comparison complete.")
+    except Exception as e:
+        st.error(f"Pool comparison failed: {e}")
+
+if "pool_comparison" in st.session_state:
+    import pandas as pd
+    import plotly.graph_objects as go
+
+    df_pool = pd.DataFrame(st.session_state["pool_comparison"])
+    st.dataframe(df_pool.rename(columns={
+        "size_label":      "Size",
+        "connection_mode": "Connections",
+        "runs":            "Runs",
+        "sql_upload_ms":   "Avg SQL Upload (ms)",
+        "sql_metadata_ms": "Avg Metadata Insert (ms)",
+        "sql_download_ms": "Avg SQL Download (ms)",
+        "pool_hits":       "Pool Hits",
+        "pool_waits":      "Pool Waits",
+        "pool_connects":   "New Connects",
+    }).drop(columns=["size_bytes"]), use_container_width=True)
+
+    pooled   = df_pool[df_pool["connection_mode"] == "pooled"]
+    unpooled = df_pool[df_pool["connection_mode"] == "unpooled"]
+    fig_pool = go.Figure(data=[
+        go.Bar(name="Pooled",   x=pooled["size_label"].tolist(),
+               y=pooled["sql_upload_ms"].tolist(), marker_color=C_SQL),
+        go.Bar(name="Unpooled", x=unpooled["size_label"].tolist(),
+               y=unpooled["sql_upload_ms"].tolist(), marker_color=C_GCS),
+    ])
+    fig_pool.update_layout(barmode="group", xaxis_title="File Size",
+                           yaxis_title="Avg SQL Upload incl. connect (ms)", height=380, **PLOT_LAYOUT)
+    st.plotly_chart(fig_pool, use_container_width=True)
+
+    stats = pool_stats()
+    if stats is not None:
+        st.caption(
+            f"Pool: {stats['size']} open ({stats['in_use']} in use, {stats['idle']} idle, "
+            f"max {stats['max_size']}) — {stats['hits']} hits, {stats['waits']} waits, "
+            f"{stats['connects']} new connects, {stats['recycled']} recycled."
+        )
@@ -0,0 +1,184 @@
+"""
+db/async_queries.py
+
+asyncio counterparts of the db/queries.py helpers used by uploads and the
+benchmark, on an asyncpg connection pool. Needs the optional `asyncpg`
+package; nothing is imported until the pool is first used.
+
+Named phase spans (utils/timer.py) are thread-local and can't tell
+interleaved tasks apart, so these helpers only report total elapsed_ms.
+"""
+
+import asyncio
+import os
+from dotenv import load_dotenv
+from db.search_cache import search_cache
+from storage.download_cache import download_cache
+from utils.compression import decompress
+from utils.timer import TimedBlock
+
+load_dotenv()
+
+# See _SHARED_UPLOAD_STATUS in db/queries.py; $4 is the shared gcs_object_name
+_SHARED_UPLOAD_STATUS = """COALESCE((SELECT upload_status FROM documents
+    WHERE gcs_object_name = $4 AND upload_status <> 'committed' LIMIT 1), 'committed')"""
+
+ASYNC_POOL_MIN_SIZE = int(os.getenv("ASYNC_DB_POOL_MIN", "1"))
+ASYNC_POOL_MAX_SIZE = int(os.getenv("ASYNC_DB_POOL_MAX", "20"))
+
+# An asyncpg pool belongs to the event loop that created it
+_pool = None
+_pool_loop = None
+
+
+async def get_async_pool(max_size=None):
+    """
+    Return the asyncpg pool for the running event loop, creating it on first
+    use with at most `max_size` connections (default ASYNC_DB_POOL_MAX).
+    """
+    global _pool, _pool_loop
+    loop = asyncio.get_running_loop()
+    if _pool is None or _pool_loop is not loop:
+        import asyncpg
+        max_size = max_size or ASYNC_POOL_MAX_SIZE
+        _pool = await asyncpg.create_pool(
+            host=os.getenv("DB_HOST"),
+            port=int(os.getenv("DB_PORT") or 5432),
+            database=os.getenv("DB_NAME"),
+            user=os.getenv("DB_USER"),
+            password=os.getenv("DB_PASS"),
+            ssl=os.getenv("DB_SSLMODE") or None,
+            min_size=min(ASYNC_POOL_MIN_SIZE, max_size),
+            max_size=max_size,
+        )
+        _pool_loop = loop
+    return _pool
+
+
+async def close_async_pool():
+    global _pool, _pool_loop
+    if _pool is not None and _pool_loop is asyncio.get_running_loop():
+        await _pool.close()
+    _pool = _pool_loop = None
+
+
+async def create_student(student_id, name):
+    pool = await get_async_pool()
+    await pool.execute("""
+        INSERT INTO students (student_id, name)
+        VALUES ($1, $2)
+        ON CONFLICT (student_id) DO NOTHING
+    """, student_id, name)
+
+
+async def insert_metadata(student_id, doc_type, filename, path, size, codec="none", stored_size=None,
+                          storage_backend="both", upload_status="committed"):
+    """Async insert_metadata (see db/queries.py)."""
+    pool = await get_async_pool()
+    await pool.execute("""
+        INSERT INTO documents
+        (student_id, doc_type, filename, gcs_object_name, file_size_bytes, codec, stored_size_bytes,
+         storage_backend, upload_status)
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9)
+    """, student_id, doc_type, filename, path, size, codec,
+        size if stored_size is None else stored_size, storage_backend, upload_status)
+    search_cache.invalidate_student(student_id)
+
+
+async def insert_blob_timed(student_id, doc_type, filename, file_bytes, content_hash=None,
+                            codec="none", size=None):
+    """Insert blob into SQL and return elapsed_ms (pool checkout excluded)."""
+    pool = await get_async_pool()
+    async with pool.acquire() as conn:
+        with TimedBlock() as t:
+            await conn.execute("""
+                INSERT INTO documents_blob
+                (student_id, doc_type, filename, file_bytes, file_size_bytes,
+                 content_hash, codec, stored_size_bytes)
+                VALUES ($1, $2, $3, $4, $5, $6, $7, $8)
+            """, student_id, doc_type, filename, file_bytes,
+                len(file_bytes) if size is None else size, content_hash, codec, len(file_bytes))
+    return t.elapsed_ms
+
+
+async def delete_blob_row(student_id, filename, content_hash=None):
+    """Async delete_blob_row (see db/queries.py)."""
+    pool = await get_async_pool()
+    await pool.execute("""
+        DELETE FROM documents_blob WHERE ctid = (
+            SELECT ctid FROM documents_blob
+            WHERE student_id=$1 AND filename=$2 AND content_hash IS NOT DISTINCT FROM $3
+            ORDER BY uploaded_at DESC LIMIT 1
+        )
+    """, student_id, filename, content_hash)
+    download_cache.invalidate(("sql", student_id, filename))
+
+
+async def fetch_blob_timed(student_id, filename, content_hash=None):
+    """
+    Fetch a blob by student_id and filename (or content_hash, for
+    deduplicated documents), return (bytes, elapsed_ms); decompression included.
+    """
+    if content_hash is None:
+        where, params = "student_id=$1 AND filename=$2", (student_id, filename)
+    else:
+        where, params = "content_hash=$1", (content_hash,)
+    pool = await get_async_pool()
+    async with pool.acquire() as conn:
+        with TimedBlock() as t:
+            row = await conn.fetchrow(f"SELECT file_bytes, codec FROM documents_blob WHERE {where} LIMIT 1", *params)
+            data = decompress(row["file_bytes"], row["codec"]) if row else None
+    return data, t.elapsed_ms
+
+
+async def attach_existing_content(student_id, doc_type, filename, content_hash):
+    """Async attach_existing_content (see db/queries.py)."""
+    pool = await get_async_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            content = await conn.fetchrow("""
+                UPDATE content_objects SET refcount = refcount + 1
+                WHERE content_hash = $1
+                RETURNING gcs_object_name, file_size_bytes, codec, stored_size_bytes, storage_backend
+            """, content_hash)
+            if content is None:
+                return None
+            upload_status = await conn.fetchval(f"""
+                INSERT INTO documents
+                (student_id, doc_type, filename, gcs_object_name, file_size_bytes,
+                 content_hash, codec, stored_size_bytes, storage_backend, upload_status)
+                VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, {_SHARED_UPLOAD_STATUS})
+                RETURNING upload_status
+            """, student_id, doc_type, filename, content["gcs_object_name"], content["file_size_bytes"],
+                content_hash, content["codec"], content["stored_size_bytes"], content["storage_backend"])
+    search_cache.invalidate_student(student_id)
+    return {**content, "upload_status": upload_status}
+
+
+async def register_content(student_id, doc_type, filename, content_hash, path, size,
+                           codec="none", stored_size=None, storage_backend="both", upload_status="committed"):
+    """Async register_content (see db/queries.py)."""
+    stored_size = size if stored_size is None else stored_size
+    pool = await get_async_pool()
+    async with pool.acquire() as conn:
+        async with conn.transaction():
+            content = dict(await conn.fetchrow("""
+                INSERT INTO content_objects
+                (content_hash, gcs_object_name, file_size_bytes, codec, stored_size_bytes, storage_backend,
+                 refcount)
+                VALUES ($1, $2, $3, $4, $5, $6, 1)
+                ON CONFLICT (content_hash) DO UPDATE SET refcount = content_objects.refcount + 1
+                RETURNING gcs_object_name, codec, stored_size_bytes, storage_backend
+            """, content_hash, path, size, codec, stored_size, storage_backend))
+            kept = content["gcs_object_name"] == path
+            await conn.execute(f"""
+                INSERT INTO documents
+                (student_id, doc_type, filename, gcs_object_name, file_size_bytes,
+                 content_hash, codec, stored_size_bytes, storage_backend, upload_status)
+                VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9,
+                        {"$10" if kept else _SHARED_UPLOAD_STATUS})
+            """, student_id, doc_type, filename, content["gcs_object_name"], size,
+                content_hash, content["codec"], content["stored_size_bytes"], content["storage_backend"],
+                *((upload_status,) if kept else ()))
+    search_cache.invalidate_student(student_id)
+    return content
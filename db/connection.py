@@ -1,11 +1,26 @@
 import os
+import time
+import threading
+from contextlib import contextmanager
 import psycopg2
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_UNKNOWN
 from psycopg2.extras import RealDictCursor
+from psycopg2.pool import PoolError
 from dotenv import load_dotenv
 
 load_dotenv()
 
-def get_conn():
+# Pool settings (all optional, see README → Environment Setup)
+POOL_ENABLED = os.getenv("DB_POOL_ENABLED", "true").lower() not in ("0", "false", "no")
+POOL_MIN_SIZE = int(os.getenv("DB_POOL_MIN", "1"))
+POOL_MAX_SIZE = int(os.getenv("DB_POOL_MAX", "10"))
+POOL_TIMEOUT_S = float(os.getenv("DB_POOL_TIMEOUT", "30"))         # max wait for a free connection
+POOL_IDLE_RECYCLE_S = float(os.getenv("DB_POOL_IDLE_RECYCLE", "300"))  # close connections idle longer than this
+POOL_PING_AFTER_S = float(os.getenv("DB_POOL_PING_AFTER", "30"))     # health-check connections idle longer than this
+
+
+def connect():
+    """Open a brand-new (unpooled) connection to Cloud SQL."""
     return psycopg2.connect(
         host=os.getenv("DB_HOST"),
         port=os.getenv("DB_PORT"),
@@ -15,3 +30,310 @@ def get_conn():
         sslmode=os.getenv("DB_SSLMODE"),
         cursor_factory=RealDictCursor,
     )
+
+
+class PooledConnection:
+    """
+    Thin proxy around a psycopg2 connection.
+    Behaves like the real connection, except close() hands it back to the pool.
+    """
+
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def close(self):
+        if self._conn is not None:
+            self._pool.release(self._conn)
+            self._conn = None
+
+    def discard(self):
+        """Close the underlying connection instead of returning it to the pool."""
+        if self._conn is not None:
+            self._pool.release(self._conn, discard=True)
+            self._conn = None
+
+
+class ConnectionPool:
+    """
+    Thread-safe PostgreSQL connection pool.
+
+    - Keeps between min_size and max_size connections open; warm() opens
+      the first min_size up front (get_pool() does this on creation).
+    - Checkout waits (up to timeout_s) when every connection is in use.
+    - Connections idle longer than ping_after_s are health-checked with SELECT 1.
+    - Connections idle longer than idle_recycle_s are closed (down to min_size).
+    """
+
+    def __init__(self, min_size=POOL_MIN_SIZE, max_size=POOL_MAX_SIZE,
+                 timeout_s=POOL_TIMEOUT_S, idle_recycle_s=POOL_IDLE_RECYCLE_S,
+                 ping_after_s=POOL_PING_AFTER_S, connect_fn=connect):
+        if max_size < 1 or min_size > max_size:
+            raise ValueError("Pool sizes must satisfy 0 <= min_size <= max_size, max_size >= 1")
+        self.min_size = min_size
+        self.max_size = max_size
+        self.timeout_s = timeout_s
+        self.idle_recycle_s = idle_recycle_s
+        self.ping_after_s = ping_after_s
+        self._connect = connect_fn
+
+        self._cond = threading.Condition()
+        self._idle = []       # stack of (conn, last_used) — most recently used on top
+        self._size = 0        # open connections, idle + checked out
+        self._generation = 0  # bumped by close_all()
+        self._checked_out = {}  # id(conn) -> generation it was handed out in
+        self._counters = {
+            "hits": 0,          # checkout served by an idle connection
+            "waits": 0,         # checkout had to wait for a release
+            "connects": 0,      # new connections opened
+            "recycled": 0,      # idle connections closed by the recycler
+            "failed_checks": 0, # connections discarded by the health check
+        }
+
+    def warm(self):
+        """Open connections until min_size are available, so the first requests skip the handshake."""
+        while True:
+            with self._cond:
+                if self._size >= self.min_size:
+                    return
+                self._size += 1
+            try:
+                conn = self._connect()
+            except Exception:
+                self._discard()
+                raise
+            with self._cond:
+                self._counters["connects"] += 1
+                self._idle.insert(0, (conn, time.monotonic()))
+                self._cond.notify()
+
+    def acquire(self):
+        """Check out a healthy connection, opening a new one if the pool has room."""
+        deadline = time.monotonic() + self.timeout_s
+        waited = False
+
+        while True:
+            with self._cond:
+                self._recycle_idle()
+                while not self._idle and self._size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolError(
+                            f"No connection available within {self.timeout_s}s "
+                            f"(max_size={self.max_size})"
+                        )
+                    if not waited:
+                        waited = True
+                        self._counters["waits"] += 1
+                    self._cond.wait(remaining)
+
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                else:
+                    conn, last_used = None, None
+                    self._size += 1
+
+            if conn is None:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    self._discard()
+                    raise
+                with self._cond:
+                    self._counters["connects"] += 1
+                    self._checked_out[id(conn)] = self._generation
+                return conn
+
+            if self._is_healthy(conn, last_used):
+                with self._cond:
+                    self._counters["hits"] += 1
+                    self._checked_out[id(conn)] = self._generation
+                return conn
+
+            with self._cond:
+                self._counters["failed_checks"] += 1
+            self._discard(conn)
+
+    def release(self, conn, discard=False):
+        """
+        Return a connection to the pool, rolling back any open transaction.
+        Connections checked out before the last close_all() are closed
+        instead, as are those released with discard=True.
+        """
+        with self._cond:
+            generation = self._checked_out.pop(id(conn), None)
+            stale = generation != self._generation
+        if stale or discard:
+            self._discard(conn)
+            return
+        try:
+            status = conn.get_transaction_status() if not conn.closed else TRANSACTION_STATUS_UNKNOWN
+            if status == TRANSACTION_STATUS_UNKNOWN:
+                self._discard(conn)
+                return
+            if status != TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+        except psycopg2.Error:
+            self._discard(conn)
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def close_all(self):
+        """Close every idle connection; checked-out ones are closed when released."""
+        with self._cond:
+            self._generation += 1
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            _quiet_close(conn)
+
+    def stats(self):
+        """Return pool counters plus current size / idle / in-use counts."""
+        with self._cond:
+            return {
+                **self._counters,
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+            }
+
+    def reset_stats(self):
+        with self._cond:
+            for key in self._counters:
+                self._counters[key] = 0
+
+    # ── internals ──────────────────────────────────────────────────────────
+
+    def _is_healthy(self, conn, last_used):
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.ping_after_s:
+            return True
+        try:
+            cur = conn.cursor()
+            cur.execute("SELECT 1")
+            cur.close()
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _discard(self, conn=None):
+        if conn is not None:
+            _quiet_close(conn)
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _recycle_idle(self):
+        """Close connections idle past idle_recycle_s. Caller holds the lock."""
+        now = time.monotonic()
+        keep = []
+        stale = []
+        # Oldest connections sit at the bottom of the stack
+        for conn, last_used in self._idle:
+            excess = self._size - len(stale) > self.min_size
+            if excess and now - last_used > self.idle_recycle_s:
+                stale.append(conn)
+            else:
+                keep.append((conn, last_used))
+        if stale:
+            self._idle = keep
+            self._size -= len(stale)
+            self._counters["recycled"] += len(stale)
+            for conn in stale:
+                _quiet_close(conn)
+
+
+def _quiet_close(conn):
+    try:
+        conn.close()
+    except psycopg2.Error:
+        pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+_pooling = POOL_ENABLED
+_override = threading.local()
+
+
+def get_pool():
+    """Return the process-wide connection pool, creating (and warming) it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                pool = ConnectionPool()
+                pool.warm()
+                _pool = pool
+    return _pool
+
+
+def get_conn():
+    """
+    Return a connection. When pooling is enabled (default) the connection is
+    borrowed from the shared pool and conn.close() returns it; a use_pool()
+    override on this thread always borrows from that pool instead.
+    """
+    pool = getattr(_override, "pool", None)
+    if pool is None:
+        if not pooling_enabled():
+            return connect()
+        pool = get_pool()
+    return PooledConnection(pool, pool.acquire())
+
+
+def set_pooling(enabled):
+    """Turn connection pooling on or off, process-wide, for subsequent get_conn() calls."""
+    global _pooling
+    _pooling = bool(enabled)
+
+
+def pooling_enabled():
+    """Whether get_conn() pools on this thread (a pooling() override, else the process default)."""
+    enabled = getattr(_override, "pooling", None)
+    return _pooling if enabled is None else enabled
+
+
+@contextmanager
+def pooling(enabled):
+    """
+    Enable/disable pooling for this thread only, e.g. for pooled vs unpooled
+    benchmarks, without affecting other sessions' queries.
+    """
+    previous = getattr(_override, "pooling", None)
+    _override.pooling = bool(enabled)
+    try:
+        yield
+    finally:
+        _override.pooling = previous
+
+
+@contextmanager
+def use_pool(pool):
+    """Borrow this thread's get_conn() connections from `pool`, e.g. a benchmark's own pool."""
+    previous = getattr(_override, "pool", None)
+    _override.pool = pool
+    try:
+        yield pool
+    finally:
+        _override.pool = previous
+
+
+def pool_stats():
+    """
+    Counters for the shared pool (hits, waits, connects, ...), or None if
+    nothing has created it yet — asking for stats never opens connections.
+    """
+    pool = _pool
+    return pool.stats() if pool is not None else None
@@ -0,0 +1,28 @@
+-- 001_search_indexes.sql
+-- Indexes for search_documents / search_documents_page (keyset pagination).
+--
+-- Run with psql, which executes each statement in its own transaction
+-- (CREATE INDEX CONCURRENTLY cannot run inside a transaction block):
+--   psql "$DATABASE_URL" -f db/migrations/001_search_indexes.sql
+
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+-- Unfiltered search: ORDER BY uploaded_at DESC, student_id DESC, filename DESC + keyset cursor
+CREATE INDEX CONCURRENTLY IF NOT EXISTS documents_keyset_idx
+    ON documents (uploaded_at DESC, student_id DESC, filename DESC);
+
+-- Student filter (also used by deletes on documents)
+CREATE INDEX CONCURRENTLY IF NOT EXISTS documents_student_keyset_idx
+    ON documents (student_id, uploaded_at DESC, filename DESC);
+
+-- Document type filter
+CREATE INDEX CONCURRENTLY IF NOT EXISTS documents_doc_type_keyset_idx
+    ON documents (doc_type, uploaded_at DESC, student_id DESC, filename DESC);
+
+-- "Filename contains" (ILIKE '%...%')
+CREATE INDEX CONCURRENTLY IF NOT EXISTS documents_filename_trgm_idx
+    ON documents USING gin (filename gin_trgm_ops);
+
+-- Blob lookups and deletes by student_id + filename
+CREATE INDEX CONCURRENTLY IF NOT EXISTS documents_blob_student_filename_idx
+    ON documents_blob (student_id, filename);
@@ -0,0 +1,26 @@
+-- 002_benchmark_history.sql
+-- Persistent benchmark history (services/history_service.py).
+--   psql "$DATABASE_URL" -f db/migrations/002_benchmark_history.sql
+
+-- One row per saved run_benchmark call, with the environment it ran in
+CREATE TABLE IF NOT EXISTS benchmark_runs (
+    run_id        SERIAL PRIMARY KEY,
+    created_at    TIMESTAMP DEFAULT NOW(),
+    label         VARCHAR(200),
+    runs_per_size INTEGER,
+    warmup_runs   INTEGER,
+    fingerprint   JSONB        -- region, instance tier, pool settings, storage backend, git rev, ...
+);
+
+-- Every individual latency sample of a run
+CREATE TABLE IF NOT EXISTS benchmark_samples (
+    run_id     INTEGER REFERENCES benchmark_runs(run_id) ON DELETE CASCADE,
+    size_label VARCHAR(20),
+    size_bytes INTEGER,
+    metric     VARCHAR(50),    -- e.g. sql_upload_ms, gcs_download_ms
+    run        INTEGER,
+    value_ms   DOUBLE PRECISION
+);
+
+CREATE INDEX IF NOT EXISTS benchmark_samples_run_idx
+    ON benchmark_samples (run_id, size_label, metric);
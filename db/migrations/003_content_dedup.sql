@@ -0,0 +1,21 @@
+-- 003_content_dedup.sql
+-- Content-addressed deduplication (services/document_service.py).
+--   psql "$DATABASE_URL" -f db/migrations/003_content_dedup.sql
+
+-- One row per distinct file content (SHA-256), shared by every document with
+-- those bytes. The object is deleted when refcount drops to zero.
+CREATE TABLE IF NOT EXISTS content_objects (
+    content_hash    CHAR(64) PRIMARY KEY,
+    gcs_object_name VARCHAR(500) NOT NULL,
+    file_size_bytes BIGINT,
+    refcount        INTEGER NOT NULL DEFAULT 1,
+    created_at      TIMESTAMP DEFAULT NOW()
+);
+
+-- NULL for documents uploaded before deduplication (they own their objects)
+ALTER TABLE documents      ADD COLUMN IF NOT EXISTS content_hash CHAR(64);
+ALTER TABLE documents_blob ADD COLUMN IF NOT EXISTS content_hash CHAR(64);
+
+-- Freeing a content object deletes its documents_blob rows by hash
+CREATE INDEX CONCURRENTLY IF NOT EXISTS documents_blob_content_hash_idx
+    ON documents_blob (content_hash);
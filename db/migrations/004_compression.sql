@@ -0,0 +1,18 @@
+-- 004_compression.sql
+-- Optional compression of stored bytes (utils/compression.py).
+--   psql "$DATABASE_URL" -f db/migrations/004_compression.sql
+--
+-- file_size_bytes stays the logical (uncompressed) size; stored_size_bytes is
+-- what the object or BYTEA value actually occupies. codec is 'none', 'gzip'
+-- or 'zstd'. Existing rows are uncompressed.
+
+ALTER TABLE documents       ADD COLUMN IF NOT EXISTS codec VARCHAR(10) NOT NULL DEFAULT 'none';
+ALTER TABLE documents       ADD COLUMN IF NOT EXISTS stored_size_bytes BIGINT;
+ALTER TABLE documents_blob  ADD COLUMN IF NOT EXISTS codec VARCHAR(10) NOT NULL DEFAULT 'none';
+ALTER TABLE documents_blob  ADD COLUMN IF NOT EXISTS stored_size_bytes BIGINT;
+ALTER TABLE content_objects ADD COLUMN IF NOT EXISTS codec VARCHAR(10) NOT NULL DEFAULT 'none';
+ALTER TABLE content_objects ADD COLUMN IF NOT EXISTS stored_size_bytes BIGINT;
+
+UPDATE documents       SET stored_size_bytes = file_size_bytes WHERE stored_size_bytes IS NULL;
+UPDATE documents_blob  SET stored_size_bytes = file_size_bytes WHERE stored_size_bytes IS NULL;
+UPDATE content_objects SET stored_size_bytes = file_size_bytes WHERE stored_size_bytes IS NULL;
@@ -0,0 +1,14 @@
+-- 005_placement.sql
+-- Per-document placement (services/placement_service.py).
+--   psql "$DATABASE_URL" -f db/migrations/005_placement.sql
+--
+-- storage_backend says where a document's bytes live: 'sql' (documents_blob
+-- only), 'gcs' (the GCS object only) or 'both'. Existing rows were dual-written.
+-- Documents stored only in Cloud SQL have no GCS object.
+
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS storage_backend VARCHAR(4) NOT NULL DEFAULT 'both'
+    CHECK (storage_backend IN ('sql', 'gcs', 'both'));
+ALTER TABLE content_objects ADD COLUMN IF NOT EXISTS storage_backend VARCHAR(4) NOT NULL DEFAULT 'both'
+    CHECK (storage_backend IN ('sql', 'gcs', 'both'));
+
+ALTER TABLE content_objects ALTER COLUMN gcs_object_name DROP NOT NULL;
@@ -0,0 +1,14 @@
+-- 006_write_behind.sql
+-- Write-behind GCS uploads (services/write_behind_service.py).
+--   psql "$DATABASE_URL" -f db/migrations/006_write_behind.sql
+--
+-- upload_status is 'pending' while a document's GCS object is still in the
+-- local spool, 'committed' once it is in GCS and 'failed' if every retry
+-- failed. Existing rows were uploaded synchronously.
+
+ALTER TABLE documents ADD COLUMN IF NOT EXISTS upload_status VARCHAR(9) NOT NULL DEFAULT 'committed'
+    CHECK (upload_status IN ('pending', 'committed', 'failed'));
+
+-- Committing a drained object looks its documents up by GCS path
+CREATE INDEX CONCURRENTLY IF NOT EXISTS documents_gcs_object_name_idx
+    ON documents (gcs_object_name);
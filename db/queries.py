@@ -1,66 +1,170 @@
-from db.connection import get_conn
+from db.connection import get_conn, PooledConnection
+from db.search_cache import search_cache, search_key, normalize_filters, SEARCH_CACHE_ENABLED
+import time
+import datetime
+import threading
+from contextlib import contextmanager
 import psycopg2
+from psycopg2.extensions import QueryCanceledError
+from psycopg2.extras import execute_values, Json
 from utils.timer import TimedBlock
+from utils.compression import decompress, StreamDecompressor
+from storage.download_cache import download_cache
 
+# Range size used when streaming BYTEA content back out of documents_blob
+BLOB_READ_CHUNK_SIZE = 1024 * 1024
 
-def create_student(student_id, name):
-    conn = get_conn()
-    cur = conn.cursor()
 
-    cur.execute("""
-        INSERT INTO students (student_id, name)
-        VALUES (%s, %s)
-        ON CONFLICT (student_id) DO NOTHING
-    """, (student_id, name))
+# ── Phase spans ─────────────────────────────────────────────────────────────
+# Every helper below reports its phases to an active SpanRecorder:
+#   connect   — pool checkout, or a new TCP/TLS connection when unpooled
+#   serialize — client-side parameter escaping (mogrify), where split out
+#   execute   — send + server execution + receiving the result; psycopg2's
+#               synchronous protocol can't separate these
+#   decode    — typecasting result rows into Python objects
+#   copy      — copying a BYTEA memoryview into bytes
+#   commit    — COMMIT round trip
+
+def _connect():
+    with TimedBlock("connect"):
+        return get_conn()
+
+
+def _execute(cur, query, params=None):
+    with TimedBlock("execute"):
+        cur.execute(query, params)
+
+
+def _commit(conn):
+    with TimedBlock("commit"):
+        conn.commit()
+
+
+def _fetchone(cur):
+    with TimedBlock("decode"):
+        return cur.fetchone()
+
+
+def _fetchall(cur):
+    with TimedBlock("decode"):
+        return cur.fetchall()
+
+
+class QueryCanceller:
+    """
+    Lets another thread cancel a read that is waiting on Cloud SQL, e.g. the
+    losing side of a hedged read (services/hedge_service.py). cancel() sends
+    a cancel request for the running query (connection.cancel()); a read
+    that hasn't reached the server yet fails as soon as it gets there.
+    Either way the read raises QueryCanceledError, and its connection is
+    discarded rather than pooled (see _close).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conn = None
+        self.cancelled = False
+
+    def cancel(self):
+        """Returns True if a query was running and a cancel request was sent."""
+        with self._lock:
+            self.cancelled = True
+            if self._conn is None:
+                return False
+            # Opens a short-lived connection to the server, so call it off the hot path
+            self._conn.cancel()
+            return True
+
+    @contextmanager
+    def running(self, conn):
+        with self._lock:
+            if self.cancelled:
+                raise QueryCanceledError("read cancelled before it started")
+            self._conn = conn
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._conn = None
+
+
+def _blob_where(student_id, filename, content_hash):
+    """
+    WHERE clause and params locating a document's documents_blob row.
+    Deduplicated documents share their content's row, which keeps the first
+    uploader's key, so they are looked up by content_hash instead.
+    """
+    if content_hash is None:
+        return "student_id=%s AND filename=%s", (student_id, filename)
+    return "content_hash=%s", (content_hash,)
+
 
-    conn.commit()
-    cur.close()
-    conn.close()
+@contextmanager
+def _cancellable(conn, canceller):
+    if canceller is None:
+        yield
+        return
+    with canceller.running(conn):
+        yield
 
 
-def insert_metadata(student_id, doc_type, filename, path, size):
-    conn = get_conn()
-    cur = conn.cursor()
+def _close(conn, canceller=None):
+    """
+    Close a connection, or hand it back to the pool. Once a cancel has been
+    issued it is discarded instead: the cancel request can reach the server
+    after the read finished and abort whatever the next borrower runs.
+    """
+    if canceller is not None and canceller.cancelled and isinstance(conn, PooledConnection):
+        conn.discard()
+    else:
+        conn.close()
 
-    cur.execute("""
-        INSERT INTO documents
-        (student_id, doc_type, filename, gcs_object_name, file_size_bytes)
-        VALUES (%s, %s, %s, %s, %s)
-    """, (student_id, doc_type, filename, path, size))
 
-    conn.commit()
-    cur.close()
-    conn.close()
+def create_student(student_id, name):
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        _execute(cur, """
+            INSERT INTO students (student_id, name)
+            VALUES (%s, %s)
+            ON CONFLICT (student_id) DO NOTHING
+        """, (student_id, name))
+        _commit(conn)
+        cur.close()
+    finally:
+        conn.close()
+
+
+def insert_metadata(student_id, doc_type, filename, path, size, codec="none", stored_size=None,
+                    storage_backend="both", upload_status="committed"):
+    """
+    size is the logical file size; stored_size what the (compressed) object
+    occupies. storage_backend — where the bytes live (sql | gcs | both);
+    path is None for documents stored only in Cloud SQL. upload_status is
+    "pending" while the GCS object is still queued for a write-behind upload.
+    """
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        _execute(cur, """
+            INSERT INTO documents
+            (student_id, doc_type, filename, gcs_object_name, file_size_bytes, codec, stored_size_bytes,
+             storage_backend, upload_status)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """, (student_id, doc_type, filename, path, size, codec,
+              size if stored_size is None else stored_size, storage_backend, upload_status))
+        _commit(conn)
+        cur.close()
+    finally:
+        conn.close()
+    search_cache.invalidate_student(student_id)
 
 
 def insert_blob(student_id, doc_type, filename, file_bytes):
-    conn = get_conn()
-    cur = conn.cursor()
-
-    cur.execute("""
-        INSERT INTO documents_blob
-        (student_id, doc_type, filename, file_bytes, file_size_bytes)
-        VALUES (%s, %s, %s, %s, %s)
-    """, (
-        student_id,
-        doc_type,
-        filename,
-        psycopg2.Binary(file_bytes),
-        len(file_bytes)
-    ))
-
-    conn.commit()
-    cur.close()
-    conn.close()
-
-
-def insert_blob_timed(student_id, doc_type, filename, file_bytes):
-    """Insert blob into SQL and return elapsed_ms."""
-    conn = get_conn()
-    cur = conn.cursor()
-
-    with TimedBlock() as t:
-        cur.execute("""
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        _execute(cur, """
             INSERT INTO documents_blob
             (student_id, doc_type, filename, file_bytes, file_size_bytes)
             VALUES (%s, %s, %s, %s, %s)
@@ -71,69 +175,763 @@ def insert_blob_timed(student_id, doc_type, filename, file_bytes):
             psycopg2.Binary(file_bytes),
             len(file_bytes)
         ))
-        conn.commit()
+        _commit(conn)
+        cur.close()
+    finally:
+        conn.close()
+
 
-    cur.close()
-    conn.close()
+def insert_blob_timed(student_id, doc_type, filename, file_bytes, content_hash=None,
+                      codec="none", size=None):
+    """
+    Insert blob into SQL and return elapsed_ms. A row with a content_hash
+    belongs to that content_objects entry rather than to the document.
+    file_bytes are stored as given; for compressed data pass the codec and
+    the logical (uncompressed) size.
+    """
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        with TimedBlock() as t:
+            # Escape the BYTEA client-side first so it shows up as its own phase
+            with TimedBlock("serialize"):
+                query = cur.mogrify("""
+                    INSERT INTO documents_blob
+                    (student_id, doc_type, filename, file_bytes, file_size_bytes,
+                     content_hash, codec, stored_size_bytes)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                """, (
+                    student_id,
+                    doc_type,
+                    filename,
+                    psycopg2.Binary(file_bytes),
+                    len(file_bytes) if size is None else size,
+                    content_hash,
+                    codec,
+                    len(file_bytes)
+                ))
+            _execute(cur, query)
+            _commit(conn)
+        cur.close()
+    finally:
+        conn.close()
     return t.elapsed_ms
 
 
-def fetch_blob_timed(student_id, filename):
-    """Fetch a blob from SQL by student_id and filename, return (bytes, elapsed_ms)."""
-    conn = get_conn()
-    cur = conn.cursor()
+class BlobStreamWriter:
+    """
+    Write a documents_blob row chunk by chunk inside one transaction.
 
-    with TimedBlock() as t:
-        cur.execute(
-            "SELECT file_bytes FROM documents_blob WHERE student_id=%s AND filename=%s LIMIT 1",
-            (student_id, filename)
-        )
-        row = cur.fetchone()
+    Each write() appends the chunk to a temporary large object (lo_write),
+    so only one chunk is held client-side at a time and the server writes
+    every byte once. commit() inserts the row with the large object's
+    content as file_bytes (lo_get) and unlinks it. Nothing is visible to
+    readers until commit().
+
+    Trade-off: the server writes the data twice (large-object pages, then
+    the BYTEA's TOAST chunks, each WAL-logged) and lo_get builds the whole
+    value in backend memory at commit. Both are linear in the file size;
+    appending to the BYTEA with `file_bytes || chunk` instead rewrote the
+    whole value on every chunk, which grows with the square of the size.
+
+    For compressed data, write() the compressed chunks and pass the logical
+    size to commit(); `size` counts the bytes actually stored.
+    """
+
+    def __init__(self, student_id, doc_type, filename, content_hash=None, codec="none"):
+        self._conn = _connect()
+        try:
+            with TimedBlock("execute"):
+                # Created inside the transaction, so a rollback removes it too
+                self._lobject = self._conn.lobject(0, "wb")
+        except Exception:
+            self._conn.close()
+            raise
+        self._row = (student_id, doc_type, filename, content_hash, codec)
+        self.size = 0
+
+    def write(self, chunk):
+        with TimedBlock("execute"):
+            self._lobject.write(chunk)
+        self.size += len(chunk)
 
-    cur.close()
-    conn.close()
+    def commit(self, logical_size=None):
+        student_id, doc_type, filename, content_hash, codec = self._row
+        try:
+            oid = self._lobject.oid
+            self._lobject.close()
+            cur = self._conn.cursor()
+            _execute(cur, """
+                INSERT INTO documents_blob
+                (student_id, doc_type, filename, file_bytes, file_size_bytes,
+                 content_hash, codec, stored_size_bytes)
+                VALUES (%s, %s, %s, lo_get(%s), %s, %s, %s, %s)
+            """, (student_id, doc_type, filename, oid, self.size if logical_size is None else logical_size,
+                  content_hash, codec, self.size))
+            _execute(cur, "SELECT lo_unlink(%s)", (oid,))
+            _commit(self._conn)
+            cur.close()
+        finally:
+            self._conn.close()
+
+    def abort(self):
+        try:
+            self._conn.rollback()
+        finally:
+            self._conn.close()
+
+
+def fetch_blob_timed(student_id, filename, canceller=None, content_hash=None):
+    """
+    Fetch a blob from SQL by student_id and filename (or content_hash, for
+    deduplicated documents), return (bytes, elapsed_ms).
+    Compressed blobs are decompressed; elapsed_ms includes that step.
+    canceller — optional QueryCanceller another thread can abort the read with.
+    """
+    where, params = _blob_where(student_id, filename, content_hash)
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        with TimedBlock() as t:
+            with _cancellable(conn, canceller):
+                _execute(cur, f"SELECT file_bytes, codec FROM documents_blob WHERE {where} LIMIT 1", params)
+                row = _fetchone(cur)
+            if row and row["codec"] != "none":
+                with TimedBlock("decompress"):
+                    data = decompress(row["file_bytes"], row["codec"])
+        cur.close()
+    finally:
+        _close(conn, canceller)
 
     if row:
-        return bytes(row["file_bytes"]), t.elapsed_ms
+        if row["codec"] != "none":
+            return data, t.elapsed_ms
+        with TimedBlock("copy"):
+            data = bytes(row["file_bytes"])
+        return data, t.elapsed_ms
     return None, t.elapsed_ms
 
 
+def fetch_blob_range_timed(student_id, filename, start, end=None, content_hash=None):
+    """
+    Fetch bytes [start, end) of a stored blob (end=None reads to the end)
+    with substring(), so only the range leaves the database. Ranges are over
+    the stored bytes; compressed blobs are not decompressed.
+    Returns (bytes or None if there is no row, codec, elapsed_ms).
+
+    As with iter_blob_chunks, Postgres only avoids detoasting the whole
+    value when file_bytes is stored uncompressed (STORAGE EXTERNAL).
+    """
+    if start < 0 or (end is not None and end < start):
+        raise ValueError(f"Invalid byte range: {start}-{end}")
+    where, params = _blob_where(student_id, filename, content_hash)
+    # substring() is 1-indexed; without a length it reads to the end
+    if end is None:
+        select, range_params = "substring(file_bytes from %s)", (start + 1,)
+    else:
+        select, range_params = "substring(file_bytes from %s for %s)", (start + 1, end - start)
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        with TimedBlock() as t:
+            _execute(cur, f"SELECT {select} AS chunk, codec FROM documents_blob WHERE {where} LIMIT 1",
+                     (*range_params, *params))
+            row = _fetchone(cur)
+            if row:
+                with TimedBlock("copy"):
+                    data = bytes(row["chunk"] or b"")
+        cur.close()
+    finally:
+        conn.close()
+
+    if row is None:
+        return None, None, t.elapsed_ms
+    return data, row["codec"], t.elapsed_ms
+
+
+def fetch_blob_cached(student_id, filename, content_hash=None, canceller=None):
+    """
+    fetch_blob_timed through the process-wide download cache, keyed on the
+    row's uploaded_at. One round trip either way: the query returns the
+    bytes only when the cached uploaded_at no longer matches.
+    content_hash and canceller are as for fetch_blob_timed.
+    Returns (bytes or None, elapsed_ms, miss_ms) like download_file_cached.
+    """
+    key = ("sql", student_id, filename) if content_hash is None else ("sql", content_hash)
+    where, params = _blob_where(student_id, filename, content_hash)
+    cached_at = download_cache.generation(key)
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        with TimedBlock() as t:
+            with _cancellable(conn, canceller):
+                _execute(cur, f"""
+                    SELECT uploaded_at, codec,
+                           CASE WHEN uploaded_at = %s THEN NULL ELSE file_bytes END AS file_bytes
+                    FROM documents_blob WHERE {where} LIMIT 1
+                """, (cached_at, *params))
+                row = _fetchone(cur)
+        cur.close()
+    finally:
+        _close(conn, canceller)
+
+    if row is None:
+        download_cache.invalidate(key)
+        return None, t.elapsed_ms, None
+    if row["file_bytes"] is None:
+        cached = download_cache.get(key, row["uploaded_at"])
+        if cached is None:
+            # Evicted since generation() was checked; read it in full
+            download_cache.invalidate(key)
+            data, elapsed_ms, _ = fetch_blob_cached(student_id, filename, content_hash, canceller)
+            return data, round(t.elapsed_ms + elapsed_ms, 2), None
+        stored, miss_ms = cached
+        elapsed_ms = t.elapsed_ms
+    else:
+        with TimedBlock("copy"):
+            stored = bytes(row["file_bytes"])
+        elapsed_ms, miss_ms = t.elapsed_ms, None
+        download_cache.put(key, row["uploaded_at"], stored, elapsed_ms)
+
+    # The cache keeps the stored (possibly compressed) bytes, as GCS does
+    if row["codec"] != "none":
+        with TimedBlock("decompress") as d:
+            stored = decompress(stored, row["codec"])
+        elapsed_ms = round(elapsed_ms + d.elapsed_ms, 2)
+    return stored, elapsed_ms, miss_ms
+
+
+def iter_blob_chunks(student_id, filename, chunk_size=BLOB_READ_CHUNK_SIZE, content_hash=None):
+    """
+    Yield a documents_blob row's content as chunks, reading `chunk_size`
+    stored bytes at a time with substring() so the whole blob is never held
+    in memory. Yields nothing if the row does not exist. content_hash is as
+    for fetch_blob_timed.
+
+    Uncompressed rows are yielded as copy-free memoryviews of at most
+    `chunk_size` bytes; compressed rows are decompressed as they stream, so
+    their chunks are the decompressed bytes of each range (and may be larger).
+
+    Note: slicing is only cheap when the column is stored uncompressed
+    (ALTER TABLE documents_blob ALTER COLUMN file_bytes SET STORAGE EXTERNAL);
+    otherwise Postgres detoasts the full value for every range.
+    """
+    where, params = _blob_where(student_id, filename, content_hash)
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        _execute(cur,
+            f"SELECT ctid, octet_length(file_bytes) AS size, codec FROM documents_blob WHERE {where} LIMIT 1",
+            params
+        )
+        row = _fetchone(cur)
+        if not row:
+            return
+
+        ctid, size = row["ctid"], row["size"] or 0
+        decompressor = StreamDecompressor(row["codec"])
+        offset = 0
+        while offset < size:
+            # substring() is 1-indexed
+            _execute(cur,
+                "SELECT substring(file_bytes from %s for %s) AS chunk FROM documents_blob WHERE ctid=%s",
+                (offset + 1, chunk_size, ctid)
+            )
+            chunk = _fetchone(cur)["chunk"]
+            if not chunk:
+                break
+            offset += len(chunk)
+            if decompressor.codec == "none":
+                # psycopg2 already returns BYTEA as a memoryview, so this is copy-free
+                yield memoryview(chunk)
+                continue
+            with TimedBlock("decompress"):
+                data = decompressor.decompress(chunk)
+            if data:
+                yield data
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+        cur.close()
+    finally:
+        conn.close()
+
+
+def fetch_blob_streamed_timed(student_id, filename, sink=None, chunk_size=BLOB_READ_CHUNK_SIZE,
+                              content_hash=None):
+    """
+    Stream a blob from SQL through `sink(chunk)` (e.g. a hash's update or a
+    file's write) and return (size_bytes, first_byte_ms, last_byte_ms).
+    Both times are measured from the start of the call. Compressed blobs are
+    decompressed, so size_bytes is the logical size; content_hash is as for
+    fetch_blob_timed.
+    """
+    size = 0
+    first_byte_ms = None
+    start = time.perf_counter()
+
+    for chunk in iter_blob_chunks(student_id, filename, chunk_size, content_hash):
+        if first_byte_ms is None:
+            first_byte_ms = round((time.perf_counter() - start) * 1000, 2)
+        if sink is not None:
+            sink(chunk)
+        size += len(chunk)
+
+    last_byte_ms = round((time.perf_counter() - start) * 1000, 2)
+    return size, first_byte_ms if first_byte_ms is not None else last_byte_ms, last_byte_ms
+
+
 def delete_document_by_filename(student_id, filename):
     """Delete a GCS metadata record by student_id + filename."""
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        "DELETE FROM documents WHERE student_id=%s AND filename=%s",
-        (student_id, filename)
-    )
-    conn.commit()
-    cur.close()
-    conn.close()
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        _execute(cur,
+            "DELETE FROM documents WHERE student_id=%s AND filename=%s",
+            (student_id, filename)
+        )
+        _commit(conn)
+        cur.close()
+    finally:
+        conn.close()
+    search_cache.invalidate_student(student_id)
 
 
 def delete_blob_by_filename(student_id, filename):
     """Delete a SQL blob record by student_id + filename."""
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute(
-        "DELETE FROM documents_blob WHERE student_id=%s AND filename=%s",
-        (student_id, filename)
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        _execute(cur,
+            "DELETE FROM documents_blob WHERE student_id=%s AND filename=%s",
+            (student_id, filename)
+        )
+        _commit(conn)
+        cur.close()
+    finally:
+        conn.close()
+    search_cache.invalidate_student(student_id)
+    download_cache.invalidate(("sql", student_id, filename))
+
+def delete_blob_row(student_id, filename, content_hash=None):
+    """
+    Delete the newest documents_blob row for (student_id, filename,
+    content_hash), e.g. to undo the SQL half of a dual write whose other
+    half failed. Older rows with the same key are kept.
+    """
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        _execute(cur, """
+            DELETE FROM documents_blob WHERE ctid = (
+                SELECT ctid FROM documents_blob
+                WHERE student_id=%s AND filename=%s AND content_hash IS NOT DISTINCT FROM %s
+                ORDER BY uploaded_at DESC LIMIT 1
+            )
+        """, (student_id, filename, content_hash))
+        _commit(conn)
+        cur.close()
+    finally:
+        conn.close()
+    download_cache.invalidate(("sql", student_id, filename))
+
+
+def delete_documents_bulk(keys):
+    """
+    Delete many documents from both tables in ONE transaction.
+
+    keys — iterable of (student_id, filename) pairs.
+    Returns {(student_id, filename): {"metadata_rows", "blob_rows", "gcs_paths"}}
+    with an entry for every requested key (zero counts if nothing matched).
+    gcs_paths only lists objects nothing references any more; deduplicated
+    content still shared with other documents is kept.
+    """
+    keys = list(dict.fromkeys(tuple(k) for k in keys))
+    report = {k: {"metadata_rows": 0, "blob_rows": 0, "gcs_paths": []} for k in keys}
+    if not keys:
+        return report
+
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        # psycopg2 renders a tuple of tuples as a row-constructor list: (('a','b'), ('c','d'))
+        _execute(cur,
+            "DELETE FROM documents WHERE (student_id, filename) IN %s "
+            "RETURNING student_id, filename, gcs_object_name, content_hash",
+            (tuple(keys),)
+        )
+        released_by = {}    # content_hash -> key whose delete drops a reference
+        for row in _fetchall(cur):
+            key = (row["student_id"], row["filename"])
+            report[key]["metadata_rows"] += 1
+            if row["content_hash"] is None:
+                # NULL for documents stored only in Cloud SQL
+                if row["gcs_object_name"]:
+                    report[key]["gcs_paths"].append(row["gcs_object_name"])
+            else:
+                released_by.setdefault(row["content_hash"], []).append(key)
+
+        # Blob rows owned by a document; content-owned rows go with their content below
+        _execute(cur,
+            "DELETE FROM documents_blob WHERE (student_id, filename) IN %s "
+            "AND content_hash IS NULL "
+            "RETURNING student_id, filename",
+            (tuple(keys),)
+        )
+        for row in _fetchall(cur):
+            report[(row["student_id"], row["filename"])]["blob_rows"] += 1
+
+        if released_by:
+            freed = _release_content(cur, {h: len(ks) for h, ks in released_by.items()})
+            for content_hash, (gcs_path, blob_rows) in freed.items():
+                entry = report[released_by[content_hash][0]]
+                if gcs_path:
+                    entry["gcs_paths"].append(gcs_path)
+                entry["blob_rows"] += blob_rows
+
+        _commit(conn)
+        cur.close()
+    finally:
+        conn.close()
+
+    for student_id in {k[0] for k in keys}:
+        search_cache.invalidate_student(student_id)
+    for key in keys:
+        download_cache.invalidate(("sql", *key))
+    return report
+
+
+# ── CONTENT-ADDRESSED STORAGE QUERIES ──────────────────────────────────────
+# Table: db/migrations/003_content_dedup.sql
+#
+# content_objects holds one row per distinct SHA-256 with the GCS object
+# that stores it and how many documents rows point at it. The SQL copy is
+# the documents_blob row(s) carrying the same content_hash.
+
+# upload_status for a document joining an object other documents already point at:
+# theirs, e.g. 'pending' while a write-behind upload of the object is queued
+_SHARED_UPLOAD_STATUS = """COALESCE((SELECT upload_status FROM documents
+    WHERE gcs_object_name = %s AND upload_status <> 'committed' LIMIT 1), 'committed')"""
+
+
+def attach_existing_content(student_id, doc_type, filename, content_hash):
+    """
+    If `content_hash` is already stored, take a reference on it and insert a
+    documents row pointing at the existing object, in one transaction. The
+    row gets the upload_status of the documents already sharing the object.
+    Returns the content_objects row (gcs_object_name, file_size_bytes,
+    codec, stored_size_bytes, storage_backend) plus that upload_status, or
+    None if the content is new.
+    """
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        # The row lock also stops a concurrent delete from freeing the object meanwhile
+        _execute(cur, """
+            UPDATE content_objects SET refcount = refcount + 1
+            WHERE content_hash = %s
+            RETURNING gcs_object_name, file_size_bytes, codec, stored_size_bytes, storage_backend
+        """, (content_hash,))
+        content = _fetchone(cur)
+        if content is None:
+            conn.rollback()
+            cur.close()
+            return None
+        _execute(cur, f"""
+            INSERT INTO documents
+            (student_id, doc_type, filename, gcs_object_name, file_size_bytes,
+             content_hash, codec, stored_size_bytes, storage_backend, upload_status)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, {_SHARED_UPLOAD_STATUS})
+            RETURNING upload_status
+        """, (student_id, doc_type, filename, content["gcs_object_name"], content["file_size_bytes"],
+              content_hash, content["codec"], content["stored_size_bytes"], content["storage_backend"],
+              content["gcs_object_name"]))
+        content = {**content, **_fetchone(cur)}
+        _commit(conn)
+        cur.close()
+    finally:
+        conn.close()
+    search_cache.invalidate_student(student_id)
+    return content
+
+
+def register_content(student_id, doc_type, filename, content_hash, path, size,
+                     codec="none", stored_size=None, storage_backend="both", upload_status="committed"):
+    """
+    Record newly uploaded content and insert its documents row, in one
+    transaction. If another upload registered the same hash first, this one
+    takes a reference on that object instead. Returns the content_objects
+    row the document now points at (gcs_object_name, codec,
+    stored_size_bytes, storage_backend); when its gcs_object_name differs
+    from `path`, the caller's GCS copy is redundant. upload_status is as for
+    insert_metadata and only applies when this upload's object is the one
+    kept; otherwise the row shares the kept object's status.
+    """
+    stored_size = size if stored_size is None else stored_size
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        _execute(cur, """
+            INSERT INTO content_objects
+            (content_hash, gcs_object_name, file_size_bytes, codec, stored_size_bytes, storage_backend, refcount)
+            VALUES (%s, %s, %s, %s, %s, %s, 1)
+            ON CONFLICT (content_hash) DO UPDATE SET refcount = content_objects.refcount + 1
+            RETURNING gcs_object_name, codec, stored_size_bytes, storage_backend
+        """, (content_hash, path, size, codec, stored_size, storage_backend))
+        content = dict(_fetchone(cur))
+        kept = content["gcs_object_name"] == path
+        _execute(cur, f"""
+            INSERT INTO documents
+            (student_id, doc_type, filename, gcs_object_name, file_size_bytes,
+             content_hash, codec, stored_size_bytes, storage_backend, upload_status)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, {"%s" if kept else _SHARED_UPLOAD_STATUS})
+        """, (student_id, doc_type, filename, content["gcs_object_name"], size,
+              content_hash, content["codec"], content["stored_size_bytes"], content["storage_backend"],
+              upload_status if kept else content["gcs_object_name"]))
+        _commit(conn)
+        cur.close()
+    finally:
+        conn.close()
+    search_cache.invalidate_student(student_id)
+    return content
+
+
+def _release_content(cur, counts):
+    """
+    Drop references inside the caller's transaction. counts — {content_hash:
+    references to drop}. Content whose refcount reaches zero is removed along
+    with its documents_blob rows; returns {content_hash: (gcs_object_name,
+    blob_rows)} for those, whose GCS objects the caller should delete.
+    """
+    with TimedBlock("execute"):
+        execute_values(cur, """
+            UPDATE content_objects c SET refcount = c.refcount - v.n
+            FROM (VALUES %s) AS v(content_hash, n)
+            WHERE c.content_hash = v.content_hash
+        """, list(counts.items()))
+    _execute(cur,
+        "DELETE FROM content_objects WHERE content_hash IN %s AND refcount <= 0 "
+        "RETURNING content_hash, gcs_object_name",
+        (tuple(counts),)
     )
-    conn.commit()
-    cur.close()
-    conn.close()
+    freed = {r["content_hash"]: r["gcs_object_name"] for r in _fetchall(cur)}
+    if not freed:
+        return {}
 
-# ── SEARCH & FILTER QUERIES ────────────────────────────────────────────────
+    _execute(cur,
+        "DELETE FROM documents_blob WHERE content_hash IN %s RETURNING content_hash, student_id, filename",
+        (tuple(freed),)
+    )
+    blob_rows = {}
+    for r in _fetchall(cur):
+        blob_rows[r["content_hash"]] = blob_rows.get(r["content_hash"], 0) + 1
+        # Before commit; if the transaction rolls back this only costs a cache miss
+        download_cache.invalidate(("sql", r["student_id"], r["filename"]))
+        download_cache.invalidate(("sql", r["content_hash"]))
+    return {h: (path, blob_rows.get(h, 0)) for h, path in freed.items()}
 
-def search_documents(student_id=None, doc_type=None, filename_query=None,
-                     date_from=None, date_to=None):
+
+def set_upload_status(path, status):
     """
-    Flexible search across the documents table.
-    All filters are optional — only applied when provided.
+    Set upload_status on every document whose GCS object is `path`.
+    Returns how many students' documents reference it (0 means the object
+    is orphaned).
     """
-    conn = get_conn()
-    cur = conn.cursor()
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        # Lock the shared content row first: attach_existing_content holds the same lock while it
+        # copies the status onto a new document, so that document is either seen here or sees this
+        _execute(cur, """
+            SELECT 1 FROM content_objects WHERE content_hash =
+                (SELECT content_hash FROM documents WHERE gcs_object_name=%s LIMIT 1)
+            FOR UPDATE
+        """, (path,))
+        _execute(cur, "UPDATE documents SET upload_status=%s WHERE gcs_object_name=%s RETURNING student_id",
+                 (status, path))
+        students = {r["student_id"] for r in _fetchall(cur)}
+        _commit(conn)
+        cur.close()
+    finally:
+        conn.close()
+    # Cached search pages show the status
+    for student_id in students:
+        search_cache.invalidate_student(student_id)
+    return len(students)
+
+
+def content_stats():
+    """Distinct stored objects vs. documents pointing at them, and the bytes saved."""
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        _execute(cur, """
+            SELECT COUNT(*)                                         AS objects,
+                   COALESCE(SUM(refcount), 0)                       AS document_refs,
+                   COALESCE(SUM((refcount - 1) * file_size_bytes), 0) AS bytes_saved
+            FROM content_objects
+        """)
+        row = _fetchone(cur)
+        cur.close()
+    finally:
+        conn.close()
+    return dict(row)
+
+
+# ── BULK INGEST QUERIES ─────────────────────────────────────────────────────
+
+def upsert_students(students):
+    """Insert many (student_id, name) pairs in one statement, skipping existing IDs."""
+    students = list({sid: (sid, name) for sid, name in students}.values())
+    if not students:
+        return
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        with TimedBlock("execute"):
+            execute_values(cur, """
+                INSERT INTO students (student_id, name)
+                VALUES %s
+                ON CONFLICT (student_id) DO NOTHING
+            """, students)
+        _commit(conn)
+        cur.close()
+    finally:
+        conn.close()
+
+
+def insert_blobs_many(rows, metadata_rows=()):
+    """
+    Multi-row insert into documents_blob in one statement.
+    rows — (student_id, doc_type, filename, file_bytes) tuples; callers
+    should batch by total size since the whole statement is built in memory.
+    metadata_rows — (student_id, doc_type, filename, gcs_object_name,
+    file_size_bytes) documents rows inserted in the same transaction, so the
+    batch is stored whole or not at all.
+    Returns elapsed_ms.
+    """
+    metadata_rows = list(metadata_rows)
+    rows = [
+        (sid, doc_type, filename, psycopg2.Binary(data), len(data))
+        for sid, doc_type, filename, data in rows
+    ]
+    if not rows:
+        return 0.0
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        with TimedBlock() as t:
+            with TimedBlock("execute"):
+                execute_values(cur, """
+                    INSERT INTO documents_blob
+                    (student_id, doc_type, filename, file_bytes, file_size_bytes)
+                    VALUES %s
+                """, rows, page_size=len(rows))
+                if metadata_rows:
+                    execute_values(cur, """
+                        INSERT INTO documents
+                        (student_id, doc_type, filename, gcs_object_name, file_size_bytes)
+                        VALUES %s
+                    """, metadata_rows, page_size=500)
+            _commit(conn)
+        cur.close()
+    finally:
+        conn.close()
+    for student_id in {r[0] for r in metadata_rows}:
+        search_cache.invalidate_student(student_id)
+    return t.elapsed_ms
 
+
+# ── BENCHMARK HISTORY QUERIES ──────────────────────────────────────────────
+# Tables: db/migrations/002_benchmark_history.sql
+
+def insert_benchmark_run(label, runs_per_size, warmup_runs, fingerprint, samples):
+    """
+    Save one benchmark run and its samples in a single transaction.
+    samples — (size_label, size_bytes, metric, run, value_ms) tuples.
+    Returns the new run_id.
+    """
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        _execute(cur, """
+            INSERT INTO benchmark_runs (label, runs_per_size, warmup_runs, fingerprint)
+            VALUES (%s, %s, %s, %s)
+            RETURNING run_id
+        """, (label, runs_per_size, warmup_runs, Json(fingerprint)))
+        run_id = _fetchone(cur)["run_id"]
+        with TimedBlock("execute"):
+            execute_values(cur, """
+                INSERT INTO benchmark_samples (run_id, size_label, size_bytes, metric, run, value_ms)
+                VALUES %s
+            """, [(run_id, *s) for s in samples], page_size=1000)
+        _commit(conn)
+        cur.close()
+    finally:
+        conn.close()
+    return run_id
+
+
+def list_benchmark_runs(limit=50):
+    """Most recent saved runs first."""
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        _execute(cur, """
+            SELECT run_id, created_at, label, runs_per_size, warmup_runs, fingerprint
+            FROM benchmark_runs
+            ORDER BY run_id DESC
+            LIMIT %s
+        """, (limit,))
+        rows = _fetchall(cur)
+        cur.close()
+    finally:
+        conn.close()
+    return rows
+
+
+def fetch_benchmark_samples(run_id):
+    """All samples of one run: rows of size_label, size_bytes, metric, run, value_ms."""
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        _execute(cur, """
+            SELECT size_label, size_bytes, metric, run, value_ms
+            FROM benchmark_samples
+            WHERE run_id = %s
+        """, (run_id,))
+        rows = _fetchall(cur)
+        cur.close()
+    finally:
+        conn.close()
+    return rows
+
+
+# ── SEARCH & FILTER QUERIES ────────────────────────────────────────────────
+# Indexes backing these queries: db/migrations/001_search_indexes.sql
+
+SEARCH_PAGE_SIZE = 50
+
+_SEARCH_COLUMNS = """
+    SELECT d.student_id || '|' || d.filename AS row_key,
+           d.student_id, s.name AS student_name,
+           d.doc_type, d.filename, d.gcs_object_name,
+           ROUND(d.file_size_bytes / 1024.0, 2) AS size_kb,
+           ROUND(COALESCE(d.stored_size_bytes, d.file_size_bytes) / 1024.0, 2) AS stored_kb,
+           d.codec, d.storage_backend, d.content_hash, d.upload_status,
+           d.uploaded_at
+    FROM documents d
+    JOIN students s ON d.student_id = s.student_id
+"""
+
+
+def _search_conditions(student_id, doc_type, filename_query, date_from, date_to):
+    """
+    Build sargable WHERE conditions for the documents search.
+    Dates become a half-open timestamp range [date_from, date_to + 1 day)
+    so the uploaded_at index can be used; filename matching relies on the
+    pg_trgm index for ILIKE '%...%'.
+    """
     conditions = []
     params = []
 
@@ -146,32 +944,113 @@ def search_documents(student_id=None, doc_type=None, filename_query=None,
         params.append(doc_type)
 
     if filename_query:
+        escaped = filename_query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
         conditions.append("d.filename ILIKE %s")
-        params.append(f"%{filename_query}%")
+        params.append(f"%{escaped}%")
 
     if date_from:
-        conditions.append("DATE(d.uploaded_at) >= %s")
-        params.append(date_from)
+        conditions.append("d.uploaded_at >= %s")
+        params.append(_as_datetime(date_from))
 
     if date_to:
-        conditions.append("DATE(d.uploaded_at) <= %s")
-        params.append(date_to)
+        conditions.append("d.uploaded_at < %s")
+        params.append(_as_datetime(date_to) + datetime.timedelta(days=1))
+
+    return conditions, params
+
+
+def _as_datetime(value):
+    """Midnight at the start of `value` (a date, datetime or ISO date string)."""
+    if isinstance(value, str):
+        value = datetime.date.fromisoformat(value)
+    if isinstance(value, datetime.datetime):
+        value = value.date()
+    return datetime.datetime.combine(value, datetime.time.min)
+
 
+def search_documents(student_id=None, doc_type=None, filename_query=None,
+                     date_from=None, date_to=None):
+    """
+    Flexible search across the documents table.
+    All filters are optional — only applied when provided.
+    Returns every match; use search_documents_page for large result sets.
+    Results are served from search_cache when possible — treat them as read-only.
+    """
+    student_id, doc_type, filename_query = normalize_filters(student_id, doc_type, filename_query)
+    key = search_key(student_id, doc_type, filename_query, date_from, date_to)
+    hit, rows, version = search_cache.get(key) if SEARCH_CACHE_ENABLED else (False, None, None)
+    if hit:
+        return rows
+
+    conditions, params = _search_conditions(
+        student_id, doc_type, filename_query, date_from, date_to
+    )
+    where_clause = ("WHERE " + " AND ".join(conditions)) if conditions else ""
+
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        _execute(cur, f"""
+            {_SEARCH_COLUMNS}
+            {where_clause}
+            ORDER BY d.uploaded_at DESC, d.student_id DESC, d.filename DESC
+        """, params)
+        rows = _fetchall(cur)
+        cur.close()
+    finally:
+        conn.close()
+
+    if SEARCH_CACHE_ENABLED:
+        search_cache.put(key, rows, version)
+    return rows
+
+
+def search_documents_page(student_id=None, doc_type=None, filename_query=None,
+                          date_from=None, date_to=None,
+                          limit=SEARCH_PAGE_SIZE, cursor=None):
+    """
+    One page of search results using keyset pagination on
+    (uploaded_at, student_id, filename), newest first.
+
+    cursor — None for the first page, otherwise the next_cursor returned
+    by the previous call. Returns (rows, next_cursor); next_cursor is None
+    on the last page. Pages are served from search_cache when possible.
+    """
+    student_id, doc_type, filename_query = normalize_filters(student_id, doc_type, filename_query)
+    key = search_key(student_id, doc_type, filename_query, date_from, date_to, limit, cursor)
+    hit, page, version = search_cache.get(key) if SEARCH_CACHE_ENABLED else (False, None, None)
+    if hit:
+        return page
+
+    conditions, params = _search_conditions(
+        student_id, doc_type, filename_query, date_from, date_to
+    )
+    if cursor:
+        conditions.append("(d.uploaded_at, d.student_id, d.filename) < (%s, %s, %s)")
+        params.extend(cursor)
     where_clause = ("WHERE " + " AND ".join(conditions)) if conditions else ""
 
-    cur.execute(f"""
-        SELECT d.student_id || '|' || d.filename AS row_key,
-               d.student_id, s.name AS student_name,
-               d.doc_type, d.filename, d.gcs_object_name,
-               ROUND(d.file_size_bytes / 1024.0, 2) AS size_kb,
-               d.uploaded_at
-        FROM documents d
-        JOIN students s ON d.student_id = s.student_id
-        {where_clause}
-        ORDER BY d.uploaded_at DESC
-    """, params)
-
-    rows = cur.fetchall()
-    cur.close()
-    conn.close()
-    return rows
\ No newline at end of file
+    conn = _connect()
+    try:
+        cur = conn.cursor()
+        # Fetch one extra row to learn whether another page exists
+        _execute(cur, f"""
+            {_SEARCH_COLUMNS}
+            {where_clause}
+            ORDER BY d.uploaded_at DESC, d.student_id DESC, d.filename DESC
+            LIMIT %s
+        """, params + [limit + 1])
+        rows = _fetchall(cur)
+        cur.close()
+    finally:
+        conn.close()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = (last["uploaded_at"], last["student_id"], last["filename"])
+
+    if SEARCH_CACHE_ENABLED:
+        search_cache.put(key, (rows, next_cursor), version)
+    return rows, next_cursor
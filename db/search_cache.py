@@ -0,0 +1,111 @@
+import os
+import time
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SEARCH_CACHE_ENABLED = os.getenv("SEARCH_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+SEARCH_CACHE_SIZE = int(os.getenv("SEARCH_CACHE_SIZE", "256"))     # max cached result pages
+SEARCH_CACHE_TTL_S = float(os.getenv("SEARCH_CACHE_TTL", "60"))     # seconds before an entry expires
+
+
+def normalize_filters(student_id, doc_type, filename_query):
+    """
+    Canonical (student_id, doc_type, filename_query). The search helpers
+    build both the cache key and the SQL from these, so equal keys always
+    mean equal results.
+    """
+    student_id = (student_id or "").strip() or None
+    doc_type = None if not doc_type or doc_type == "All" else doc_type
+    # ILIKE is case-insensitive, so "Report" and "report" are the same search
+    filename_query = (filename_query or "").strip().lower() or None
+    return student_id, doc_type, filename_query
+
+
+def search_key(student_id, doc_type, filename_query, date_from, date_to, limit=None, cursor=None):
+    """
+    Normalise search filters into a cache key. The student filter is always
+    the first element, which is what invalidate_student() matches on.
+    """
+    student_id, doc_type, filename_query = normalize_filters(student_id, doc_type, filename_query)
+    return (
+        student_id, doc_type, filename_query,
+        str(date_from) if date_from else None,
+        str(date_to) if date_to else None,
+        limit,
+        tuple(str(part) for part in cursor) if cursor else None,
+    )
+
+
+class SearchCache:
+    """
+    Thread-safe LRU cache of search results with a TTL.
+
+    Entries are dropped when a write touches a student they could contain:
+    searches filtered on that student and searches with no student filter.
+    """
+
+    def __init__(self, max_entries=SEARCH_CACHE_SIZE, ttl_s=SEARCH_CACHE_TTL_S):
+        self.max_entries = max_entries
+        self.ttl_s = ttl_s
+        self._entries = OrderedDict()   # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        # Bumped on every invalidation so a search that raced a write can't cache stale rows
+        self._version = 0
+        self._counters = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0, "invalidations": 0}
+
+    def get(self, key):
+        """Return (hit, value, version). Pass `version` back to put()."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if time.monotonic() < expires_at:
+                    self._entries.move_to_end(key)
+                    self._counters["hits"] += 1
+                    return True, value, self._version
+                del self._entries[key]
+                self._counters["expirations"] += 1
+            self._counters["misses"] += 1
+            return False, None, self._version
+
+    def put(self, key, value, version):
+        with self._lock:
+            if version != self._version:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl_s, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._counters["evictions"] += 1
+
+    def invalidate_student(self, student_id):
+        """Drop every cached search whose results could include `student_id`."""
+        student_id = (student_id or "").strip() or None
+        with self._lock:
+            self._version += 1
+            stale = [k for k in self._entries if k[0] is None or k[0] == student_id]
+            for k in stale:
+                del self._entries[k]
+            self._counters["invalidations"] += len(stale)
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self._counters["hits"] + self._counters["misses"]
+            return {
+                **self._counters,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl_s": self.ttl_s,
+                "hit_ratio": round(self._counters["hits"] / lookups, 3) if lookups else 0.0,
+            }
+
+
+search_cache = SearchCache()
@@ -0,0 +1,427 @@
+"""
+services/async_service.py
+
+The asyncio I/O engine: counterparts of upload_document_both and
+run_benchmark built on db/async_queries.py (asyncpg) and
+storage/async_backends.py (aiohttp, or the offline stand-ins), plus a
+throughput comparison of this engine against the threaded one.
+
+One event loop on one thread keeps every operation in flight; the only
+limits are the asyncpg pool (ASYNC_DB_POOL_MAX) and the HTTP connection
+limit (ASYNC_HTTP_LIMIT).
+"""
+
+import asyncio
+import hashlib
+import io
+import os
+import time
+from db import async_queries as aq
+from db.connection import ConnectionPool, POOL_MAX_SIZE, use_pool
+from db.queries import create_student, insert_blob_timed, fetch_blob_timed, delete_documents_bulk
+from services.benchmark_service import (
+    BENCHMARK_SIZES, BENCHMARK_STUDENT_ID, BENCHMARK_STUDENT_NAME, ENGINE_CONCURRENCY_LEVELS,
+    _generate_file_bytes, _faster, _run_concurrent,
+)
+from services.document_service import _object_path
+from services.placement_service import choose_placement
+from storage.async_backends import async_backend_for
+from storage.gcs import get_backend, use_backend, delete_files
+from utils.compression import compress_for_storage
+from utils.cost_calculator import estimate_cost
+from utils.stats import percentile, mean
+from utils.timer import TimedBlock
+
+# How long a threaded engine operation may queue for one of the comparison's
+# database connections; asyncpg's acquire() has no limit, so keep this generous
+ENGINE_POOL_TIMEOUT_S = float(os.getenv("ENGINE_POOL_TIMEOUT", "600"))
+
+
+# ── Uploads ─────────────────────────────────────────────────────────────────
+
+async def upload_document_both_async(student_id, name, doc_type, file,
+                                     dedup=True, compress=True, placement=None, storage=None):
+    """
+    asyncio counterpart of upload_document_both. The BYTEA insert and the
+    GCS upload run as two tasks on the event loop rather than on a worker
+    thread; the metadata row is inserted once both have landed, and if
+    anything fails whatever was already written is removed before the error
+    is raised. Returns the same dict.
+
+    placement — as for upload_document_both; None asks the active placement
+    policy. Write-behind isn't available on this engine, so upload_status
+    is "committed" unless deduplicated content is still spooled.
+
+    storage — an async backend from storage/async_backends.py; defaults to
+    the counterpart of the configured backend, closed again afterwards.
+    """
+    own_storage = storage is None
+    storage = storage or async_backend_for(get_backend())
+    try:
+        await aq.create_student(student_id, name)
+
+        file_bytes = file.read()
+        file_size = len(file_bytes)
+        filename = file.name
+        placement = placement or choose_placement(file_size)
+        sql_ms = gcs_ms = 0.0
+        upload_status = "committed"
+
+        with TimedBlock() as total:
+            content_hash = hashlib.sha256(file_bytes).hexdigest() if dedup else None
+            existing = content_hash and await aq.attach_existing_content(
+                student_id, doc_type, filename, content_hash
+            )
+
+            if existing:
+                gcs_path, codec, stored_size, placement = (
+                    existing["gcs_object_name"], existing["codec"], existing["stored_size_bytes"],
+                    existing["storage_backend"],
+                )
+                upload_status = existing["upload_status"]
+            else:
+                stored_bytes, codec = (
+                    compress_for_storage(file_bytes, doc_type) if compress else (file_bytes, "none")
+                )
+                stored_size = len(stored_bytes)
+                path = _object_path(student_id, filename, content_hash)
+
+                async def upload_sql():
+                    if placement == "gcs":
+                        return 0.0
+                    return await aq.insert_blob_timed(student_id, doc_type, filename, stored_bytes,
+                                                      content_hash, codec, file_size)
+
+                async def upload_gcs():
+                    if placement == "sql":
+                        return 0.0
+                    with TimedBlock() as t:
+                        await storage.upload(stored_bytes, path)
+                    return t.elapsed_ms
+
+                # Wait for both tasks even if one fails, as upload_document_both does
+                sql_result, gcs_result = await asyncio.gather(upload_sql(), upload_gcs(), return_exceptions=True)
+                sql_done = placement != "gcs" and not isinstance(sql_result, BaseException)
+                gcs_done = placement != "sql" and not isinstance(gcs_result, BaseException)
+                try:
+                    for outcome in (gcs_result, sql_result):
+                        if isinstance(outcome, BaseException):
+                            raise outcome
+                    sql_ms, gcs_ms = sql_result, gcs_result
+                    # Only now point a metadata row at the stored bytes
+                    gcs_path, codec, stored_size, placement = await _save_metadata_async(
+                        storage, student_id, doc_type, filename, path if gcs_done else None, file_size,
+                        content_hash, codec, stored_size, placement
+                    )
+                except Exception:
+                    await _undo_writes_async(storage, student_id, filename, content_hash,
+                                             path if gcs_done else None, sql_done)
+                    raise
+    finally:
+        if own_storage:
+            await storage.aclose()
+
+    return {
+        "filename": filename,
+        "file_size_bytes": file_size,
+        "sql_upload_ms": sql_ms,
+        "gcs_upload_ms": gcs_ms,
+        "total_ms": total.elapsed_ms,
+        "overlap_saved_ms": round(max(sql_ms + gcs_ms - total.elapsed_ms, 0), 2),
+        "concurrent": True,
+        "gcs_path": gcs_path,
+        "content_hash": content_hash,
+        "deduplicated": bool(existing),
+        "codec": codec,
+        "stored_size_bytes": stored_size,
+        "storage_backend": placement,
+        "upload_status": upload_status,
+    }
+
+
+async def _save_metadata_async(storage, student_id, doc_type, filename, path, size,
+                               content_hash, codec, stored_size, placement):
+    """Async _save_metadata (see services/document_service.py)."""
+    if content_hash is None:
+        await aq.insert_metadata(student_id, doc_type, filename, path, size, codec, stored_size, placement)
+        return path, codec, stored_size, placement
+    content = await aq.register_content(
+        student_id, doc_type, filename, content_hash, path, size, codec, stored_size, placement
+    )
+    if path and content["gcs_object_name"] != path:
+        try:
+            await storage.delete(path)
+        except FileNotFoundError:
+            pass
+    return content["gcs_object_name"], content["codec"], content["stored_size_bytes"], content["storage_backend"]
+
+
+async def _undo_writes_async(storage, student_id, filename, content_hash, gcs_path, blob_written):
+    """Async _undo_writes (see services/document_service.py)."""
+    if gcs_path is not None:
+        try:
+            await storage.delete(gcs_path)
+        except Exception:
+            pass
+    if blob_written:
+        try:
+            await aq.delete_blob_row(student_id, filename, content_hash)
+        except Exception:
+            pass
+
+
+# ── Benchmark ───────────────────────────────────────────────────────────────
+
+async def run_benchmark_async(runs_per_size: int = 3, progress_callback=None,
+                              warmup_runs: int = 1, include_sql: bool = True,
+                              storage_backend=None) -> list[dict]:
+    """
+    asyncio counterpart of run_benchmark, returning rows of the same shape
+    (so summarize_results and results_to_excel work on them). The streamed
+    SQL read, byte-range reads, compression columns and phase spans are not
+    measured.
+    """
+    storage = async_backend_for(storage_backend or get_backend())
+    try:
+        if include_sql:
+            await aq.create_student(BENCHMARK_STUDENT_ID, BENCHMARK_STUDENT_NAME)
+
+        results = []
+        total_ops = len(BENCHMARK_SIZES) * (warmup_runs + runs_per_size)
+        op = 0
+
+        for size_label, size_bytes in BENCHMARK_SIZES:
+            file_bytes = _generate_file_bytes(size_bytes)
+            cost = estimate_cost(size_bytes)
+
+            for run in range(1 - warmup_runs, runs_per_size + 1):
+                op += 1
+                warmup = run < 1
+                if progress_callback:
+                    progress_callback(op, total_ops, f"{size_label} — "
+                                      + (f"warmup {run + warmup_runs}/{warmup_runs}" if warmup
+                                         else f"run {run}/{runs_per_size}"))
+
+                filename = (f"abench_{size_label.replace(' ', '')}_warmup{run + warmup_runs}.bin" if warmup
+                            else f"abench_{size_label.replace(' ', '')}_{run}.bin")
+                timings = await _measure_once_async(storage, size_bytes, file_bytes, filename, include_sql)
+                if warmup:
+                    continue
+
+                results.append({
+                    "size_label": size_label,
+                    "size_bytes": size_bytes,
+                    "size_kb": round(size_bytes / 1024, 2),
+                    "run": run,
+                    **timings,
+                    "sql_stream_first_byte_ms": None,
+                    "sql_stream_last_byte_ms": None,
+                    "sql_range_ms": None,
+                    "gcs_range_ms": None,
+                    "phases": {},
+                    "engine": "asyncio",
+                    "sql_cost_usd": cost["sql_monthly_usd"],
+                    "gcs_cost_usd": cost["gcs_monthly_usd"],
+                    "faster_upload": _faster(timings["sql_upload_ms"], timings["gcs_upload_ms"]),
+                    "faster_download": _faster(timings["sql_download_ms"], timings["gcs_download_ms"]),
+                })
+        return results
+    finally:
+        await storage.aclose()
+        await aq.close_async_pool()
+
+
+async def _measure_once_async(storage, size_bytes, file_bytes, filename, include_sql):
+    gcs_path = f"benchmark/{BENCHMARK_STUDENT_ID}/{filename}"
+    sql_upload_ms = sql_download_ms = None
+
+    if include_sql:
+        sql_upload_ms = await aq.insert_blob_timed(BENCHMARK_STUDENT_ID, "Benchmark", filename, file_bytes)
+
+    with TimedBlock() as t:
+        await storage.upload(file_bytes, gcs_path)
+    gcs_upload_ms = t.elapsed_ms
+
+    if include_sql:
+        await aq.insert_metadata(BENCHMARK_STUDENT_ID, "Benchmark", filename, gcs_path, size_bytes)
+        _, sql_download_ms = await aq.fetch_blob_timed(BENCHMARK_STUDENT_ID, filename)
+
+    with TimedBlock() as t:
+        await storage.download(gcs_path)
+    gcs_download_ms = t.elapsed_ms
+
+    return {
+        "sql_upload_ms": sql_upload_ms,
+        "gcs_upload_ms": gcs_upload_ms,
+        "sql_download_ms": sql_download_ms,
+        "gcs_download_ms": gcs_download_ms,
+    }
+
+
+async def _run_concurrent_async(fn, jobs, concurrency):
+    """
+    Run `await fn(*job)` for every job with at most `concurrency` in flight.
+    Returns (wall_ms, latencies_ms, errors), like _run_concurrent.
+    """
+    slots = asyncio.Semaphore(concurrency)
+
+    async def timed_call(job):
+        async with slots:
+            start = time.perf_counter()
+            await fn(*job)
+            return round((time.perf_counter() - start) * 1000, 2)
+
+    with TimedBlock() as wall:
+        outcomes = await asyncio.gather(*(timed_call(job) for job in jobs), return_exceptions=True)
+    latencies = [o for o in outcomes if not isinstance(o, BaseException)]
+    return wall.elapsed_ms, latencies, len(outcomes) - len(latencies)
+
+
+def run_engine_comparison(concurrency_levels=None, ops_per_client: int = 4, sizes=None,
+                          include_sql: bool = True, storage_backend=None, pool_size=None,
+                          progress_callback=None) -> list[dict]:
+    """
+    Throughput of the threaded engine (one worker thread per client) vs the
+    asyncio engine (one event loop, `level` operations in flight) for the
+    same uploads and downloads. Returns one row per (engine, size,
+    concurrency, backend, operation) with ops/s, MB/s, latency, the process
+    CPU time the step used and the database pool size.
+
+    Both engines get their own pool of `pool_size` database connections
+    (default DB_POOL_MAX), so neither is capped differently and the app's
+    shared pool is left alone; operations beyond that queue for a
+    connection. The blob rows and objects each concurrency level uploads
+    are deleted once its downloads have run.
+
+    sizes — optional subset of BENCHMARK_SIZES (defaults to 100 KB and 1 MB).
+    progress_callback(current, total, label) — optional UI progress hook.
+    """
+    concurrency_levels = concurrency_levels or ENGINE_CONCURRENCY_LEVELS
+    sizes = sizes or [s for s in BENCHMARK_SIZES if s[0] in ("100 KB", "1 MB")]
+    pool_size = pool_size or POOL_MAX_SIZE
+    backend = storage_backend or get_backend()
+    if include_sql:
+        create_student(BENCHMARK_STUDENT_ID, BENCHMARK_STUDENT_NAME)
+
+    def path(filename):
+        return f"benchmark/{BENCHMARK_STUDENT_ID}/{filename}"
+
+    sql_pool = ConnectionPool(min_size=0, max_size=pool_size, timeout_s=ENGINE_POOL_TIMEOUT_S)
+
+    def on_sql_pool(fn):
+        # Worker threads don't inherit use_pool, so each call sets it
+        def call(*args):
+            with use_pool(sql_pool):
+                return fn(*args)
+        return call
+
+    threaded_steps = [
+        ("GCS", "upload", lambda name, data: backend.upload(io.BytesIO(data), path(name))),
+        ("GCS", "download", lambda name: backend.download(path(name))),
+    ]
+    if include_sql:
+        threaded_steps[:0] = [
+            ("SQL", "upload", on_sql_pool(
+                lambda name, data: insert_blob_timed(BENCHMARK_STUDENT_ID, "Benchmark", name, data))),
+            ("SQL", "download", on_sql_pool(lambda name: fetch_blob_timed(BENCHMARK_STUDENT_ID, name))),
+        ]
+
+    total_steps = 2 * len(sizes) * len(concurrency_levels) * len(threaded_steps)
+    progress = {"step": 0}
+
+    def report(engine, size_label, level, backend_name, operation):
+        progress["step"] += 1
+        if progress_callback:
+            progress_callback(progress["step"], total_steps,
+                              f"{engine} — {size_label} — {level} clients — {backend_name} {operation}")
+
+    def names_for(size_label, level, engine):
+        return [f"eng_{engine}_{size_label.replace(' ', '')}_c{level}_{i}.bin"
+                for i in range(level * ops_per_client)]
+
+    def jobs_for(names, operation, file_bytes):
+        return [(n, file_bytes) if operation == "upload" else (n,) for n in names]
+
+    def cleanup(names):
+        """Delete what one concurrency level uploaded, whichever steps got that far."""
+        if include_sql:
+            delete_documents_bulk((BENCHMARK_STUDENT_ID, n) for n in names)
+        with use_backend(backend):
+            delete_files([path(n) for n in names])
+
+    rows = []
+    try:
+        for size_label, size_bytes in sizes:
+            file_bytes = _generate_file_bytes(size_bytes)
+            for level in concurrency_levels:
+                names = names_for(size_label, level, "threaded")
+                try:
+                    for backend_name, operation, fn in threaded_steps:
+                        report("threaded", size_label, level, backend_name, operation)
+                        cpu_start = time.process_time()
+                        outcome = _run_concurrent(fn, jobs_for(names, operation, file_bytes), level)
+                        rows.append(_engine_row("threaded", size_label, size_bytes, level, backend_name,
+                                                operation, outcome, time.process_time() - cpu_start, pool_size))
+                finally:
+                    cleanup(names)
+    finally:
+        sql_pool.close_all()
+
+    async def async_pass():
+        storage = async_backend_for(backend)
+        if include_sql:
+            await aq.get_async_pool(max_size=pool_size)
+        steps = [
+            ("GCS", "upload", lambda name, data: storage.upload(data, path(name))),
+            ("GCS", "download", lambda name: storage.download(path(name))),
+        ]
+        if include_sql:
+            steps[:0] = [
+                ("SQL", "upload", lambda name, data: aq.insert_blob_timed(BENCHMARK_STUDENT_ID, "Benchmark", name, data)),
+                ("SQL", "download", lambda name: aq.fetch_blob_timed(BENCHMARK_STUDENT_ID, name)),
+            ]
+        try:
+            for size_label, size_bytes in sizes:
+                file_bytes = _generate_file_bytes(size_bytes)
+                for level in concurrency_levels:
+                    names = names_for(size_label, level, "asyncio")
+                    try:
+                        for backend_name, operation, fn in steps:
+                            report("asyncio", size_label, level, backend_name, operation)
+                            cpu_start = time.process_time()
+                            outcome = await _run_concurrent_async(fn, jobs_for(names, operation, file_bytes), level)
+                            rows.append(_engine_row("asyncio", size_label, size_bytes, level, backend_name,
+                                                    operation, outcome, time.process_time() - cpu_start, pool_size))
+                    finally:
+                        # Between steps, so the blocking deletes don't skew any measurement
+                        await asyncio.to_thread(cleanup, names)
+        finally:
+            await storage.aclose()
+            await aq.close_async_pool()
+
+    asyncio.run(async_pass())
+    return rows
+
+
+def _engine_row(engine, size_label, size_bytes, level, backend, operation, outcome, cpu_s, pool_size):
+    wall_ms, latencies, errors = outcome
+    ok = len(latencies)
+    wall_s = wall_ms / 1000 if wall_ms else float("inf")
+    return {
+        "engine": engine,
+        "size_label": size_label,
+        "size_bytes": size_bytes,
+        "concurrency": level,
+        "backend": backend,
+        "operation": operation,
+        "ops": ok,
+        "errors": errors,
+        "wall_ms": wall_ms,
+        "ops_per_s": round(ok / wall_s, 2),
+        "mb_per_s": round(ok * size_bytes / (1024 ** 2) / wall_s, 3),
+        "avg_latency_ms": round(mean(latencies), 2),
+        "p50_latency_ms": round(percentile(latencies, 50), 2),
+        "p95_latency_ms": round(percentile(latencies, 95), 2),
+        "cpu_ms": round(cpu_s * 1000, 1),
+        "pool_size": pool_size if backend == "SQL" else None,
+    }
@@ -2,17 +2,23 @@
 services/benchmark_service.py
 
 Generates real test files of various sizes, uploads them to BOTH Cloud SQL
-and GCS, measures actual timings, and returns results ready for Excel export.
+and GCS, measures actual timings, and returns results ready for export
+(services/export_service.py).
 """
 
 import io
 import os
 import random
 import string
+from concurrent.futures import ThreadPoolExecutor
 from db.queries import create_student, insert_metadata, insert_blob_timed
-from db.queries import fetch_blob_timed
-from storage.gcs import upload_file_timed, download_file_timed
+from db.queries import fetch_blob_timed, fetch_blob_streamed_timed, fetch_blob_range_timed
+from db.connection import pooling, get_pool, ConnectionPool, use_pool
+from storage.gcs import upload_file_timed, download_file_timed, download_range_timed, use_backend
 from utils.cost_calculator import estimate_cost
+from utils.timer import TimedBlock, SpanRecorder
+from utils.stats import percentile, mean, summarize
+from utils.compression import compress, decompress, available_codec
 
 # Benchmark student used for all test uploads
 BENCHMARK_STUDENT_ID = "BENCHMARK_TEST"
@@ -31,6 +37,15 @@ BENCHMARK_SIZES = [
     ("5 MB",    5 * 1024 * 1024),
 ]
 
+# Leading bytes read by the range access pattern (a file header / first page preview)
+RANGE_READ_BYTES = int(os.getenv("BENCHMARK_RANGE_BYTES", str(64 * 1024)))
+
+# Client counts for the throughput sweep
+CONCURRENCY_LEVELS = [1, 8, 32, 64]
+
+# Operations in flight for the threaded vs asyncio comparison (services/async_service.py)
+ENGINE_CONCURRENCY_LEVELS = [1, 8, 64, 256]
+
 
 def _generate_file_bytes(size_bytes: int) -> bytes:
     """Generate random bytes to simulate a real file of the given size."""
@@ -40,180 +55,590 @@ def _generate_file_bytes(size_bytes: int) -> bytes:
     return (chunk * repeats)[:size_bytes]
 
 
-def run_benchmark(runs_per_size: int = 3, progress_callback=None) -> list[dict]:
+# Latency columns summarised per size: (result key, display label)
+LATENCY_METRICS = [
+    ("sql_upload_ms",            "SQL Upload"),
+    ("gcs_upload_ms",            "GCS Upload"),
+    ("sql_download_ms",          "SQL Download"),
+    ("gcs_download_ms",          "GCS Download"),
+    ("sql_stream_first_byte_ms", "SQL Stream First Byte"),
+    ("sql_stream_last_byte_ms",  "SQL Stream Last Byte"),
+    ("sql_range_ms",             "SQL Range Read"),
+    ("gcs_range_ms",             "GCS Range Read"),
+    ("sql_upload_compressed_ms",   "SQL Upload (compressed)"),
+    ("gcs_upload_compressed_ms",   "GCS Upload (compressed)"),
+    ("sql_download_compressed_ms", "SQL Download (compressed)"),
+    ("gcs_download_compressed_ms", "GCS Download (compressed)"),
+]
+
+
+def _measure_once(size_label: str, size_bytes: int, file_bytes: bytes, filename: str,
+                  include_sql: bool = True, compression: str = None) -> dict:
+    """
+    Upload then download one file on both backends — in full, and the first
+    RANGE_READ_BYTES as a byte-range read — and return the timings, plus a
+    "phases" dict: per operation, wall/CPU ms for each phase span
+    (connect, serialize, execute, decode, commit, send, fetch, ...).
+    With include_sql=False only object storage is exercised and the SQL
+    timings are None. With a `compression` codec the same round trip is
+    repeated on the compressed bytes (see _measure_compressed).
+    """
+    gcs_path = f"benchmark/{BENCHMARK_STUDENT_ID}/{filename}"
+    phases = {}
+    sql_upload_ms = sql_download_ms = sql_first_byte_ms = sql_last_byte_ms = sql_range_ms = None
+
+    # ── Upload to Cloud SQL ──
+    if include_sql:
+        with SpanRecorder() as rec:
+            sql_upload_ms = insert_blob_timed(
+                BENCHMARK_STUDENT_ID, "Benchmark", filename, file_bytes
+            )
+        phases["sql_upload"] = rec.phases()
+
+    # ── Upload to GCS ──
+    with SpanRecorder() as rec:
+        _, gcs_upload_ms = upload_file_timed(io.BytesIO(file_bytes), gcs_path)
+    phases["gcs_upload"] = rec.phases()
+
+    if include_sql:
+        # Save GCS metadata
+        insert_metadata(
+            BENCHMARK_STUDENT_ID, "Benchmark", filename,
+            gcs_path, size_bytes
+        )
+
+        # ── Download from Cloud SQL ──
+        with SpanRecorder() as rec:
+            _, sql_download_ms = fetch_blob_timed(BENCHMARK_STUDENT_ID, filename)
+        phases["sql_download"] = rec.phases()
+
+        # ── Streamed (ranged) download from Cloud SQL ──
+        _, sql_first_byte_ms, sql_last_byte_ms = fetch_blob_streamed_timed(
+            BENCHMARK_STUDENT_ID, filename
+        )
+
+        # ── Range read from Cloud SQL (substring) ──
+        with SpanRecorder() as rec:
+            _, _, sql_range_ms = fetch_blob_range_timed(BENCHMARK_STUDENT_ID, filename, 0, RANGE_READ_BYTES)
+        phases["sql_range"] = rec.phases()
+
+    # ── Download from GCS ──
+    with SpanRecorder() as rec:
+        _, gcs_download_ms = download_file_timed(gcs_path)
+    phases["gcs_download"] = rec.phases()
+
+    # ── Range read from GCS ──
+    with SpanRecorder() as rec:
+        _, gcs_range_ms = download_range_timed(gcs_path, 0, RANGE_READ_BYTES)
+    phases["gcs_range"] = rec.phases()
+
+    return {
+        "sql_upload_ms": sql_upload_ms,
+        "gcs_upload_ms": gcs_upload_ms,
+        "sql_download_ms": sql_download_ms,
+        "gcs_download_ms": gcs_download_ms,
+        "sql_stream_first_byte_ms": sql_first_byte_ms,
+        "sql_stream_last_byte_ms": sql_last_byte_ms,
+        "sql_range_ms": sql_range_ms,
+        "gcs_range_ms": gcs_range_ms,
+        **_measure_compressed(size_bytes, file_bytes, filename, include_sql, compression),
+        "phases": phases,
+    }
+
+
+def _measure_compressed(size_bytes: int, file_bytes: bytes, filename: str,
+                        include_sql: bool, codec: str = None) -> dict:
+    """
+    Compressed counterpart of _measure_once. Upload timings include
+    compressing the file and download timings include decompressing it, so
+    they compare directly with the raw columns. All None without a codec.
+    """
+    timings = dict.fromkeys([
+        "sql_upload_compressed_ms", "gcs_upload_compressed_ms",
+        "sql_download_compressed_ms", "gcs_download_compressed_ms",
+        "stored_size_bytes", "compression_ratio",
+    ])
+    timings["codec"] = codec or "none"
+    if not codec or codec == "none":
+        return timings
+
+    with TimedBlock() as t:
+        packed = compress(file_bytes, codec)
+    compress_ms = t.elapsed_ms
+    filename = f"{filename}.{codec}"
+    gcs_path = f"benchmark/{BENCHMARK_STUDENT_ID}/{filename}"
+
+    if include_sql:
+        timings["sql_upload_compressed_ms"] = round(compress_ms + insert_blob_timed(
+            BENCHMARK_STUDENT_ID, "Benchmark", filename, packed, codec=codec, size=size_bytes
+        ), 2)
+        # fetch_blob_timed decompresses, and its timing includes that step
+        _, timings["sql_download_compressed_ms"] = fetch_blob_timed(BENCHMARK_STUDENT_ID, filename)
+
+    _, gcs_ms = upload_file_timed(io.BytesIO(packed), gcs_path)
+    timings["gcs_upload_compressed_ms"] = round(compress_ms + gcs_ms, 2)
+    data, gcs_ms = download_file_timed(gcs_path)
+    with TimedBlock() as t:
+        decompress(data, codec)
+    timings["gcs_download_compressed_ms"] = round(gcs_ms + t.elapsed_ms, 2)
+
+    timings["stored_size_bytes"] = len(packed)
+    timings["compression_ratio"] = round(size_bytes / len(packed), 2)
+    return timings
+
+
+def summarize_phases(results: list[dict]) -> list[dict]:
+    """
+    Average wall/CPU ms per (size, operation, phase) across runs, ordered by
+    BENCHMARK_SIZES. Rows: size_label, operation, phase, wall_ms, cpu_ms.
+    """
+    from collections import defaultdict
+    sums = defaultdict(lambda: [0.0, 0.0])
+    runs = defaultdict(int)
+    for r in results:
+        runs[r["size_label"]] += 1
+        for operation, by_phase in r.get("phases", {}).items():
+            for phase, t in by_phase.items():
+                entry = sums[(r["size_label"], operation, phase)]
+                entry[0] += t["wall_ms"]
+                entry[1] += t["cpu_ms"]
+
+    size_order = {label: i for i, (label, _) in enumerate(BENCHMARK_SIZES)}
+    rows = []
+    for (size_label, operation, phase), (wall, cpu) in sorted(
+        sums.items(), key=lambda kv: (size_order.get(kv[0][0], 0), kv[0][1])
+    ):
+        n = runs[size_label]
+        rows.append({
+            "size_label": size_label,
+            "operation": operation,
+            "phase": phase,
+            "wall_ms": round(wall / n, 3),
+            "cpu_ms": round(cpu / n, 3),
+        })
+    return rows
+
+
+def run_benchmark(runs_per_size: int = 3, progress_callback=None,
+                  warmup_runs: int = 1, include_sql: bool = True,
+                  storage_backend=None, compression: str = None) -> list[dict]:
     """
     For each file size in BENCHMARK_SIZES, upload `runs_per_size` times to
     both Cloud SQL and GCS, measure real upload + download times, and return
     a list of result dicts.
 
+    warmup_runs — extra iterations per size run first and discarded, so
+    cold caches and connection setup don't skew the recorded samples.
+    include_sql — False skips Cloud SQL entirely (SQL columns are None).
+    storage_backend — run the object-storage side against this backend
+    (e.g. a MemoryBackend with a latency profile) instead of the default;
+    together with include_sql=False the run needs no network at all.
+    compression — "gzip" or "zstd" to also time every operation on the
+    compressed file, adding *_compressed_ms, stored size and ratio columns.
     progress_callback(current, total, label) — optional UI progress hook.
     """
-    create_student(BENCHMARK_STUDENT_ID, BENCHMARK_STUDENT_NAME)
+    if compression:
+        compression = available_codec(compression)
+    if storage_backend is not None:
+        with use_backend(storage_backend):
+            return run_benchmark(runs_per_size, progress_callback, warmup_runs, include_sql,
+                                 compression=compression)
+
+    if include_sql:
+        create_student(BENCHMARK_STUDENT_ID, BENCHMARK_STUDENT_NAME)
 
     results = []
-    total_ops = len(BENCHMARK_SIZES) * runs_per_size
+    total_ops = len(BENCHMARK_SIZES) * (warmup_runs + runs_per_size)
     op = 0
 
     for size_label, size_bytes in BENCHMARK_SIZES:
-        for run in range(1, runs_per_size + 1):
+        file_bytes = _generate_file_bytes(size_bytes)
+        cost = estimate_cost(size_bytes)
+
+        for warmup in range(1, warmup_runs + 1):
             op += 1
-            filename = f"bench_{size_label.replace(' ', '')}_{run}.bin"
-            gcs_path = f"benchmark/{BENCHMARK_STUDENT_ID}/{filename}"
+            if progress_callback:
+                progress_callback(op, total_ops, f"{size_label} — warmup {warmup}/{warmup_runs}")
+            _measure_once(size_label, size_bytes, file_bytes,
+                          f"bench_{size_label.replace(' ', '')}_warmup{warmup}.bin", include_sql, compression)
 
+        for run in range(1, runs_per_size + 1):
+            op += 1
             if progress_callback:
                 progress_callback(op, total_ops, f"{size_label} — run {run}/{runs_per_size}")
 
-            file_bytes = _generate_file_bytes(size_bytes)
-
-            # ── Upload to Cloud SQL ──
-            sql_upload_ms = insert_blob_timed(
-                BENCHMARK_STUDENT_ID, "Benchmark", filename, file_bytes
-            )
-
-            # ── Upload to GCS ──
-            _, gcs_upload_ms = upload_file_timed(io.BytesIO(file_bytes), gcs_path)
-
-            # Save GCS metadata
-            insert_metadata(
-                BENCHMARK_STUDENT_ID, "Benchmark", filename,
-                gcs_path, size_bytes
-            )
-
-            # ── Download from Cloud SQL ──
-            _, sql_download_ms = fetch_blob_timed(BENCHMARK_STUDENT_ID, filename)
-
-            # ── Download from GCS ──
-            _, gcs_download_ms = download_file_timed(gcs_path)
-
-            # ── Cost ──
-            cost = estimate_cost(size_bytes)
+            filename = f"bench_{size_label.replace(' ', '')}_{run}.bin"
+            timings = _measure_once(size_label, size_bytes, file_bytes, filename, include_sql, compression)
+            stored_cost = estimate_cost(timings["stored_size_bytes"] or size_bytes)
 
             results.append({
                 "size_label": size_label,
                 "size_bytes": size_bytes,
                 "size_kb": round(size_bytes / 1024, 2),
                 "run": run,
-                "sql_upload_ms": sql_upload_ms,
-                "gcs_upload_ms": gcs_upload_ms,
-                "sql_download_ms": sql_download_ms,
-                "gcs_download_ms": gcs_download_ms,
+                **timings,
                 "sql_cost_usd": cost["sql_monthly_usd"],
                 "gcs_cost_usd": cost["gcs_monthly_usd"],
-                "faster_upload": "SQL" if sql_upload_ms < gcs_upload_ms else "GCS",
-                "faster_download": "SQL" if sql_download_ms < gcs_download_ms else "GCS",
+                "sql_cost_compressed_usd": stored_cost["sql_monthly_usd"],
+                "gcs_cost_compressed_usd": stored_cost["gcs_monthly_usd"],
+                "faster_upload": _faster(timings["sql_upload_ms"], timings["gcs_upload_ms"]),
+                "faster_download": _faster(timings["sql_download_ms"], timings["gcs_download_ms"]),
             })
 
     return results
 
 
-def results_to_excel(results: list[dict]) -> bytes:
-    """Convert benchmark results to an Excel file and return as bytes."""
-    import openpyxl
-    from openpyxl.styles import Font, PatternFill, Alignment
+def _faster(sql_ms, gcs_ms):
+    if sql_ms is None:
+        return "GCS"
+    return "SQL" if sql_ms < gcs_ms else "GCS"
 
-    wb = openpyxl.Workbook()
 
-    # ── Sheet 1: Raw Results ──
-    ws_raw = wb.active
-    ws_raw.title = "Raw Results"
+def summarize_results(results: list[dict]) -> list[dict]:
+    """
+    Per-size latency statistics for every metric in LATENCY_METRICS:
+    n, mean, stddev, min/max, p50/p90/p95/p99 and a bootstrap 95% CI of
+    the mean. Rows are ordered by BENCHMARK_SIZES, then metric.
+    """
+    from collections import defaultdict
+    groups = defaultdict(list)
+    for r in results:
+        groups[r["size_label"]].append(r)
 
-    headers = [
-        "Size", "Size (KB)", "Run",
-        "SQL Upload (ms)", "GCS Upload (ms)",
-        "SQL Download (ms)", "GCS Download (ms)",
-        "SQL Cost/mo ($)", "GCS Cost/mo ($)",
-        "Faster Upload", "Faster Download"
-    ]
+    rows = []
+    for size_label, _ in BENCHMARK_SIZES:
+        group = groups.get(size_label)
+        if not group:
+            continue
+        for key, label in LATENCY_METRICS:
+            values = [r[key] for r in group if r.get(key) is not None]
+            if not values:
+                continue
+            rows.append({"size_label": size_label, "metric": key, "metric_label": label,
+                         **summarize(values)})
+    return rows
+
+
+# (output column, result key, how) for summarize_averages; "mean" skips None
+AVERAGE_COLUMNS = [
+    ("avg_sql_upload",   "sql_upload_ms",   "mean"),
+    ("avg_gcs_upload",   "gcs_upload_ms",   "mean"),
+    ("avg_sql_download", "sql_download_ms", "mean"),
+    ("avg_gcs_download", "gcs_download_ms", "mean"),
+    ("avg_sql_first_byte", "sql_stream_first_byte_ms", "mean"),
+    ("avg_sql_last_byte",  "sql_stream_last_byte_ms",  "mean"),
+    ("avg_sql_range", "sql_range_ms", "mean"),
+    ("avg_gcs_range", "gcs_range_ms", "mean"),
+    ("sql_cost", "sql_cost_usd", "first"),
+    ("gcs_cost", "gcs_cost_usd", "first"),
+    ("compression_ratio", "compression_ratio", "mean"),
+    ("avg_sql_upload_compressed",   "sql_upload_compressed_ms",   "mean"),
+    ("avg_gcs_upload_compressed",   "gcs_upload_compressed_ms",   "mean"),
+    ("avg_sql_download_compressed", "sql_download_compressed_ms", "mean"),
+    ("avg_gcs_download_compressed", "gcs_download_compressed_ms", "mean"),
+    ("sql_cost_compressed", "sql_cost_compressed_usd", "first"),
+    ("gcs_cost_compressed", "gcs_cost_compressed_usd", "first"),
+]
 
-    header_fill = PatternFill(start_color="1F4E79", end_color="1F4E79", fill_type="solid")
-    header_font = Font(color="FFFFFF", bold=True)
-
-    for col, h in enumerate(headers, 1):
-        cell = ws_raw.cell(row=1, column=col, value=h)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal="center")
-
-    for row_idx, r in enumerate(results, 2):
-        values = [
-            r["size_label"], r["size_kb"], r["run"],
-            r["sql_upload_ms"], r["gcs_upload_ms"],
-            r["sql_download_ms"], r["gcs_download_ms"],
-            r["sql_cost_usd"], r["gcs_cost_usd"],
-            r["faster_upload"], r["faster_download"],
-        ]
-        for col, val in enumerate(values, 1):
-            ws_raw.cell(row=row_idx, column=col, value=val)
-
-        # Colour faster upload column
-        fu_cell = ws_raw.cell(row=row_idx, column=10)
-        fd_cell = ws_raw.cell(row=row_idx, column=11)
-        for cell in [fu_cell, fd_cell]:
-            if cell.value == "GCS":
-                cell.fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")
-                cell.font = Font(color="276221")
-            else:
-                cell.fill = PatternFill(start_color="FFCCCC", end_color="FFCCCC", fill_type="solid")
-                cell.font = Font(color="9C0006")
-
-    for col in ws_raw.columns:
-        ws_raw.column_dimensions[col[0].column_letter].width = max(
-            len(str(c.value or "")) for c in col
-        ) + 4
-
-    # ── Sheet 2: Averages per size ──
-    ws_avg = wb.create_sheet("Averages by Size")
-
-    avg_headers = [
-        "Size", "Size (KB)",
-        "Avg SQL Upload (ms)", "Avg GCS Upload (ms)",
-        "Avg SQL Download (ms)", "Avg GCS Download (ms)",
-        "SQL Cost/mo ($)", "GCS Cost/mo ($)",
-        "Upload Winner", "Download Winner"
-    ]
-    for col, h in enumerate(avg_headers, 1):
-        cell = ws_avg.cell(row=1, column=col, value=h)
-        cell.fill = header_fill
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal="center")
 
-    # Group by size_label
+def summarize_averages(results: list[dict]) -> list[dict]:
+    """
+    Per-size averages of every column in AVERAGE_COLUMNS plus the upload and
+    download winners, ordered by BENCHMARK_SIZES. Columns that weren't
+    measured (e.g. compressed timings) are None.
+    """
     from collections import defaultdict
     groups = defaultdict(list)
     for r in results:
         groups[r["size_label"]].append(r)
 
-    size_order = [s[0] for s in BENCHMARK_SIZES]
-    for row_idx, size_label in enumerate(size_order, 2):
-        group = groups.get(size_label, [])
+    rows = []
+    for size_label, _ in BENCHMARK_SIZES:
+        group = groups.get(size_label)
         if not group:
             continue
+        row = {"size_label": size_label, "size_kb": group[0]["size_kb"]}
+        for column, key, how in AVERAGE_COLUMNS:
+            values = [r[key] for r in group if r.get(key) is not None]
+            if not values:
+                row[column] = None
+            elif how == "first":
+                row[column] = values[0]
+            else:
+                row[column] = round(mean(values), 3)
+        row["upload_winner"] = _faster(row["avg_sql_upload"], row["avg_gcs_upload"])
+        row["download_winner"] = _faster(row["avg_sql_download"], row["avg_gcs_download"])
+        rows.append(row)
+    return rows
 
-        def avg(key):
-            return round(sum(r[key] for r in group) / len(group), 2)
-
-        avg_sql_up = avg("sql_upload_ms")
-        avg_gcs_up = avg("gcs_upload_ms")
-        avg_sql_dl = avg("sql_download_ms")
-        avg_gcs_dl = avg("gcs_download_ms")
-
-        values = [
-            size_label, group[0]["size_kb"],
-            avg_sql_up, avg_gcs_up,
-            avg_sql_dl, avg_gcs_dl,
-            group[0]["sql_cost_usd"], group[0]["gcs_cost_usd"],
-            "SQL" if avg_sql_up < avg_gcs_up else "GCS",
-            "SQL" if avg_sql_dl < avg_gcs_dl else "GCS",
-        ]
-        for col, val in enumerate(values, 1):
-            ws_avg.cell(row=row_idx, column=col, value=val)
-
-    for col in ws_avg.columns:
-        ws_avg.column_dimensions[col[0].column_letter].width = max(
-            len(str(c.value or "")) for c in col
-        ) + 4
-
-    buf = io.BytesIO()
-    wb.save(buf)
-    buf.seek(0)
-    return buf.read()
+
+def results_digest(results: list[dict]) -> str:
+    """Content hash of a result set, to key cached views derived from it."""
+    import hashlib
+    import json
+    payload = json.dumps(results, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _run_concurrent(fn, jobs, concurrency):
+    """
+    Run fn(*job) for every job on `concurrency` worker threads.
+    Returns (wall_ms, latencies_ms, errors); latency is end-to-end per call.
+    """
+    def timed_call(job):
+        with TimedBlock() as t:
+            fn(*job)
+        return t.elapsed_ms
+
+    latencies, errors = [], 0
+    with TimedBlock() as wall:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            futures = [pool.submit(timed_call, job) for job in jobs]
+            for f in futures:
+                try:
+                    latencies.append(f.result())
+                except Exception:
+                    errors += 1
+    return wall.elapsed_ms, latencies, errors
+
+
+def run_concurrency_benchmark(concurrency_levels=None, ops_per_client: int = 4,
+                              sizes=None, progress_callback=None) -> list[dict]:
+    """
+    Throughput sweep: for each file size and each concurrency level, run
+    `level * ops_per_client` uploads and then downloads against Cloud SQL and
+    GCS from a pool of `level` worker threads. Each level's SQL steps get a
+    connection pool of their own with `level` connections, opened up front,
+    so the numbers measure Cloud SQL rather than waits for the DB_POOL_MAX
+    shared connections.
+
+    Returns one row per (size, concurrency, backend, operation) with aggregate
+    ops/s, MB/s and latency under load.
+
+    sizes — optional subset of BENCHMARK_SIZES (defaults to all of them).
+    progress_callback(current, total, label) — optional UI progress hook.
+    """
+    concurrency_levels = concurrency_levels or CONCURRENCY_LEVELS
+    sizes = sizes or BENCHMARK_SIZES
+    create_student(BENCHMARK_STUDENT_ID, BENCHMARK_STUDENT_NAME)
+
+    level_pool = None
+
+    def sql_upload(filename, file_bytes):
+        # Worker threads don't inherit use_pool, so each call sets it
+        with use_pool(level_pool):
+            insert_blob_timed(BENCHMARK_STUDENT_ID, "Benchmark", filename, file_bytes)
+
+    def gcs_upload(filename, file_bytes):
+        upload_file_timed(io.BytesIO(file_bytes), f"benchmark/{BENCHMARK_STUDENT_ID}/{filename}")
+
+    def sql_download(filename):
+        with use_pool(level_pool):
+            fetch_blob_timed(BENCHMARK_STUDENT_ID, filename)
+
+    def gcs_download(filename):
+        download_file_timed(f"benchmark/{BENCHMARK_STUDENT_ID}/{filename}")
+
+    steps = [
+        ("SQL", "upload", sql_upload),
+        ("GCS", "upload", gcs_upload),
+        ("SQL", "download", sql_download),
+        ("GCS", "download", gcs_download),
+    ]
+
+    results = []
+    total_steps = len(sizes) * len(concurrency_levels) * len(steps)
+    step_no = 0
+
+    for size_label, size_bytes in sizes:
+        file_bytes = _generate_file_bytes(size_bytes)
+
+        for level in concurrency_levels:
+            n_ops = level * ops_per_client
+            filenames = [
+                f"conc_{size_label.replace(' ', '')}_c{level}_{i}.bin" for i in range(n_ops)
+            ]
+
+            level_pool = ConnectionPool(min_size=level, max_size=level)
+
+            try:
+                level_pool.warm()
+                for backend, operation, fn in steps:
+                    step_no += 1
+                    if progress_callback:
+                        progress_callback(
+                            step_no, total_steps,
+                            f"{size_label} — {level} clients — {backend} {operation}"
+                        )
+
+                    if operation == "upload":
+                        jobs = [(name, file_bytes) for name in filenames]
+                    else:
+                        jobs = [(name,) for name in filenames]
+
+                    pool_before = level_pool.stats()["waits"]
+                    wall_ms, latencies, errors = _run_concurrent(fn, jobs, level)
+                    pool_waits = level_pool.stats()["waits"] - pool_before
+
+                    ok = len(latencies)
+                    wall_s = wall_ms / 1000 if wall_ms else float("inf")
+                    results.append({
+                        "size_label": size_label,
+                        "size_bytes": size_bytes,
+                        "concurrency": level,
+                        "backend": backend,
+                        "operation": operation,
+                        "ops": ok,
+                        "errors": errors,
+                        "wall_ms": wall_ms,
+                        "ops_per_s": round(ok / wall_s, 2),
+                        "mb_per_s": round(ok * size_bytes / (1024 ** 2) / wall_s, 3),
+                        "avg_latency_ms": round(mean(latencies), 2),
+                        "p50_latency_ms": round(percentile(latencies, 50), 2),
+                        "p95_latency_ms": round(percentile(latencies, 95), 2),
+                        "max_latency_ms": round(max(latencies), 2) if latencies else 0.0,
+                        "pool_waits": pool_waits if backend == "SQL" else 0,
+                    })
+            finally:
+                level_pool.close_all()
+
+    return results
+
+
+def run_pool_comparison(runs_per_size: int = 3, progress_callback=None) -> list[dict]:
+    """
+    Run the Cloud SQL operations with and without the connection pool and
+    return one row per (size, connection mode).
+
+    Timings here are end-to-end (connection checkout/handshake included),
+    unlike insert_blob_timed / fetch_blob_timed which only time the query.
+
+    progress_callback(current, total, label) — optional UI progress hook.
+    """
+    create_student(BENCHMARK_STUDENT_ID, BENCHMARK_STUDENT_NAME)
+
+    rows = []
+    modes = [("pooled", True), ("unpooled", False)]
+    total_ops = len(BENCHMARK_SIZES) * runs_per_size * len(modes)
+    op = 0
+
+    for size_label, size_bytes in BENCHMARK_SIZES:
+        file_bytes = _generate_file_bytes(size_bytes)
+
+        for mode, enabled in modes:
+            upload_ms, download_ms, metadata_ms = [], [], []
+            stats_before = get_pool().stats()
+
+            with pooling(enabled):
+                for run in range(1, runs_per_size + 1):
+                    op += 1
+                    if progress_callback:
+                        progress_callback(op, total_ops, f"{size_label} — {mode} — run {run}/{runs_per_size}")
+
+                    filename = f"pool_{mode}_{size_label.replace(' ', '')}_{run}.bin"
+
+                    with TimedBlock() as t:
+                        insert_blob_timed(BENCHMARK_STUDENT_ID, "Benchmark", filename, file_bytes)
+                    upload_ms.append(t.elapsed_ms)
+
+                    with TimedBlock() as t:
+                        insert_metadata(
+                            BENCHMARK_STUDENT_ID, "Benchmark", filename,
+                            f"benchmark/{BENCHMARK_STUDENT_ID}/{filename}", size_bytes
+                        )
+                    metadata_ms.append(t.elapsed_ms)
+
+                    with TimedBlock() as t:
+                        fetch_blob_timed(BENCHMARK_STUDENT_ID, filename)
+                    download_ms.append(t.elapsed_ms)
+
+            stats_after = get_pool().stats()
+
+            def avg(values):
+                return round(sum(values) / len(values), 2)
+
+            rows.append({
+                "size_label": size_label,
+                "size_bytes": size_bytes,
+                "connection_mode": mode,
+                "runs": runs_per_size,
+                "sql_upload_ms": avg(upload_ms),
+                "sql_metadata_ms": avg(metadata_ms),
+                "sql_download_ms": avg(download_ms),
+                "pool_hits": stats_after["hits"] - stats_before["hits"],
+                "pool_waits": stats_after["waits"] - stats_before["waits"],
+                "pool_connects": stats_after["connects"] - stats_before["connects"],
+            })
+
+    return rows
+
+
+def main(argv=None):
+    """
+    Offline performance regression run, e.g.
+
+        python -m services.benchmark_service --backend memory --profile same-region --no-sql
+
+    Prints per-size latency percentiles and optionally writes the Excel report.
+    """
+    import argparse
+    from storage.backends import LATENCY_PROFILES, LocalFSBackend, MemoryBackend, backend_from_env
+
+    parser = argparse.ArgumentParser(description="Run the storage benchmark.")
+    parser.add_argument("--backend", choices=["env", "gcs", "local", "memory"], default="memory")
+    parser.add_argument("--profile", choices=sorted(LATENCY_PROFILES), default="same-region",
+                        help="latency/bandwidth profile for --backend memory")
+    parser.add_argument("--local-dir", default="local_storage", help="root for --backend local")
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-sql", action="store_true", help="skip Cloud SQL (no database needed)")
+    parser.add_argument("--compression", choices=["none", "gzip", "zstd"], default="none",
+                        help="also time compressed uploads/downloads with this codec")
+    parser.add_argument("--engine", choices=["threaded", "asyncio"], default="threaded",
+                        help="asyncio uses asyncpg/aiohttp (services/async_service.py)")
+    parser.add_argument("--excel", help="write results to this .xlsx path")
+    parser.add_argument("--csv", help="write raw results to this .csv path")
+    parser.add_argument("--parquet", help="write raw results to this .parquet path (needs pyarrow)")
+    args = parser.parse_args(argv)
+    if args.engine == "asyncio" and args.compression != "none":
+        parser.error("--compression is not supported with --engine asyncio")
+
+    if args.backend == "memory":
+        backend = MemoryBackend.from_profile(args.profile, seed=args.seed)
+    elif args.backend == "local":
+        backend = LocalFSBackend(args.local_dir)
+    elif args.backend == "gcs":
+        from storage.backends import GCSBackend
+        backend = GCSBackend(os.getenv("GCS_BUCKET"))
+    else:
+        backend = backend_from_env()
+
+    if args.engine == "asyncio":
+        import asyncio
+        from services.async_service import run_benchmark_async
+        results = asyncio.run(run_benchmark_async(
+            runs_per_size=args.runs, warmup_runs=args.warmup,
+            include_sql=not args.no_sql, storage_backend=backend,
+        ))
+    else:
+        results = run_benchmark(
+            runs_per_size=args.runs, warmup_runs=args.warmup,
+            include_sql=not args.no_sql, storage_backend=backend,
+            compression=None if args.compression == "none" else args.compression,
+        )
+
+    print(f"{'Size':<8} {'Operation':<26} {'p50':>9} {'p95':>9} {'p99':>9} {'mean':>9}")
+    for row in summarize_results(results):
+        print(f"{row['size_label']:<8} {row['metric_label']:<26} "
+              f"{row['p50']:>9} {row['p95']:>9} {row['p99']:>9} {row['mean']:>9}")
+
+    from services.export_service import export_results
+    for fmt, path in [("excel", args.excel), ("csv", args.csv), ("parquet", args.parquet)]:
+        if path:
+            with open(path, "wb") as f:
+                f.write(export_results(results, fmt))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,37 +1,520 @@
 import io
+import os
+import hashlib
+import secrets
+from concurrent.futures import ThreadPoolExecutor
 from db.queries import create_student, insert_metadata, insert_blob, insert_blob_timed
-from storage.gcs import upload_file_timed
+from db.queries import BlobStreamWriter, delete_documents_bulk, delete_blob_row
+from db.queries import attach_existing_content, register_content, fetch_blob_cached, fetch_blob_range_timed
+from storage.gcs import upload_file_timed, open_upload_stream, delete_files, download_file_cached
+from storage.gcs import download_range_timed
+from storage.gcs import get_backend, use_backend, CONTENT_PREFIX
+from services.placement_service import choose_placement
+from services.hedge_service import hedged_reader, HEDGE_READS, HEDGE_PREFERRED
+from services.write_behind_service import write_behind_queue
+from utils.compression import compress_for_storage, choose_codec, decompress, StreamCompressor
 from utils.timer import TimedBlock
 from utils.cost_calculator import estimate_cost
 
+# Background workers for the SQL half of concurrent dual writes
+_sql_writer = ThreadPoolExecutor(
+    max_workers=int(os.getenv("DUAL_WRITE_WORKERS", "4")),
+    thread_name_prefix="dual-write-sql",
+)
 
-def upload_document_both(student_id, name, doc_type, file):
+# Chunk size for streaming uploads; peak memory per upload is a small multiple of this
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+
+def upload_document_both(student_id, name, doc_type, file, concurrent=True, dedup=True, compress=True,
+                         placement=None, write_behind=False):
     """
     Upload the same file to BOTH Cloud SQL (as BYTEA) and GCS simultaneously.
     Returns a dict with timing and cost info for comparison.
+
+    concurrent=True runs the BYTEA insert on a background worker while the GCS
+    upload runs on the calling thread; both read the same immutable bytes
+    buffer, and the metadata row is inserted once both have landed.
+    concurrent=False runs them one after another, which is useful as a
+    baseline. If any step fails, whatever was already written is removed
+    before the error is raised.
+
+    dedup=True stores content by its SHA-256: if identical bytes are already
+    stored, both transfers are skipped and only a metadata row pointing at
+    the existing object is written (deduplicated=True in the result).
+
+    compress=True applies the per-doc_type compression policy
+    (utils/compression.py) to the bytes sent to both stores; the result
+    reports the codec and stored_size_bytes next to file_size_bytes.
+
+    placement — "sql", "gcs" or "both"; None asks the active placement
+    policy (services/placement_service.py). Only the chosen stores are
+    written, and the result's storage_backend says which. Deduplicated
+    content keeps the placement it was first stored with.
+
+    write_behind=True returns once the GCS bytes are in the local spool
+    (services/write_behind_service.py) instead of waiting for GCS;
+    gcs_upload_ms is then the spool write, and upload_status is "pending"
+    until a background worker has uploaded the object.
     """
     create_student(student_id, name)
 
     file_bytes = file.read()
     file_size = len(file_bytes)
     filename = file.name
+    placement = placement or choose_placement(file_size)
+    sql_ms = gcs_ms = 0.0
+    upload_status = "pending" if write_behind and placement != "sql" else "committed"
+    write_gcs = write_behind_queue.spool_timed if upload_status == "pending" else upload_file_timed
+
+    with TimedBlock() as total:
+        content_hash = _hash_bytes(file_bytes) if dedup else None
+        existing = content_hash and attach_existing_content(student_id, doc_type, filename, content_hash)
+        path = _object_path(student_id, filename, content_hash)
 
-    # --- Upload to Cloud SQL (BYTEA) ---
-    sql_ms = insert_blob_timed(student_id, doc_type, filename, file_bytes)
+        if existing:
+            gcs_path, codec, stored_size, placement = (
+                existing["gcs_object_name"], existing["codec"], existing["stored_size_bytes"],
+                existing["storage_backend"],
+            )
+            upload_status = existing["upload_status"]
+        else:
+            stored_bytes, codec = _compress(file_bytes, doc_type) if compress else (file_bytes, "none")
+            stored_size = len(stored_bytes)
+            blob_args = (student_id, doc_type, filename, stored_bytes, content_hash, codec, file_size)
 
-    # --- Upload to GCS ---
-    path = f"students/{student_id}/{filename}"
-    gcs_path, gcs_ms = upload_file_timed(io.BytesIO(file_bytes), path)
+            sql_done = gcs_done = False
+            try:
+                if concurrent and placement == "both":
+                    # --- Upload to Cloud SQL (BYTEA) in the background ---
+                    sql_future = _sql_writer.submit(insert_blob_timed, *blob_args)
+                    try:
+                        # --- Upload to GCS (or the spool) meanwhile ---
+                        # BytesIO over bytes shares the buffer until written to, so no copy is made
+                        gcs_path, gcs_ms = write_gcs(io.BytesIO(stored_bytes), path)
+                        gcs_done = True
+                    finally:
+                        # Always wait for the SQL write so a GCS failure never leaves it running unobserved
+                        sql_done = sql_future.exception() is None
+                    sql_ms = sql_future.result()
+                else:
+                    gcs_path = None
+                    if placement != "gcs":
+                        sql_ms = insert_blob_timed(*blob_args)
+                        sql_done = True
+                    if placement != "sql":
+                        gcs_path, gcs_ms = write_gcs(io.BytesIO(stored_bytes), path)
+                        gcs_done = True
+                # --- Only now point a metadata row at the stored bytes ---
+                gcs_path, codec, stored_size, placement = _save_metadata(
+                    student_id, doc_type, filename, gcs_path, file_size, content_hash, codec, stored_size,
+                    placement, upload_status,
+                )
+            except Exception:
+                if upload_status == "pending":
+                    write_behind_queue.discard(path)
+                _undo_writes(student_id, filename, content_hash,
+                             path if gcs_done and upload_status == "committed" else None, sql_done)
+                raise
 
-    # --- Save GCS metadata reference ---
-    insert_metadata(student_id, doc_type, filename, gcs_path, file_size)
+            if upload_status == "pending":
+                # Only queue the object if the documents row points at it (see _save_metadata)
+                if gcs_path == path:
+                    write_behind_queue.enqueue(path)
+                else:
+                    write_behind_queue.discard(path)
+                    upload_status = "committed"
 
     return {
         "filename": filename,
         "file_size_bytes": file_size,
         "sql_upload_ms": sql_ms,
         "gcs_upload_ms": gcs_ms,
+        "total_ms": total.elapsed_ms,
+        "overlap_saved_ms": round(max(sql_ms + gcs_ms - total.elapsed_ms, 0), 2),
+        "concurrent": concurrent,
         "gcs_path": gcs_path,
+        "content_hash": content_hash,
+        "deduplicated": bool(existing),
+        "codec": codec,
+        "stored_size_bytes": stored_size,
+        "storage_backend": placement,
+        "upload_status": upload_status,
+    }
+
+
+def upload_document_streaming(student_id, name, doc_type, file, chunk_size=UPLOAD_CHUNK_SIZE,
+                              dedup=True, compress=True, placement=None):
+    """
+    Upload a file to BOTH Cloud SQL and GCS without ever holding it in memory.
+
+    The file is read in `chunk_size` pieces. Each chunk is written to a
+    BlobStreamWriter (one transaction) on a background worker while the same
+    chunk is fed to a resumable GCS upload, and the next chunk is only read once
+    both have taken it — so peak memory stays around a few chunks whatever
+    the file size. Returns the same dict shape as upload_document_both.
+
+    With dedup=True a seekable file is hashed in a first local pass so
+    duplicate content can skip the transfers; non-seekable files are
+    uploaded without deduplication. The pass reads the file twice, but the
+    hash has to be known before the first byte is sent: it names the GCS
+    object (content/<hash>-...), and a duplicate then costs no transfer. With compress=True the policy's codec
+    is applied chunk by chunk (without the "is it worth it" check that
+    upload_document_both makes, since the outcome is only known at the end).
+    placement is as for upload_document_both; without one, a file whose size
+    can't be measured up front is stored in both.
+    """
+    create_student(student_id, name)
+
+    filename = file.name
+    sql_ms = gcs_ms = 0.0
+    chunks = 0
+
+    with TimedBlock() as total:
+        content_hash = _hash_file(file, chunk_size) if dedup and file.seekable() else None
+        existing = content_hash and attach_existing_content(student_id, doc_type, filename, content_hash)
+
+        if existing:
+            path, file_size = existing["gcs_object_name"], existing["file_size_bytes"]
+            codec, stored_size = existing["codec"], existing["stored_size_bytes"]
+            placement = existing["storage_backend"]
+        else:
+            remaining = _remaining_size(file)
+            placement = placement or choose_placement(remaining)
+            path = _object_path(student_id, filename, content_hash) if placement != "sql" else None
+            codec = choose_codec(doc_type, remaining) if compress else "none"
+            sql_ms, gcs_ms, chunks, file_size, stored_size = _stream_to_stores(
+                student_id, doc_type, file, path, chunk_size, content_hash, codec, placement
+            )
+            try:
+                path, codec, stored_size, placement = _save_metadata(
+                    student_id, doc_type, filename, path, file_size, content_hash, codec, stored_size, placement
+                )
+            except Exception:
+                _undo_writes(student_id, filename, content_hash, path, placement != "gcs")
+                raise
+
+    sql_ms, gcs_ms = round(sql_ms, 2), round(gcs_ms, 2)
+    return {
+        "filename": filename,
+        "file_size_bytes": file_size,
+        "sql_upload_ms": sql_ms,
+        "gcs_upload_ms": gcs_ms,
+        "total_ms": total.elapsed_ms,
+        "overlap_saved_ms": round(max(sql_ms + gcs_ms - total.elapsed_ms, 0), 2),
+        "concurrent": True,
+        "chunk_size": chunk_size,
+        "chunks": chunks,
+        "gcs_path": path,
+        "content_hash": content_hash,
+        "deduplicated": bool(existing),
+        "codec": codec,
+        "stored_size_bytes": stored_size,
+        "storage_backend": placement,
     }
-    
 
+
+def _stream_to_stores(student_id, doc_type, file, path, chunk_size, content_hash, codec, placement):
+    """
+    Feed `file` chunk by chunk, compressed with `codec`, to a BlobStreamWriter
+    and/or a GCS upload stream, as `placement` says.
+    Returns (sql_ms, gcs_ms, chunks, size, stored_size).
+    """
+    sql_ms = gcs_ms = 0.0
+    chunks = size = stored_size = 0
+    compressor = StreamCompressor(codec)
+
+    def write_both(data):
+        nonlocal sql_ms, gcs_ms, stored_size
+        stored_size += len(data)
+        if sql_writer is None:
+            gcs_ms += _timed_write(gcs_writer, data)
+            return
+        if gcs_writer is None:
+            sql_ms += _timed_write(sql_writer, data)
+            return
+        sql_future = _sql_writer.submit(_timed_write, sql_writer, data)
+        try:
+            gcs_ms += _timed_write(gcs_writer, data)
+        finally:
+            sql_future.exception()
+        sql_ms += sql_future.result()
+
+    sql_writer = gcs_writer = None
+    if placement != "gcs":
+        sql_writer = BlobStreamWriter(student_id, doc_type, file.name, content_hash, codec)
+    try:
+        if placement != "sql":
+            gcs_writer = open_upload_stream(path, chunk_size)
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            chunks += 1
+            size += len(chunk)
+            # The compressor may buffer a chunk and return nothing yet
+            data = compressor.compress(chunk)
+            if data:
+                write_both(data)
+
+        tail = compressor.flush()
+        if tail:
+            write_both(tail)
+
+        if gcs_writer is not None:
+            with TimedBlock() as t:
+                gcs_writer.close()
+            gcs_ms += t.elapsed_ms
+    except Exception:
+        if sql_writer is not None:
+            sql_writer.abort()
+        if gcs_writer is not None:
+            try:
+                gcs_writer.discard()
+            except Exception:
+                pass
+        raise
+
+    if sql_writer is not None:
+        try:
+            with TimedBlock() as t:
+                sql_writer.commit(logical_size=size)
+        except Exception:
+            _undo_writes(student_id, file.name, content_hash, path if gcs_writer is not None else None, False)
+            raise
+        sql_ms += t.elapsed_ms
+    return sql_ms, gcs_ms, chunks, size, stored_size
+
+
+# ── Content-addressed storage ──────────────────────────────────────────────
+
+def _hash_bytes(data):
+    with TimedBlock("hash"):
+        return hashlib.sha256(data).hexdigest()
+
+
+def _hash_file(file, chunk_size):
+    """SHA-256 of a seekable file read chunk by chunk; the position is restored afterwards."""
+    start = file.tell()
+    digest = hashlib.sha256()
+    with TimedBlock("hash"):
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    file.seek(start)
+    return digest.hexdigest()
+
+
+def _object_path(student_id, filename, content_hash):
+    """
+    GCS path for a new upload. Deduplicated content lives under content/ and
+    gets a random suffix, so an upload that races with the delete of the last
+    reference to the same bytes never writes to the object being deleted.
+    """
+    if content_hash is None:
+        return f"students/{student_id}/{filename}"
+    return f"{CONTENT_PREFIX}{content_hash[:2]}/{content_hash}-{secrets.token_hex(4)}"
+
+
+def _save_metadata(student_id, doc_type, filename, path, size, content_hash, codec, stored_size, placement,
+                   upload_status="committed"):
+    """
+    Insert the documents row. Returns (gcs_path, codec, stored_size,
+    placement) of the content it points at; gcs_path is None for content
+    stored only in Cloud SQL. upload_status="pending" means `path` is only
+    spooled so far, and the caller queues or discards it.
+    """
+    if content_hash is None:
+        insert_metadata(student_id, doc_type, filename, path, size, codec, stored_size, placement, upload_status)
+        return path, codec, stored_size, placement
+    content = register_content(student_id, doc_type, filename, content_hash, path, size, codec, stored_size,
+                               placement, upload_status)
+    if path and content["gcs_object_name"] != path and upload_status == "committed":
+        # A concurrent upload of the same bytes registered first, so our object is
+        # redundant. Our documents_blob row carries the same hash and is freed with it.
+        delete_files([path])
+    return content["gcs_object_name"], content["codec"], content["stored_size_bytes"], content["storage_backend"]
+
+
+def _undo_writes(student_id, filename, content_hash, gcs_path, blob_written):
+    """
+    Best-effort removal of what a failed upload already stored — the GCS
+    object at `gcs_path` (if not None) and the documents_blob row (if
+    blob_written) — so nothing is left that no documents row points at.
+    The caller re-raises the original error.
+    """
+    if gcs_path is not None:
+        try:
+            delete_files([gcs_path])
+        except Exception:
+            pass
+    if blob_written:
+        try:
+            delete_blob_row(student_id, filename, content_hash)
+        except Exception:
+            pass
+
+
+# ── Compression ────────────────────────────────────────────────────────────
+
+def _compress(data, doc_type):
+    with TimedBlock("compress"):
+        return compress_for_storage(data, doc_type)
+
+
+def _remaining_size(file):
+    """Bytes left to read in a seekable file, or None if it can't be measured."""
+    if not file.seekable():
+        return None
+    start = file.tell()
+    end = file.seek(0, io.SEEK_END)
+    file.seek(start)
+    return end - start
+
+
+def download_document(doc, hedge=None):
+    """
+    Fetch a document on demand (through the download cache, with bounded
+    concurrency on a GCS miss) and undo any compression. doc — a search row
+    with gcs_object_name, codec and storage_backend; documents stored only
+    in Cloud SQL are read from documents_blob. Returns (bytes, elapsed_ms,
+    miss_ms), miss_ms being set only on a cache hit (see download_file_cached).
+
+    hedge — for documents stored in both, race the two stores
+    (services/hedge_service.py); defaults to HEDGE_READS. miss_ms is None
+    for hedged reads.
+    """
+    if _read_from_sql(doc):
+        # fetch_blob_cached already decompresses
+        return fetch_blob_cached(doc["student_id"], doc["filename"], doc.get("content_hash"))
+    if doc.get("storage_backend", "both") == "both" and (HEDGE_READS if hedge is None else hedge):
+        return _download_hedged(doc)
+    return _download_gcs(doc)
+
+
+def _read_from_sql(doc):
+    """True for documents whose only readable copy is in Cloud SQL."""
+    storage_backend = doc.get("storage_backend", "both")
+    # A write-behind upload that gave up leaves only the Cloud SQL copy
+    return storage_backend == "sql" or (storage_backend == "both" and doc.get("upload_status") == "failed")
+
+
+def _download_gcs(doc):
+    # Objects a write-behind upload hasn't got into GCS yet are served from the spool
+    with TimedBlock() as t:
+        spooled = write_behind_queue.read_spooled(doc["gcs_object_name"])
+    if spooled is not None:
+        data, elapsed_ms, miss_ms = spooled, t.elapsed_ms, None
+    else:
+        data, elapsed_ms, miss_ms = download_file_cached(doc["gcs_object_name"])
+    codec = doc.get("codec") or "none"
+    if codec != "none":
+        with TimedBlock("decompress") as t:
+            data = decompress(data, codec)
+        elapsed_ms = round(elapsed_ms + t.elapsed_ms, 2)
+    return data, elapsed_ms, miss_ms
+
+
+def _download_hedged(doc):
+    # Reader threads don't inherit a use_backend override
+    backend = get_backend()
+
+    def from_gcs(canceller):
+        with use_backend(backend):
+            return _download_gcs(doc)[0]
+
+    def from_sql(canceller):
+        data, _, _ = fetch_blob_cached(doc["student_id"], doc["filename"], doc.get("content_hash"), canceller)
+        if data is None:
+            raise FileNotFoundError(doc["filename"])
+        return data
+
+    legs = {"gcs": ("gcs", from_gcs), "sql": ("sql", from_sql)}
+    secondary = "sql" if HEDGE_PREFERRED == "gcs" else "gcs"
+    data, elapsed_ms, _, _ = hedged_reader.read(
+        legs[HEDGE_PREFERRED], legs[secondary], round(float(doc.get("size_kb") or 0) * 1024)
+    )
+    return data, elapsed_ms, None
+
+
+def read_document_range(doc, start, end=None):
+    """
+    Bytes [start, end) of a document (end=None reads to the end), e.g. a
+    header or first-page preview, without transferring the whole file: a
+    ranged GET on GCS, or substring() for documents stored only in Cloud SQL
+    (including those whose write-behind upload failed).
+    Compressed documents can't be sliced before decompression, so they are
+    downloaded in full (through the download cache) and then sliced.
+    Returns (bytes, elapsed_ms).
+    """
+    if (doc.get("codec") or "none") != "none":
+        data, elapsed_ms, _ = download_document(doc)
+        return data[start:end], elapsed_ms
+    with TimedBlock() as t:
+        spooled = write_behind_queue.read_spooled(doc.get("gcs_object_name"))
+    if spooled is not None:
+        return spooled[start:end], t.elapsed_ms
+    if _read_from_sql(doc):
+        data, _, elapsed_ms = fetch_blob_range_timed(
+            doc["student_id"], doc["filename"], start, end, doc.get("content_hash")
+        )
+        if data is None:
+            raise FileNotFoundError(doc["filename"])
+        return data, elapsed_ms
+    return download_range_timed(doc["gcs_object_name"], start, end)
+
+
+def delete_documents(docs):
+    """
+    Delete search-result documents from Cloud SQL (both tables, one
+    transaction) and then from GCS (concurrent deletes).
+
+    docs — dicts with student_id, filename and gcs_object_name.
+    Returns one report dict per doc: row_key, filename, sql_deleted,
+    gcs_deleted, error.
+    """
+    with TimedBlock() as t:
+        try:
+            sql_report = delete_documents_bulk((d["student_id"], d["filename"]) for d in docs)
+        except Exception as e:
+            # Nothing was committed, so nothing was removed anywhere
+            return [_delete_item(d, False, False, f"SQL delete failed: {e}") for d in docs]
+
+        paths = {}
+        for d in docs:
+            entry = sql_report[(d["student_id"], d["filename"])]
+            paths[d["row_key"]] = set(entry["gcs_paths"])
+            # content/ objects are shared and only deleted once SQL reports them unreferenced;
+            # documents stored only in Cloud SQL have no object at all
+            if d["gcs_object_name"] and not d["gcs_object_name"].startswith(CONTENT_PREFIX):
+                paths[d["row_key"]].add(d["gcs_object_name"])
+        gcs_errors = delete_files([p for group in paths.values() for p in group])
+
+    report = []
+    for d in docs:
+        entry = sql_report[(d["student_id"], d["filename"])]
+        errors = [gcs_errors[p] for p in paths[d["row_key"]] if gcs_errors.get(p)]
+        report.append(_delete_item(
+            d,
+            sql_deleted=entry["metadata_rows"] + entry["blob_rows"] > 0,
+            gcs_deleted=not errors,
+            error="; ".join(errors) or None,
+        ))
+    for item in report:
+        item["batch_ms"] = t.elapsed_ms
+    return report
+
+
+def _delete_item(doc, sql_deleted, gcs_deleted, error):
+    return {
+        "row_key": doc["row_key"],
+        "filename": doc["filename"],
+        "sql_deleted": sql_deleted,
+        "gcs_deleted": gcs_deleted,
+        "error": error,
+    }
+
+
+def _timed_write(writer, chunk):
+    with TimedBlock() as t:
+        writer.write(chunk)
+    return t.elapsed_ms
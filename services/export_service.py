@@ -0,0 +1,322 @@
+"""
+services/export_service.py
+
+Exports benchmark results as Excel, CSV or Parquet, and measures what each
+export costs in time and peak memory as the number of rows grows.
+
+The Excel workbook is written in openpyxl's write-only (streaming) mode with
+shared named styles; CSV and Parquet (needs the optional `pyarrow` package)
+carry every flat result field and suit runs too large for a spreadsheet.
+"""
+
+import csv
+import io
+import random
+import time
+import tracemalloc
+from services.benchmark_service import BENCHMARK_SIZES, summarize_averages, summarize_results
+
+EXPORT_FORMATS = ("excel", "csv", "parquet")
+
+# Column widths are estimated from the header and this many leading rows
+_WIDTH_SAMPLE_ROWS = 100
+
+RAW_HEADERS = [
+    "Size", "Size (KB)", "Run",
+    "SQL Upload (ms)", "GCS Upload (ms)",
+    "SQL Download (ms)", "GCS Download (ms)",
+    "SQL Cost/mo ($)", "GCS Cost/mo ($)",
+    "Faster Upload", "Faster Download",
+    "SQL Stream First Byte (ms)", "SQL Stream Last Byte (ms)",
+    "SQL Range Read (ms)", "GCS Range Read (ms)",
+    "Codec", "Stored (KB)", "Compression Ratio",
+    "SQL Upload Compressed (ms)", "GCS Upload Compressed (ms)",
+    "SQL Download Compressed (ms)", "GCS Download Compressed (ms)",
+    "SQL Cost/mo Compressed ($)", "GCS Cost/mo Compressed ($)",
+]
+
+AVERAGE_HEADERS = [
+    "Size", "Size (KB)",
+    "Avg SQL Upload (ms)", "Avg GCS Upload (ms)",
+    "Avg SQL Download (ms)", "Avg GCS Download (ms)",
+    "Avg SQL Range Read (ms)", "Avg GCS Range Read (ms)",
+    "SQL Cost/mo ($)", "GCS Cost/mo ($)",
+    "Upload Winner", "Download Winner"
+]
+
+PERCENTILE_HEADERS = [
+    "Size", "Operation", "Samples",
+    "Mean (ms)", "Std Dev (ms)", "Min (ms)",
+    "p50 (ms)", "p90 (ms)", "p95 (ms)", "p99 (ms)", "Max (ms)",
+    "Mean 95% CI Low (ms)", "Mean 95% CI High (ms)",
+]
+
+# Raw-sheet columns coloured by which backend was faster
+_WINNER_COLUMNS = {RAW_HEADERS.index("Faster Upload"), RAW_HEADERS.index("Faster Download")}
+
+
+def _raw_values(r):
+    return [
+        r["size_label"], r["size_kb"], r["run"],
+        r["sql_upload_ms"], r["gcs_upload_ms"],
+        r["sql_download_ms"], r["gcs_download_ms"],
+        r["sql_cost_usd"], r["gcs_cost_usd"],
+        r["faster_upload"], r["faster_download"],
+        r.get("sql_stream_first_byte_ms"), r.get("sql_stream_last_byte_ms"),
+        r.get("sql_range_ms"), r.get("gcs_range_ms"),
+        r.get("codec", "none"),
+        round(r["stored_size_bytes"] / 1024, 2) if r.get("stored_size_bytes") else None,
+        r.get("compression_ratio"),
+        r.get("sql_upload_compressed_ms"), r.get("gcs_upload_compressed_ms"),
+        r.get("sql_download_compressed_ms"), r.get("gcs_download_compressed_ms"),
+        r.get("sql_cost_compressed_usd"), r.get("gcs_cost_compressed_usd"),
+    ]
+
+
+def _average_values(a):
+    return [
+        a["size_label"], a["size_kb"],
+        a["avg_sql_upload"], a["avg_gcs_upload"],
+        a["avg_sql_download"], a["avg_gcs_download"],
+        a["avg_sql_range"], a["avg_gcs_range"],
+        a["sql_cost"], a["gcs_cost"],
+        a["upload_winner"], a["download_winner"],
+    ]
+
+
+def _percentile_values(s):
+    return [
+        s["size_label"], s["metric_label"], s["n"],
+        s["mean"], s["stddev"], s["min"],
+        s["p50"], s["p90"], s["p95"], s["p99"], s["max"],
+        s["ci95_low"], s["ci95_high"],
+    ]
+
+
+def _named_styles():
+    from openpyxl.styles import Alignment, Font, NamedStyle, PatternFill
+
+    def style(name, fill, font, **extra):
+        return NamedStyle(name=name, font=font, fill=PatternFill(start_color=fill, end_color=fill,
+                                                                 fill_type="solid"), **extra)
+
+    return [
+        style("bench_header", "1F4E79", Font(color="FFFFFF", bold=True),
+              alignment=Alignment(horizontal="center")),
+        style("bench_gcs", "C6EFCE", Font(color="276221")),
+        style("bench_sql", "FFCCCC", Font(color="9C0006")),
+    ]
+
+
+def _write_sheet(wb, title, headers, rows, to_values, styled_columns=()):
+    """
+    Append one sheet. `rows` is iterated once; widths are sized from the
+    header and the first _WIDTH_SAMPLE_ROWS rows, since a write-only sheet
+    can't be re-read, and must be set before the first row is written.
+    """
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.utils import get_column_letter
+
+    ws = wb.create_sheet(title)
+    widths = [len(h) for h in headers]
+    for r in rows[:_WIDTH_SAMPLE_ROWS]:
+        for i, val in enumerate(to_values(r)):
+            widths[i] = max(widths[i], len(str(val if val is not None else "")))
+    for i, width in enumerate(widths, 1):
+        ws.column_dimensions[get_column_letter(i)].width = width + 4
+
+    header_cells = []
+    for h in headers:
+        cell = WriteOnlyCell(ws, value=h)
+        cell.style = "bench_header"
+        header_cells.append(cell)
+    ws.append(header_cells)
+
+    for r in rows:
+        values = to_values(r)
+        for i in styled_columns:
+            cell = WriteOnlyCell(ws, value=values[i])
+            cell.style = "bench_gcs" if values[i] == "GCS" else "bench_sql"
+            values[i] = cell
+        ws.append(values)
+
+
+def results_to_excel(results: list[dict], averages: list[dict] = None,
+                     percentiles: list[dict] = None, write_only: bool = True) -> bytes:
+    """
+    Convert benchmark results to a three-sheet Excel file and return it as bytes.
+    averages / percentiles — summarize_averages / summarize_results output
+    the caller already has; computed here when not given.
+    write_only — stream rows straight to the file (openpyxl write-only
+    mode); False builds the whole workbook in memory first, as a baseline
+    for benchmark_exports.
+    """
+    import openpyxl
+
+    wb = openpyxl.Workbook(write_only=write_only)
+    if not write_only:
+        wb.remove(wb.active)
+    for style in _named_styles():
+        wb.add_named_style(style)
+
+    if averages is None:
+        averages = summarize_averages(results)
+    if percentiles is None:
+        percentiles = summarize_results(results)
+
+    _write_sheet(wb, "Raw Results", RAW_HEADERS, results, _raw_values, _WINNER_COLUMNS)
+    _write_sheet(wb, "Averages by Size", AVERAGE_HEADERS, averages, _average_values)
+    _write_sheet(wb, "Percentiles by Size", PERCENTILE_HEADERS, percentiles, _percentile_values)
+
+    buf = io.BytesIO()
+    wb.save(buf)
+    return buf.getvalue()
+
+
+def _flat_columns(results):
+    """Every scalar result field, in first-seen order (nested phase spans are left out)."""
+    columns = {}
+    for r in results:
+        for key, val in r.items():
+            if key not in columns and not isinstance(val, (dict, list)):
+                columns[key] = None
+    return list(columns)
+
+
+def results_to_csv(results: list[dict]) -> bytes:
+    """One row per raw result, one column per scalar field, UTF-8 encoded."""
+    columns = _flat_columns(results)
+    buf = io.BytesIO()
+    text = io.TextIOWrapper(buf, encoding="utf-8", newline="")
+    writer = csv.DictWriter(text, fieldnames=columns, extrasaction="ignore")
+    writer.writeheader()
+    writer.writerows(results)
+    text.flush()
+    text.detach()
+    return buf.getvalue()
+
+
+def results_to_parquet(results: list[dict]) -> bytes:
+    """Same columns as results_to_csv, as a Parquet file. Needs `pyarrow`."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    columns = _flat_columns(results)
+    table = pa.table({c: [r.get(c) for r in results] for c in columns})
+    buf = io.BytesIO()
+    pq.write_table(table, buf)
+    return buf.getvalue()
+
+
+def export_results(results: list[dict], fmt: str, averages=None, percentiles=None) -> bytes:
+    """Export in one of EXPORT_FORMATS."""
+    if fmt == "excel":
+        return results_to_excel(results, averages, percentiles)
+    if fmt == "csv":
+        return results_to_csv(results)
+    if fmt == "parquet":
+        return results_to_parquet(results)
+    raise ValueError(f"Unknown export format: {fmt}")
+
+
+# ── Export benchmark ────────────────────────────────────────────────────────
+
+def _synthetic_results(n_rows, seed=0) -> list[dict]:
+    """n_rows run_benchmark-shaped results with random timings, no I/O needed."""
+    rng = random.Random(seed)
+    results = []
+    for i in range(n_rows):
+        size_label, size_bytes = BENCHMARK_SIZES[i % len(BENCHMARK_SIZES)]
+        ms = {key: round(rng.lognormvariate(1 + size_bytes / 2e6, 0.4), 2)
+              for key in ("sql_upload_ms", "gcs_upload_ms", "sql_download_ms", "gcs_download_ms",
+                          "sql_stream_first_byte_ms", "sql_stream_last_byte_ms",
+                          "sql_range_ms", "gcs_range_ms")}
+        results.append({
+            "size_label": size_label,
+            "size_bytes": size_bytes,
+            "size_kb": round(size_bytes / 1024, 2),
+            "run": i // len(BENCHMARK_SIZES) + 1,
+            **ms,
+            "codec": "none",
+            "stored_size_bytes": size_bytes,
+            "compression_ratio": None,
+            "sql_cost_usd": round(size_bytes / 1024 ** 3 * 0.17, 10),
+            "gcs_cost_usd": round(size_bytes / 1024 ** 3 * 0.023, 10),
+            "faster_upload": "SQL" if ms["sql_upload_ms"] < ms["gcs_upload_ms"] else "GCS",
+            "faster_download": "SQL" if ms["sql_download_ms"] < ms["gcs_download_ms"] else "GCS",
+        })
+    return results
+
+
+# label -> exporter(results, summaries) for benchmark_exports; "excel (in-memory)"
+# is the full-workbook path the export used before write-only mode
+_BENCH_EXPORTERS = {
+    "excel": lambda results, summaries: results_to_excel(results, *summaries),
+    "excel (in-memory)": lambda results, summaries: results_to_excel(results, *summaries, write_only=False),
+    "csv": lambda results, summaries: results_to_csv(results),
+    "parquet": lambda results, summaries: results_to_parquet(results),
+}
+
+
+def benchmark_exports(row_counts=(1_000, 10_000, 50_000), formats=None, seed=0) -> list[dict]:
+    """
+    Time each exporter on synthetic results of each size, then run it again
+    under tracemalloc for peak Python memory (timed separately, since tracing
+    slows allocation). Rows: format, rows, export_ms, peak_mb, output_kb, error.
+
+    The Excel summary sheets are a few dozen rows whatever the run size, and
+    their bootstrap CIs are costly to compute, so they come from a fixed
+    sample of ten runs per size and are passed in precomputed, as the app does.
+    """
+    formats = formats or list(_BENCH_EXPORTERS)
+    sample = _synthetic_results(len(BENCHMARK_SIZES) * 10, seed)
+    summaries = (summarize_averages(sample), summarize_results(sample))
+    rows = []
+    for n_rows in row_counts:
+        results = _synthetic_results(n_rows, seed)
+        for fmt in formats:
+            exporter = _BENCH_EXPORTERS[fmt]
+            row = {"format": fmt, "rows": n_rows, "export_ms": None, "peak_mb": None,
+                   "output_kb": None, "error": None}
+            try:
+                start = time.perf_counter()
+                data = exporter(results, summaries)
+                row["export_ms"] = round((time.perf_counter() - start) * 1000, 1)
+                row["output_kb"] = round(len(data) / 1024, 1)
+                del data
+
+                tracemalloc.start()
+                try:
+                    exporter(results, summaries)
+                    row["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 ** 2, 2)
+                finally:
+                    tracemalloc.stop()
+            except ImportError as e:
+                row["error"] = str(e)
+            rows.append(row)
+    return rows
+
+
+def main(argv=None):
+    """
+    Export cost vs row count, e.g.
+
+        python -m services.export_service --rows 1000 10000 100000
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark result export time and peak memory.")
+    parser.add_argument("--rows", type=int, nargs="+", default=[1_000, 10_000, 50_000])
+    parser.add_argument("--formats", nargs="+", choices=list(_BENCH_EXPORTERS), default=None)
+    args = parser.parse_args(argv)
+
+    print(f"{'Format':<18} {'Rows':>8} {'Time (ms)':>10} {'Peak (MB)':>10} {'Output (KB)':>12}")
+    for r in benchmark_exports(args.rows, args.formats):
+        if r["error"]:
+            print(f"{r['format']:<18} {r['rows']:>8}  skipped: {r['error']}")
+            continue
+        print(f"{r['format']:<18} {r['rows']:>8} {r['export_ms']:>10} {r['peak_mb']:>10} {r['output_kb']:>12}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+"""
+services/hedge_service.py
+
+Hedged reads for documents stored in both Cloud SQL and GCS. A read goes to
+the preferred store first; if it hasn't answered within that store's
+HEDGE_PERCENTILE latency for files of that size, the same read is sent to
+the other store, and whichever answers first wins. The loser is cancelled:
+a read still queued never starts, a running SQL query is cancelled on the
+server (QueryCanceller), and a GCS download already in flight — which the
+client library can't interrupt — finishes in the background and is
+discarded.
+
+The delay is the percentile of a sliding window of completed reads per
+(store, size class), so it follows current conditions and only about
+(100 - HEDGE_PERCENTILE)% of reads send a second request.
+"""
+
+import io
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dotenv import load_dotenv
+from db.queries import QueryCanceller, create_student, insert_blob_timed, fetch_blob_timed
+from storage.gcs import get_backend, use_backend, upload_file_timed, download_file_timed
+from utils.stats import percentile
+from utils.timer import TimedBlock
+
+load_dotenv()
+
+HEDGE_SOURCES = ("gcs", "sql")
+
+HEDGE_READS = os.getenv("HEDGE_READS", "false").lower() in ("1", "true", "yes")
+HEDGE_PREFERRED = os.getenv("HEDGE_PREFERRED", "gcs").lower()
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_WINDOW = int(os.getenv("HEDGE_WINDOW", "500"))              # latencies kept per (store, size class)
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))     # below this, HEDGE_INITIAL_DELAY_MS is used
+HEDGE_INITIAL_DELAY_MS = float(os.getenv("HEDGE_INITIAL_DELAY_MS", "50"))
+HEDGE_MIN_DELAY_MS = float(os.getenv("HEDGE_MIN_DELAY_MS", "2"))
+HEDGE_WORKERS = int(os.getenv("HEDGE_WORKERS", "8"))
+
+if HEDGE_PREFERRED not in HEDGE_SOURCES:
+    raise ValueError(f"Unknown HEDGE_PREFERRED: {HEDGE_PREFERRED}")
+
+
+class HedgedReader:
+    """
+    Runs hedged reads on its own worker threads and keeps the latency
+    windows and counters they are judged by. Thread-safe.
+    """
+
+    def __init__(self, pct=HEDGE_PERCENTILE, window=HEDGE_WINDOW, min_samples=HEDGE_MIN_SAMPLES,
+                 initial_delay_ms=HEDGE_INITIAL_DELAY_MS, min_delay_ms=HEDGE_MIN_DELAY_MS,
+                 max_workers=HEDGE_WORKERS):
+        self.pct = pct
+        self.window = window
+        self.min_samples = min_samples
+        self.initial_delay_ms = initial_delay_ms
+        self.min_delay_ms = min_delay_ms
+        self._latencies = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedged-read")
+        # connection.cancel() blocks on a round trip, so losers are cancelled here
+        self._cancel_pool = ThreadPoolExecutor(max_workers=2, thread_name_prefix="hedged-cancel")
+        self._counters = {"reads": 0, "hedged": 0, "primary_errors": 0, "primary_wins": 0,
+                          "secondary_wins": 0, "cancelled": 0, "abandoned": 0, "failures": 0}
+
+    @staticmethod
+    def size_class(size_bytes):
+        """Factor-4 size buckets: < 4 KB, 4–16 KB, 16–64 KB, ..."""
+        return max(int(size_bytes or 0).bit_length() - 11, 0) // 2
+
+    def observe(self, source, size_bytes, elapsed_ms):
+        """Record a completed read's latency."""
+        key = (source, self.size_class(size_bytes))
+        with self._lock:
+            if key not in self._latencies:
+                self._latencies[key] = deque(maxlen=self.window)
+            self._latencies[key].append(elapsed_ms)
+
+    def delay_ms(self, source, size_bytes):
+        """How long a read from `source` may take before the other store is tried."""
+        with self._lock:
+            samples = list(self._latencies.get((source, self.size_class(size_bytes)), ()))
+        if len(samples) < self.min_samples:
+            return self.initial_delay_ms
+        return max(round(percentile(samples, self.pct), 2), self.min_delay_ms)
+
+    def read(self, primary, secondary, size_bytes, delay_ms=None):
+        """
+        primary / secondary — (source, fn), fn(canceller) returning the bytes.
+        Returns (data, elapsed_ms, winning source, hedged). If both reads
+        fail, the primary's error is raised.
+        """
+        legs = {}
+
+        def start(source, fn):
+            canceller = QueryCanceller()
+            started = time.perf_counter()
+            future = self._pool.submit(fn, canceller)
+            future.add_done_callback(lambda f: self._finished(f, source, size_bytes, started))
+            legs[future] = (source, canceller)
+            return future
+
+        if delay_ms is None:
+            delay_ms = self.delay_ms(primary[0], size_bytes)
+
+        with TimedBlock() as t:
+            first = start(*primary)
+            done, _ = wait([first], timeout=delay_ms / 1000)
+            primary_failed = bool(done) and first.exception() is not None
+            hedged = not done or primary_failed
+            if hedged:
+                start(*secondary)
+
+            winner, pending = None, set(legs)
+            while pending and winner is None:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                # If both finished together, keep the primary's answer
+                ok = [f for f in done if f.exception() is None]
+                winner = first if first in ok else next(iter(ok), None)
+
+        for future in pending:
+            self._cancel_loser(future, legs[future][1])
+
+        with self._lock:
+            self._counters["reads"] += 1
+            self._counters["hedged"] += hedged
+            self._counters["primary_errors"] += primary_failed
+            if winner is None:
+                self._counters["failures"] += 1
+            else:
+                self._counters["primary_wins" if winner is first else "secondary_wins"] += 1
+
+        if winner is None:
+            raise first.exception()
+        return winner.result(), t.elapsed_ms, legs[winner][0], hedged
+
+    def _finished(self, future, source, size_bytes, started):
+        # Losers that ran to completion count too, so slow stores stay visible
+        if not future.cancelled() and future.exception() is None:
+            self.observe(source, size_bytes, (time.perf_counter() - started) * 1000)
+
+    def _cancel_loser(self, future, canceller):
+        if future.cancel():
+            with self._lock:
+                self._counters["cancelled"] += 1
+            return
+
+        def cancel():
+            sent = canceller.cancel()
+            with self._lock:
+                self._counters["cancelled" if sent else "abandoned"] += 1
+
+        self._cancel_pool.submit(cancel)
+
+    def stats(self):
+        with self._lock:
+            reads = self._counters["reads"]
+            return {
+                **self._counters,
+                "hedge_rate": round(self._counters["hedged"] / reads, 3) if reads else 0.0,
+            }
+
+    def close(self):
+        """Wait for abandoned reads and pending cancels, then stop the workers."""
+        self._pool.shutdown(wait=True)
+        self._cancel_pool.shutdown(wait=True)
+
+
+hedged_reader = HedgedReader()
+
+
+# ── Benchmark ───────────────────────────────────────────────────────────────
+
+def run_hedge_benchmark(reads_per_size: int = 100, sizes=None, preferred=HEDGE_PREFERRED,
+                        pct=HEDGE_PERCENTILE, storage_backend=None, progress_callback=None) -> list[dict]:
+    """
+    For each size, store one file in both Cloud SQL and GCS, then read it
+    `reads_per_size` times from the preferred store alone (the baseline,
+    which also fills the latency window) and `reads_per_size` times hedged.
+
+    Returns one row per size with baseline vs hedged p50/p99, the p99
+    improvement, the hedge delay and the extra load: the share of reads
+    that sent a second request, and how many of those the other store won.
+
+    storage_backend — run the GCS side against this backend instead of the
+    default (e.g. a MemoryBackend with a jittery latency profile).
+    progress_callback(current, total, label) — optional UI progress hook.
+    """
+    from services.benchmark_service import (
+        BENCHMARK_SIZES, BENCHMARK_STUDENT_ID, BENCHMARK_STUDENT_NAME, _generate_file_bytes,
+    )
+
+    sizes = sizes or BENCHMARK_SIZES
+    secondary = "sql" if preferred == "gcs" else "gcs"
+    # Pool threads don't inherit use_backend overrides, so pin the backend explicitly
+    backend = storage_backend or get_backend()
+    create_student(BENCHMARK_STUDENT_ID, BENCHMARK_STUDENT_NAME)
+
+    rows = []
+    total_ops = len(sizes) * 2
+    op = 0
+
+    for size_label, size_bytes in sizes:
+        file_bytes = _generate_file_bytes(size_bytes)
+        filename = f"hedge_{size_label.replace(' ', '')}.bin"
+        path = f"benchmark/{BENCHMARK_STUDENT_ID}/{filename}"
+
+        def from_gcs(canceller):
+            with use_backend(backend):
+                return download_file_timed(path)[0]
+
+        def from_sql(canceller):
+            data, _ = fetch_blob_timed(BENCHMARK_STUDENT_ID, filename, canceller)
+            if data is None:
+                raise FileNotFoundError(filename)
+            return data
+
+        fns = {"gcs": from_gcs, "sql": from_sql}
+        insert_blob_timed(BENCHMARK_STUDENT_ID, "Benchmark", filename, file_bytes)
+        with use_backend(backend):
+            upload_file_timed(io.BytesIO(file_bytes), path)
+
+        reader = HedgedReader(pct=pct, min_samples=min(HEDGE_MIN_SAMPLES, reads_per_size))
+        try:
+            op += 1
+            if progress_callback:
+                progress_callback(op, total_ops, f"{size_label} — {preferred.upper()} only")
+            baseline = []
+            for _ in range(reads_per_size):
+                with TimedBlock() as t:
+                    fns[preferred](None)
+                baseline.append(t.elapsed_ms)
+                reader.observe(preferred, size_bytes, t.elapsed_ms)
+
+            op += 1
+            if progress_callback:
+                progress_callback(op, total_ops, f"{size_label} — hedged")
+            delay_ms = reader.delay_ms(preferred, size_bytes)
+            hedged = []
+            for _ in range(reads_per_size):
+                _, elapsed_ms, _, _ = reader.read((preferred, fns[preferred]),
+                                                  (secondary, fns[secondary]), size_bytes)
+                hedged.append(elapsed_ms)
+        finally:
+            reader.close()
+
+        stats = reader.stats()
+        base_p99, hedged_p99 = percentile(baseline, 99), percentile(hedged, 99)
+        rows.append({
+            "size_label": size_label,
+            "size_bytes": size_bytes,
+            "preferred": preferred,
+            "reads": reads_per_size,
+            "hedge_delay_ms": delay_ms,
+            "baseline_p50_ms": round(percentile(baseline, 50), 2),
+            "baseline_p99_ms": round(base_p99, 2),
+            "hedged_p50_ms": round(percentile(hedged, 50), 2),
+            "hedged_p99_ms": round(hedged_p99, 2),
+            "p99_improvement_pct": round((base_p99 - hedged_p99) / base_p99 * 100, 1) if base_p99 else 0.0,
+            "hedged_reads": stats["hedged"],
+            "extra_load_pct": round(stats["hedge_rate"] * 100, 1),
+            "secondary_wins": stats["secondary_wins"],
+            "cancelled": stats["cancelled"],
+            "abandoned": stats["abandoned"],
+        })
+
+    return rows
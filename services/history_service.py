@@ -0,0 +1,121 @@
+"""
+services/history_service.py
+
+Stores run_benchmark results in Cloud SQL together with a fingerprint of
+the environment they were measured in, and compares any two saved runs to
+flag statistically significant regressions.
+"""
+
+import os
+import platform
+import socket
+import subprocess
+from collections import defaultdict
+from db.connection import POOL_MIN_SIZE, POOL_MAX_SIZE, pooling_enabled
+from db.queries import insert_benchmark_run, list_benchmark_runs, fetch_benchmark_samples
+from services.benchmark_service import LATENCY_METRICS, BENCHMARK_SIZES
+from storage.gcs import get_backend
+from utils.stats import mann_whitney_u, percentile, mean
+
+# A change is flagged only if it is statistically significant AND at least this large
+REGRESSION_ALPHA = float(os.getenv("REGRESSION_ALPHA", "0.01"))
+REGRESSION_MIN_CHANGE_PCT = float(os.getenv("REGRESSION_MIN_CHANGE_PCT", "5"))
+
+
+def _git_rev():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, timeout=5,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def environment_fingerprint(storage_backend=None, include_sql=True) -> dict:
+    """
+    Describe where a benchmark ran. Region and instance tier come from the
+    optional GCP_REGION and DB_INSTANCE_TIER environment variables.
+    """
+    backend = storage_backend or get_backend()
+    return {
+        "region": os.getenv("GCP_REGION"),
+        "db_instance_tier": os.getenv("DB_INSTANCE_TIER"),
+        "db_host": os.getenv("DB_HOST"),
+        "include_sql": include_sql,
+        "pool": {
+            "enabled": pooling_enabled(),
+            "min_size": POOL_MIN_SIZE,
+            "max_size": POOL_MAX_SIZE,
+        },
+        "storage_backend": backend.name,
+        "storage_latency_ms": getattr(backend, "latency_ms", None),
+        "storage_bandwidth_mbps": getattr(backend, "bandwidth_mbps", None),
+        "git_rev": _git_rev(),
+        "python": platform.python_version(),
+        "host": socket.gethostname(),
+    }
+
+
+def save_run(results, runs_per_size, warmup_runs, fingerprint, label=None) -> int:
+    """Persist one run_benchmark result list. Returns the run_id."""
+    samples = [
+        (r["size_label"], r["size_bytes"], key, r["run"], r[key])
+        for r in results
+        for key, _ in LATENCY_METRICS
+        if r.get(key) is not None
+    ]
+    return insert_benchmark_run(label, runs_per_size, warmup_runs, fingerprint, samples)
+
+
+def list_runs(limit=50):
+    return list_benchmark_runs(limit)
+
+
+def compare_runs(baseline_id, candidate_id,
+                 alpha=REGRESSION_ALPHA, min_change_pct=REGRESSION_MIN_CHANGE_PCT) -> list[dict]:
+    """
+    Compare two saved runs per size and operation.
+
+    A row is flagged as a regression when the candidate's median is at least
+    `min_change_pct` slower and a Mann-Whitney U test rejects "same
+    distribution" at `alpha`; improvements are flagged the same way.
+    """
+    def grouped(run_id):
+        groups = defaultdict(list)
+        for s in fetch_benchmark_samples(run_id):
+            groups[(s["size_label"], s["metric"])].append(s["value_ms"])
+        return groups
+
+    base, cand = grouped(baseline_id), grouped(candidate_id)
+    labels = dict(LATENCY_METRICS)
+    size_order = {label: i for i, (label, _) in enumerate(BENCHMARK_SIZES)}
+    metric_order = {key: i for i, (key, _) in enumerate(LATENCY_METRICS)}
+
+    rows = []
+    for key in sorted(base.keys() & cand.keys(),
+                      key=lambda k: (size_order.get(k[0], 99), metric_order.get(k[1], 99))):
+        a, b = base[key], cand[key]
+        base_p50, cand_p50 = percentile(a, 50), percentile(b, 50)
+        change_pct = (cand_p50 - base_p50) / base_p50 * 100 if base_p50 else 0.0
+        p_value = mann_whitney_u(a, b)
+        significant = p_value < alpha and abs(change_pct) >= min_change_pct
+
+        rows.append({
+            "size_label": key[0],
+            "metric": key[1],
+            "metric_label": labels.get(key[1], key[1]),
+            "baseline_n": len(a),
+            "candidate_n": len(b),
+            "baseline_p50": round(base_p50, 2),
+            "candidate_p50": round(cand_p50, 2),
+            "baseline_p95": round(percentile(a, 95), 2),
+            "candidate_p95": round(percentile(b, 95), 2),
+            "baseline_mean": round(mean(a), 2),
+            "candidate_mean": round(mean(b), 2),
+            "p50_change_pct": round(change_pct, 1),
+            "p_value": round(p_value, 5),
+            "verdict": ("regression" if change_pct > 0 else "improvement") if significant else "no change",
+        })
+    return rows
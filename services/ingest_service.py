@@ -0,0 +1,216 @@
+"""
+services/ingest_service.py
+
+Bulk ingestion for whole cohorts: many files at once (multi-file upload, a
+zip archive, or a manifest CSV), written to Cloud SQL and GCS with batched
+inserts and a bounded pool of GCS upload workers.
+"""
+
+import csv
+import io
+import os
+import posixpath
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from db.queries import upsert_students, insert_blobs_many
+from storage.gcs import upload_file_timed, delete_files, get_backend, use_backend
+from utils.timer import TimedBlock
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "8"))
+# documents_blob rows are flushed in multi-row INSERTs of roughly this many bytes
+INGEST_SQL_BATCH_BYTES = int(os.getenv("INGEST_SQL_BATCH_BYTES", str(16 * 1024 * 1024)))
+
+MANIFEST_NAME = "manifest.csv"
+MANIFEST_COLUMNS = ("student_id", "name", "doc_type", "filename")   # optional: "path"
+
+
+def make_item(student_id, name, doc_type, filename, read):
+    """One file to ingest. `read()` returns its bytes and is only called by a worker."""
+    return {
+        "student_id": student_id,
+        "name": name,
+        "doc_type": doc_type,
+        "filename": filename,
+        "read": read,
+    }
+
+
+def items_from_uploads(files, student_id, name, doc_type):
+    """Ingest items for several uploaded files belonging to one student."""
+    return [make_item(student_id, name, doc_type, f.name, f.read) for f in files]
+
+
+def items_from_zip(zip_file, default_doc_type="Other"):
+    """
+    Ingest items for a zip archive.
+
+    If the archive contains manifest.csv at its root, that decides the
+    student, name and doc type of each file (see items_from_manifest).
+    Otherwise files must be laid out as <student_id>/<filename>, where the
+    filename keeps any subfolders (S1/a/report.pdf is stored as
+    a/report.pdf); the student name defaults to the ID.
+    """
+    zf = zipfile.ZipFile(zip_file)
+    names = [
+        n for n in zf.namelist()
+        if not n.endswith("/") and not n.startswith("__MACOSX/")
+        and posixpath.basename(n) != ".DS_Store"
+    ]
+
+    if MANIFEST_NAME in names:
+        with zf.open(MANIFEST_NAME) as manifest:
+            rows = _read_manifest(io.TextIOWrapper(manifest, encoding="utf-8-sig"))
+        available = set(names)
+        items = []
+        for row in rows:
+            path = row.get("path") or row["filename"]
+            read = (lambda p=path: zf.read(p)) if path in available else _missing(path)
+            items.append(make_item(row["student_id"], row["name"], row["doc_type"], row["filename"], read))
+        return items
+
+    items = []
+    for n in names:
+        parts = n.split("/")
+        if len(parts) < 2:
+            continue
+        # Keep subfolders so S1/a/report.pdf and S1/b/report.pdf stay distinct
+        student_id, filename = parts[0], "/".join(parts[1:])
+        items.append(make_item(student_id, student_id, default_doc_type, filename,
+                               lambda p=n: zf.read(p)))
+    return items
+
+
+def items_from_manifest(manifest_file, files):
+    """
+    Ingest items for a manifest CSV plus the uploaded files it refers to.
+
+    Columns: student_id, name, doc_type, filename and optionally path (the
+    uploaded file's name, when it differs from the stored filename).
+    """
+    by_name = {f.name: f for f in files}
+    rows = _read_manifest(io.TextIOWrapper(manifest_file, encoding="utf-8-sig"))
+    items = []
+    for row in rows:
+        path = row.get("path") or row["filename"]
+        read = by_name[path].read if path in by_name else _missing(path)
+        items.append(make_item(row["student_id"], row["name"], row["doc_type"], row["filename"], read))
+    return items
+
+
+def _read_manifest(text):
+    reader = csv.DictReader(text)
+    missing = [c for c in MANIFEST_COLUMNS if c not in (reader.fieldnames or [])]
+    if missing:
+        raise ValueError(f"Manifest is missing column(s): {', '.join(missing)}")
+    return [
+        {k: (v or "").strip() for k, v in row.items() if k}
+        for row in reader
+        if (row.get("student_id") or "").strip() and (row.get("filename") or "").strip()
+    ]
+
+
+def _missing(path):
+    def read():
+        raise FileNotFoundError(f"'{path}' listed in the manifest but not provided")
+    return read
+
+
+def bulk_ingest(items, max_workers=INGEST_WORKERS, progress_callback=None) -> dict:
+    """
+    Write every item to Cloud SQL (BYTEA) and GCS.
+
+    - Students are upserted in one statement.
+    - GCS uploads run on `max_workers` threads.
+    - Blob rows are flushed with multi-row INSERTs of ~INGEST_SQL_BATCH_BYTES,
+      each committed together with the batch's metadata rows. If a batch
+      fails, its GCS objects are deleted again and its files reported as
+      failed; earlier batches stay ingested.
+
+    Items share a GCS path when they have the same student and filename, so
+    only the first of them is ingested and the rest are reported as failed.
+
+    Returns a job report with overall files/s and MB/s and a list of failures.
+    progress_callback(current, total, label) — optional UI progress hook.
+    """
+    unique, failed = {}, []
+    for item in items:
+        key = (item["student_id"], item["filename"])
+        if key in unique:
+            failed.append(_failure(item, "Same student and filename as an earlier file in this job"))
+        else:
+            unique[key] = item
+    items = list(unique.values())
+    upsert_students((i["student_id"], i["name"] or i["student_id"]) for i in items)
+
+    ingested = []
+    pending_blobs, pending_metadata, pending_items = [], [], []
+    pending_bytes = 0
+    stored_bytes = 0
+    gcs_ms = sql_ms = 0.0
+
+    # Upload workers don't inherit a use_backend override
+    backend = get_backend()
+
+    def upload(item):
+        data = item["read"]()
+        path = f"students/{item['student_id']}/{item['filename']}"
+        with use_backend(backend):
+            _, ms = upload_file_timed(io.BytesIO(data), path)
+        return data, path, ms
+
+    def flush_blobs():
+        nonlocal pending_blobs, pending_metadata, pending_items, pending_bytes, sql_ms, stored_bytes
+        if not pending_blobs:
+            return
+        try:
+            sql_ms += insert_blobs_many(pending_blobs, pending_metadata)
+            ingested.extend(pending_metadata)
+            stored_bytes += pending_bytes
+        except Exception as e:
+            failed.extend(_failure(i, f"SQL insert failed: {e}") for i in pending_items)
+            # Nothing of the batch was committed, so nothing points at its objects
+            delete_files([m[3] for m in pending_metadata])
+        pending_blobs, pending_metadata, pending_items = [], [], []
+        pending_bytes = 0
+
+    with TimedBlock() as total:
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+            futures = {pool.submit(upload, item): item for item in items}
+            for done, future in enumerate(as_completed(futures), 1):
+                item = futures.pop(future)
+                if progress_callback:
+                    progress_callback(done, len(items), item["filename"])
+                try:
+                    data, path, ms = future.result()
+                except Exception as e:
+                    failed.append(_failure(item, f"GCS upload failed: {e}"))
+                    continue
+
+                gcs_ms += ms
+                pending_blobs.append((item["student_id"], item["doc_type"], item["filename"], data))
+                pending_metadata.append(
+                    (item["student_id"], item["doc_type"], item["filename"], path, len(data))
+                )
+                pending_items.append(item)
+                pending_bytes += len(data)
+                if pending_bytes >= INGEST_SQL_BATCH_BYTES:
+                    flush_blobs()
+            flush_blobs()
+
+    seconds = total.elapsed_ms / 1000 or float("inf")
+    return {
+        "files": len(ingested),
+        "failed": failed,
+        "students": len({i["student_id"] for i in items}),
+        "bytes": stored_bytes,
+        "total_ms": total.elapsed_ms,
+        "files_per_s": round(len(ingested) / seconds, 2),
+        "mb_per_s": round(stored_bytes / (1024 ** 2) / seconds, 3),
+        "gcs_upload_ms_total": round(gcs_ms, 2),
+        "sql_blob_ms_total": round(sql_ms, 2),
+        "workers": max_workers,
+    }
+
+
+def _failure(item, error):
+    return {"student_id": item["student_id"], "filename": item["filename"], "error": error}
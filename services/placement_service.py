@@ -0,0 +1,129 @@
+"""
+services/placement_service.py
+
+Decides where a new document's bytes are stored: "sql" (documents_blob
+only), "gcs" (GCS only) or "both" (the dual write used for comparisons).
+
+PLACEMENT_MODE:
+- both      — every document goes to both stores (the default)
+- size      — files up to PLACEMENT_SQL_MAX_KB go to Cloud SQL, larger ones to GCS
+- benchmark — like size, with the threshold derived from the latest saved
+              benchmark run (services/history_service.py) and estimate_cost;
+              falls back to PLACEMENT_SQL_MAX_KB when there is no usable run
+
+The choice is recorded in documents.storage_backend (migration 005), which
+download_document uses to read from wherever the bytes live.
+"""
+
+import os
+import threading
+from collections import defaultdict
+from dotenv import load_dotenv
+from services.benchmark_service import summarize_averages
+from utils.cost_calculator import estimate_cost
+
+load_dotenv()
+
+PLACEMENTS = ("sql", "gcs", "both")
+PLACEMENT_MODES = ("both", "size", "benchmark")
+
+PLACEMENT_MODE = os.getenv("PLACEMENT_MODE", "both").lower()
+PLACEMENT_SQL_MAX_BYTES = int(os.getenv("PLACEMENT_SQL_MAX_KB", "100")) * 1024
+
+# A size goes to Cloud SQL only if SQL's upload + download time beats GCS by this much ...
+PLACEMENT_MIN_SPEEDUP_PCT = float(os.getenv("PLACEMENT_MIN_SPEEDUP_PCT", "10"))
+# ... and storing it there costs at most this much more per file per month
+PLACEMENT_MAX_EXTRA_COST_USD = float(os.getenv("PLACEMENT_MAX_EXTRA_COST_USD", "0.0001"))
+
+if PLACEMENT_MODE not in PLACEMENT_MODES:
+    raise ValueError(f"Unknown PLACEMENT_MODE: {PLACEMENT_MODE}")
+
+_policy = {"mode": PLACEMENT_MODE, "sql_max_bytes": PLACEMENT_SQL_MAX_BYTES, "source": "environment"}
+_policy_lock = threading.Lock()
+
+
+def thresholds_from_results(results, min_speedup_pct=PLACEMENT_MIN_SPEEDUP_PCT,
+                            max_extra_cost_usd=PLACEMENT_MAX_EXTRA_COST_USD) -> dict:
+    """
+    Derive the SQL size threshold from run_benchmark results. Sizes are taken
+    smallest first while Cloud SQL keeps winning on both latency and cost;
+    the threshold is the largest of them (0 if SQL never qualifies, e.g. the
+    run skipped SQL). Returns {"sql_max_bytes", "sizes": [per-size decision]}.
+    """
+    sizes = []
+    sql_max_bytes = 0
+    qualifying = True
+    for a in summarize_averages(results):
+        size_bytes = int(round(a["size_kb"] * 1024))
+        timings = [a["avg_sql_upload"], a["avg_sql_download"], a["avg_gcs_upload"], a["avg_gcs_download"]]
+        extra_cost = estimate_cost(size_bytes)["savings_usd"]
+        if None in timings:
+            speedup_pct = None
+        else:
+            sql_ms, gcs_ms = timings[0] + timings[1], timings[2] + timings[3]
+            speedup_pct = round((gcs_ms - sql_ms) / gcs_ms * 100, 1) if gcs_ms else 0.0
+        sql_wins = (speedup_pct is not None and speedup_pct >= min_speedup_pct
+                    and extra_cost <= max_extra_cost_usd)
+        qualifying = qualifying and sql_wins
+        if qualifying:
+            sql_max_bytes = size_bytes
+        sizes.append({
+            "size_label": a["size_label"],
+            "size_bytes": size_bytes,
+            "sql_speedup_pct": speedup_pct,
+            "sql_extra_cost_usd": extra_cost,
+            "placement": "sql" if qualifying else "gcs",
+        })
+    return {"sql_max_bytes": sql_max_bytes, "sizes": sizes}
+
+
+def thresholds_from_history(run_id=None) -> dict:
+    """thresholds_from_results for a saved benchmark run (the latest one by default)."""
+    from db.queries import fetch_benchmark_samples
+    from services.history_service import list_runs
+
+    if run_id is None:
+        runs = list_runs(limit=1)
+        if not runs:
+            raise LookupError("No saved benchmark runs")
+        run_id = runs[0]["run_id"]
+
+    # Rebuild result-shaped rows, one per (size, run), from the stored samples
+    rows = defaultdict(dict)
+    for s in fetch_benchmark_samples(run_id):
+        row = rows[(s["size_label"], s["run"])]
+        row.update(size_label=s["size_label"], size_kb=round(s["size_bytes"] / 1024, 2))
+        row[s["metric"]] = s["value_ms"]
+    return {"run_id": run_id, **thresholds_from_results(list(rows.values()))}
+
+
+def placement_policy() -> dict:
+    """The active policy: mode, sql_max_bytes and where the threshold came from."""
+    with _policy_lock:
+        if _policy["mode"] == "benchmark" and _policy["source"] == "environment":
+            # Resolved once, on first use, so importing this module needs no database
+            try:
+                derived = thresholds_from_history()
+                _policy.update(sql_max_bytes=derived["sql_max_bytes"],
+                               source=f"benchmark run #{derived['run_id']}")
+            except Exception as e:
+                _policy["source"] = f"environment (no usable benchmark run: {e})"
+        return dict(_policy)
+
+
+def set_placement_policy(mode, sql_max_bytes=None, source="manual"):
+    """Replace the process-wide policy, e.g. with thresholds_from_results of a fresh run."""
+    if mode not in PLACEMENT_MODES:
+        raise ValueError(f"Unknown placement mode: {mode}")
+    with _policy_lock:
+        _policy.update(mode=mode, source=source)
+        if sql_max_bytes is not None:
+            _policy["sql_max_bytes"] = sql_max_bytes
+
+
+def choose_placement(size_bytes) -> str:
+    """Where a file of `size_bytes` (None if unknown) should be stored under the active policy."""
+    policy = placement_policy()
+    if policy["mode"] == "both" or size_bytes is None:
+        return "both"
+    return "sql" if size_bytes <= policy["sql_max_bytes"] else "gcs"
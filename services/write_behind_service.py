@@ -0,0 +1,288 @@
+"""
+services/write_behind_service.py
+
+Write-behind GCS uploads. Instead of waiting for GCS, upload_document_both
+(write_behind=True) writes the bytes to a local spool directory and inserts
+the documents row as upload_status='pending'; a pool of background workers
+then drains the spool to GCS, retrying with exponential backoff, and flips
+the row to 'committed' (or 'failed' once WRITE_BEHIND_MAX_ATTEMPTS is used up).
+
+Each spooled object is two files: <key>.data (the bytes) and <key>.json (the
+job: GCS path, size, attempts). Both are fsynced before the upload call
+returns, so jobs survive a restart — start(), which app.py calls at startup,
+re-queues whatever is left in the spool, including failed jobs, which get
+one more attempt. While an
+object is pending, downloads are served from the spool. An object whose
+documents were deleted (or never inserted) before it was drained is removed
+from GCS again instead of being left orphaned.
+"""
+
+import hashlib
+import json
+import os
+import queue
+import tempfile
+import threading
+import time
+from collections import deque
+from dotenv import load_dotenv
+from db.queries import set_upload_status
+from storage.gcs import get_backend, delete_file
+from utils.timer import TimedBlock
+
+load_dotenv()
+
+WRITE_BEHIND_SPOOL_DIR = os.getenv("WRITE_BEHIND_SPOOL_DIR", "spool")
+WRITE_BEHIND_WORKERS = int(os.getenv("WRITE_BEHIND_WORKERS", "4"))
+WRITE_BEHIND_MAX_ATTEMPTS = int(os.getenv("WRITE_BEHIND_MAX_ATTEMPTS", "8"))
+WRITE_BEHIND_RETRY_BASE_S = float(os.getenv("WRITE_BEHIND_RETRY_BASE_S", "1"))
+WRITE_BEHIND_RETRY_MAX_S = float(os.getenv("WRITE_BEHIND_RETRY_MAX_S", "60"))
+
+# Drain rate is averaged over this many recent seconds
+_RATE_WINDOW_S = 60
+
+
+class WriteBehindQueue:
+    """
+    Durable spool plus drain workers. Jobs move through three states:
+    staged (spooled, documents row not yet written), queued (waiting for or
+    in an upload attempt, including retry backoff) and done (spool removed).
+    Thread-safe; workers start on first use.
+    """
+
+    def __init__(self, spool_dir=WRITE_BEHIND_SPOOL_DIR, workers=WRITE_BEHIND_WORKERS,
+                 max_attempts=WRITE_BEHIND_MAX_ATTEMPTS, retry_base_s=WRITE_BEHIND_RETRY_BASE_S,
+                 retry_max_s=WRITE_BEHIND_RETRY_MAX_S):
+        self.spool_dir = os.path.abspath(spool_dir)
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.retry_base_s = retry_base_s
+        self.retry_max_s = retry_max_s
+        self._queue = queue.Queue()
+        self._jobs = {}          # path -> job dict, for every spooled object
+        self._queued = set()     # paths handed to the workers and not yet done
+        self._in_flight = 0
+        self._drained = deque()  # completion times, for the drain rate
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._started = False
+        self._counters = {"spooled": 0, "committed": 0, "failed": 0, "retries": 0,
+                          "orphans_removed": 0, "discarded": 0, "recovered": 0}
+
+    # ── Spool ───────────────────────────────────────────────────────────────
+
+    def _files(self, path):
+        key = hashlib.sha256(path.encode()).hexdigest()
+        base = os.path.join(self.spool_dir, key)
+        return base + ".data", base + ".json"
+
+    def _write_durably(self, target, data):
+        fd, tmp = tempfile.mkstemp(dir=self.spool_dir, suffix=".part")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, target)
+
+    def _save_job(self, job):
+        self._write_durably(self._files(job["path"])[1], json.dumps(job).encode())
+
+    def spool_timed(self, file, path):
+        """
+        Persist the contents of `file` for a later upload to `path`; a drop-in
+        for upload_file_timed. The job stays staged until enqueue() (once the
+        documents row exists) or discard(). Returns (path, elapsed_ms).
+        """
+        self.start()
+        with TimedBlock() as t:
+            data = file.read()
+            data_file, _ = self._files(path)
+            self._write_durably(data_file, data)
+            job = {"path": path, "size": len(data), "attempts": 0, "spooled_at": time.time(),
+                   "last_error": None}
+            # The job file is written last: recovery only trusts spooled data with one
+            self._save_job(job)
+        with self._lock:
+            self._jobs[path] = job
+            self._counters["spooled"] += 1
+        return path, t.elapsed_ms
+
+    def enqueue(self, path):
+        """Hand a staged object to the drain workers."""
+        with self._lock:
+            if path in self._queued or path not in self._jobs:
+                return
+            self._queued.add(path)
+        self._queue.put(path)
+
+    def discard(self, path):
+        """Drop a staged object that won't be uploaded (e.g. a duplicate of existing content)."""
+        with self._lock:
+            if path in self._queued or self._jobs.pop(path, None) is None:
+                return
+            self._counters["discarded"] += 1
+        self._remove_files(path)
+
+    def is_pending(self, path):
+        """True while `path` is spooled and not yet uploaded."""
+        with self._lock:
+            return path in self._jobs
+
+    def read_spooled(self, path):
+        """
+        The spooled bytes for `path` — pending, or kept after every attempt
+        failed — or None once uploaded (or never spooled).
+        """
+        if path is None:
+            return None
+        try:
+            with open(self._files(path)[0], "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def _remove_files(self, path):
+        for name in self._files(path):
+            try:
+                os.remove(name)
+            except FileNotFoundError:
+                pass
+
+    # ── Workers ─────────────────────────────────────────────────────────────
+
+    def start(self):
+        """Create the spool, re-queue jobs left by an earlier process and start the workers."""
+        with self._start_lock:
+            if not self._started:
+                self._recover()
+                for i in range(self.workers):
+                    threading.Thread(target=self._worker, name=f"write-behind-{i}", daemon=True).start()
+                self._started = True
+
+    def _recover(self):
+        os.makedirs(self.spool_dir, exist_ok=True)
+        recovered = []
+        for name in os.listdir(self.spool_dir):
+            full = os.path.join(self.spool_dir, name)
+            if name.endswith(".part"):
+                os.remove(full)
+            elif name.endswith(".json"):
+                with open(full, "rb") as f:
+                    job = json.loads(f.read())
+                if os.path.exists(self._files(job["path"])[0]):
+                    recovered.append(job)
+                else:
+                    os.remove(full)
+        for name in os.listdir(self.spool_dir):
+            # Data whose job file was never written: the upload call failed mid-spool
+            base = os.path.join(self.spool_dir, name[:-len(".data")])
+            if name.endswith(".data") and not os.path.exists(base + ".json"):
+                os.remove(base + ".data")
+
+        with self._lock:
+            for job in recovered:
+                self._jobs[job["path"]] = job
+            self._counters["recovered"] += len(recovered)
+        for job in recovered:
+            self.enqueue(job["path"])
+
+    def _worker(self):
+        while True:
+            path = self._queue.get()
+            with self._lock:
+                job = self._jobs.get(path)
+                if job is None:
+                    continue
+                self._in_flight += 1
+            try:
+                self._drain(job)
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+
+    def _drain(self, job):
+        path = job["path"]
+        try:
+            with open(self._files(path)[0], "rb") as f:
+                get_backend().upload(f, path)
+            referenced = set_upload_status(path, "committed")
+        except Exception as e:
+            self._retry(job, e)
+            return
+
+        with self._lock:
+            replaced = self._jobs.get(path) is not job
+        if replaced:
+            # The same path was spooled again while this upload ran; send the newer bytes too
+            self._queue.put(path)
+            return
+        if not referenced:
+            # Every document pointing here was deleted (or never written) while queued
+            try:
+                delete_file(path)
+            except FileNotFoundError:
+                pass
+            with self._lock:
+                self._counters["orphans_removed"] += 1
+        self._finish(path, "committed")
+
+    def _retry(self, job, error):
+        job["attempts"] += 1
+        job["last_error"] = str(error)
+        if job["attempts"] >= self.max_attempts:
+            try:
+                set_upload_status(job["path"], "failed")
+            except Exception:
+                pass
+            # The bytes stay in the database copy (if any); the spool is kept for inspection
+            self._save_job(job)
+            with self._lock:
+                self._jobs.pop(job["path"], None)
+                self._queued.discard(job["path"])
+                self._counters["failed"] += 1
+            return
+
+        self._save_job(job)
+        with self._lock:
+            self._counters["retries"] += 1
+        delay_s = min(self.retry_base_s * 2 ** (job["attempts"] - 1), self.retry_max_s)
+        timer = threading.Timer(delay_s, self._queue.put, args=(job["path"],))
+        timer.daemon = True
+        timer.start()
+
+    def _finish(self, path, outcome):
+        now = time.monotonic()
+        with self._lock:
+            self._jobs.pop(path, None)
+            self._queued.discard(path)
+            self._counters[outcome] += 1
+            self._drained.append(now)
+            while self._drained and self._drained[0] < now - _RATE_WINDOW_S:
+                self._drained.popleft()
+        self._remove_files(path)
+
+    # ── Metrics ─────────────────────────────────────────────────────────────
+
+    def stats(self):
+        """
+        depth — objects queued for GCS (waiting, uploading or in retry backoff);
+        drain_rate — uploads completed per second over the last minute;
+        oldest_pending_s — age of the oldest queued object.
+        """
+        now = time.time()
+        with self._lock:
+            queued = [self._jobs[p] for p in self._queued if p in self._jobs]
+            recent = [t for t in self._drained if t >= time.monotonic() - _RATE_WINDOW_S]
+            return {
+                **self._counters,
+                "depth": len(queued),
+                "in_flight": self._in_flight,
+                "staged": len(self._jobs) - len(queued),
+                "pending_bytes": sum(j["size"] for j in queued),
+                "oldest_pending_s": round(now - min(j["spooled_at"] for j in queued), 1) if queued else 0.0,
+                "drain_rate": round(len(recent) / _RATE_WINDOW_S, 3),
+                "workers": self.workers if self._started else 0,
+            }
+
+
+write_behind_queue = WriteBehindQueue()
@@ -0,0 +1,154 @@
+"""
+storage/async_backends.py
+
+asyncio counterparts of the storage backends, with one interface:
+
+    await backend.upload(data, path)      # data is bytes
+    await backend.download(path) -> bytes
+    await backend.delete(path)
+
+- AsyncGCSBackend    — the GCS JSON API over aiohttp (optional dependency),
+                       authenticated with the application default credentials
+- AsyncMemoryBackend — shares a MemoryBackend's objects and simulates its
+                       latency with asyncio.sleep, so hundreds of requests
+                       can wait at once without threads
+- AsyncThreadBackend — runs any blocking backend (e.g. LocalFSBackend) in
+                       asyncio.to_thread
+
+async_backend_for(backend) picks the matching one for a sync backend.
+Missing objects raise FileNotFoundError, as in storage/backends.py.
+"""
+
+import asyncio
+import io
+import os
+from urllib.parse import quote
+from storage.backends import GCSBackend, MemoryBackend
+
+GCS_API = "https://storage.googleapis.com"
+GCS_SCOPE = "https://www.googleapis.com/auth/devstorage.read_write"
+
+# Max simultaneous HTTP connections per AsyncGCSBackend
+ASYNC_HTTP_LIMIT = int(os.getenv("ASYNC_HTTP_LIMIT", "100"))
+
+
+class AsyncGCSBackend:
+    name = "gcs"
+
+    def __init__(self, bucket_name, credentials=None, limit=ASYNC_HTTP_LIMIT):
+        self.bucket_name = bucket_name
+        self.limit = limit
+        self._credentials = credentials
+        self._session = None
+        self._token_lock = None
+
+    async def _headers(self):
+        if self._token_lock is None:
+            self._token_lock = asyncio.Lock()
+        async with self._token_lock:
+            if self._credentials is None:
+                import google.auth
+                self._credentials, _ = await asyncio.to_thread(google.auth.default, scopes=[GCS_SCOPE])
+            if not self._credentials.valid:
+                from google.auth.transport.requests import Request
+                # Token refresh is a blocking HTTP call; keep it off the event loop
+                await asyncio.to_thread(self._credentials.refresh, Request())
+        return {"Authorization": f"Bearer {self._credentials.token}"}
+
+    def _http(self):
+        if self._session is None or self._session.closed:
+            import aiohttp
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.limit))
+        return self._session
+
+    def _object_url(self, path):
+        return f"{GCS_API}/storage/v1/b/{self.bucket_name}/o/{quote(path, safe='')}"
+
+    async def upload(self, data, path):
+        url = f"{GCS_API}/upload/storage/v1/b/{self.bucket_name}/o"
+        headers = {**await self._headers(), "Content-Type": "application/octet-stream"}
+        async with self._http().post(url, params={"uploadType": "media", "name": path},
+                                     data=data, headers=headers) as resp:
+            resp.raise_for_status()
+
+    async def download(self, path):
+        async with self._http().get(self._object_url(path), params={"alt": "media"},
+                                    headers=await self._headers()) as resp:
+            if resp.status == 404:
+                raise FileNotFoundError(path)
+            resp.raise_for_status()
+            return await resp.read()
+
+    async def delete(self, path):
+        async with self._http().delete(self._object_url(path), headers=await self._headers()) as resp:
+            if resp.status == 404:
+                raise FileNotFoundError(path)
+            resp.raise_for_status()
+
+    async def aclose(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+class AsyncMemoryBackend:
+    name = "memory"
+
+    def __init__(self, backend=None):
+        self.backend = backend or MemoryBackend()
+
+    async def _simulate(self, n_bytes):
+        delay_s = self.backend.delay_s(n_bytes)
+        if delay_s > 0:
+            await asyncio.sleep(delay_s)
+
+    async def upload(self, data, path):
+        await self._simulate(len(data))
+        self.backend.put_object(path, data)
+
+    async def download(self, path):
+        data = self.backend.get_object(path)
+        await self._simulate(len(data) if data is not None else 0)
+        if data is None:
+            raise FileNotFoundError(path)
+        return data
+
+    async def delete(self, path):
+        await self._simulate(0)
+        if not self.backend.remove_object(path):
+            raise FileNotFoundError(path)
+
+    async def aclose(self):
+        pass
+
+
+class AsyncThreadBackend:
+    """Any blocking StorageBackend, one worker thread per call in flight."""
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.name = backend.name
+
+    async def upload(self, data, path):
+        await asyncio.to_thread(self.backend.upload, io.BytesIO(data), path)
+
+    async def download(self, path):
+        return await asyncio.to_thread(self.backend.download, path)
+
+    async def delete(self, path):
+        await asyncio.to_thread(self.backend.delete, path)
+
+    async def aclose(self):
+        pass
+
+
+def async_backend_for(backend, credentials=None):
+    """
+    The asyncio counterpart of a storage/backends.py backend. credentials
+    are for GCS; without them AsyncGCSBackend uses google.auth.default().
+    """
+    if isinstance(backend, GCSBackend):
+        return AsyncGCSBackend(backend.bucket.name, credentials)
+    if isinstance(backend, MemoryBackend):
+        return AsyncMemoryBackend(backend)
+    return AsyncThreadBackend(backend)
@@ -0,0 +1,409 @@
+"""
+storage/backends.py
+
+Object storage backends behind storage/gcs.py:
+
+- GCSBackend     — Google Cloud Storage (the production backend)
+- LocalFSBackend — a directory on local disk
+- MemoryBackend  — an in-process dict, with optional injected latency and
+                   bandwidth so benchmarks can run offline and reproducibly
+
+Every backend stores bytes under a path, raises FileNotFoundError for a
+missing object, and reports phase spans (see utils/timer.py).
+"""
+
+import io
+import os
+import random
+import tempfile
+import threading
+import time
+from utils.timer import TimedBlock
+
+
+class StorageBackend:
+    """Interface shared by all backends."""
+
+    name = "base"
+
+    def upload(self, file, path):
+        """Store the contents of the binary file object `file` at `path`."""
+        raise NotImplementedError
+
+    def download(self, path) -> bytes:
+        raise NotImplementedError
+
+    def download_range(self, path, start, end=None) -> bytes:
+        """
+        Bytes [start, end) of the object, like data[start:end] (end=None reads
+        to the end). Backends override this to fetch only the range.
+        """
+        return self.download(path)[start:end]
+
+    def delete(self, path):
+        raise NotImplementedError
+
+    def generation(self, path):
+        """
+        A value that changes whenever the object at `path` is rewritten,
+        fetched without downloading it (used to validate cached bytes).
+        """
+        raise NotImplementedError
+
+    def download_with_generation(self, path):
+        """
+        (bytes, generation) of the object. Backends override this to take
+        the generation from the download itself; this fallback asks for it
+        first, so a rewrite in between only makes the cached copy look stale.
+        """
+        generation = self.generation(path)
+        return self.download(path), generation
+
+    def open_writer(self, path, chunk_size):
+        """
+        Return a writable binary object; the object appears at `path` on
+        close(), and discard() abandons it without creating anything.
+        """
+        raise NotImplementedError
+
+
+# ── Google Cloud Storage ────────────────────────────────────────────────────
+
+class GCSBackend(StorageBackend):
+    name = "gcs"
+
+    # GCS resumable uploads need chunk sizes in multiples of 256 KiB
+    CHUNK_QUANTUM = 256 * 1024
+
+    def __init__(self, bucket_name, client=None):
+        from google.cloud import storage
+        self.client = client or storage.Client()
+        self.bucket = self.client.bucket(bucket_name)
+
+    def upload(self, file, path):
+        with TimedBlock("prepare"):
+            blob = self.bucket.blob(path)
+        with TimedBlock("send"):
+            blob.upload_from_file(file)
+
+    def download(self, path):
+        from google.api_core.exceptions import NotFound
+        with TimedBlock("prepare"):
+            blob = self.bucket.blob(path)
+        try:
+            with TimedBlock("fetch"):
+                return blob.download_as_bytes()
+        except NotFound as e:
+            raise FileNotFoundError(path) from e
+
+    def download_with_generation(self, path):
+        from google.api_core.exceptions import NotFound
+        with TimedBlock("prepare"):
+            blob = self.bucket.blob(path)
+        try:
+            with TimedBlock("fetch"):
+                data = blob.download_as_bytes()
+        except NotFound as e:
+            raise FileNotFoundError(path) from e
+        # Set from the x-goog-generation header of the download response
+        return data, blob.generation
+
+    def download_range(self, path, start, end=None):
+        from google.api_core.exceptions import NotFound, RequestRangeNotSatisfiable
+        with TimedBlock("prepare"):
+            blob = self.bucket.blob(path)
+        try:
+            with TimedBlock("fetch"):
+                # GCS ranges are inclusive of the end byte
+                return blob.download_as_bytes(start=start, end=None if end is None else end - 1)
+        except NotFound as e:
+            raise FileNotFoundError(path) from e
+        except RequestRangeNotSatisfiable:
+            # Range starts past the end of the object
+            return b""
+
+    def delete(self, path):
+        from google.api_core.exceptions import NotFound
+        blob = self.bucket.blob(path)
+        try:
+            with TimedBlock("send"):
+                blob.delete()
+        except NotFound as e:
+            raise FileNotFoundError(path) from e
+
+    def generation(self, path):
+        with TimedBlock("fetch"):
+            blob = self.bucket.get_blob(path)
+        if blob is None:
+            raise FileNotFoundError(path)
+        return blob.generation
+
+    def open_writer(self, path, chunk_size):
+        quantum = self.CHUNK_QUANTUM
+        chunk_size = max(quantum, -(-chunk_size // quantum) * quantum)
+        blob = self.bucket.blob(path, chunk_size=chunk_size)
+        return _GCSWriter(blob, chunk_size)
+
+
+class _GCSWriter:
+    """
+    blob.open("wb") plus discard(). BlobWriter finalises whatever it has
+    buffered on close(), including the implicit close when it is garbage
+    collected, so an abandoned upload would otherwise become a truncated object.
+    """
+
+    def __init__(self, blob, chunk_size):
+        self._writer = blob.open("wb", chunk_size=chunk_size)
+
+    def write(self, data):
+        return self._writer.write(data)
+
+    def close(self):
+        self._writer.close()
+
+    def discard(self):
+        """Drop the buffered data without finalising, and cancel the resumable session if one was opened."""
+        # BlobWriter has no public abort; with its buffer closed, close() sends nothing
+        self._writer._buffer.close()
+        if self._writer._upload_and_transport is not None:
+            upload, transport = self._writer._upload_and_transport
+            try:
+                # A DELETE on the session URI cancels a resumable upload
+                transport.delete(upload.resumable_url)
+            except Exception:
+                pass
+
+
+# ── Local filesystem ────────────────────────────────────────────────────────
+
+class LocalFSBackend(StorageBackend):
+    name = "local"
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        os.makedirs(self.root, exist_ok=True)
+
+    def _full_path(self, path):
+        full = os.path.abspath(os.path.join(self.root, path))
+        if not full.startswith(self.root + os.sep):
+            raise ValueError(f"Object path escapes the storage root: {path}")
+        return full
+
+    def upload(self, file, path):
+        writer = self.open_writer(path, 1024 * 1024)
+        try:
+            with TimedBlock("send"):
+                while True:
+                    chunk = file.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    writer.write(chunk)
+        except Exception:
+            writer.discard()
+            raise
+        writer.close()
+
+    def download(self, path):
+        with TimedBlock("fetch"):
+            with open(self._full_path(path), "rb") as f:
+                return f.read()
+
+    def download_range(self, path, start, end=None):
+        with TimedBlock("fetch"):
+            with open(self._full_path(path), "rb") as f:
+                f.seek(start)
+                return f.read(-1 if end is None else max(end - start, 0))
+
+    def delete(self, path):
+        with TimedBlock("send"):
+            os.remove(self._full_path(path))
+
+    def generation(self, path):
+        st = os.stat(self._full_path(path))
+        return f"{st.st_mtime_ns}-{st.st_size}"
+
+    def open_writer(self, path, chunk_size):
+        full = self._full_path(path)
+        os.makedirs(os.path.dirname(full), exist_ok=True)
+        return _AtomicFileWriter(full)
+
+
+class _AtomicFileWriter:
+    """Write to a temp file next to the target and rename it into place on close()."""
+
+    def __init__(self, target):
+        self._target = target
+        fd, self._tmp = tempfile.mkstemp(dir=os.path.dirname(target), suffix=".part")
+        self._file = os.fdopen(fd, "wb")
+
+    def write(self, data):
+        return self._file.write(data)
+
+    def close(self):
+        if self._file.closed:
+            return
+        self._file.close()
+        os.replace(self._tmp, self._target)
+
+    def discard(self):
+        self._file.close()
+        if os.path.exists(self._tmp):
+            os.remove(self._tmp)
+
+
+# ── In-memory stand-in ──────────────────────────────────────────────────────
+
+# Named network profiles for MemoryBackend: (latency_ms, bandwidth_mbps, jitter_ms)
+LATENCY_PROFILES = {
+    "none":         (0.0,   None,  0.0),
+    "lan":          (0.5,   1000,  0.1),
+    "same-region":  (8.0,   200,   2.0),
+    "cross-region": (60.0,  50,    10.0),
+}
+
+
+class MemoryBackend(StorageBackend):
+    """
+    Objects live in a dict. Each request can be slowed down to imitate a
+    network: `latency_ms` per request (plus up to `jitter_ms` of seeded
+    random jitter) and transfer time at `bandwidth_mbps` megabytes/second.
+    """
+
+    name = "memory"
+
+    def __init__(self, latency_ms=0.0, bandwidth_mbps=None, jitter_ms=0.0, seed=0):
+        self.latency_ms = latency_ms
+        self.bandwidth_mbps = bandwidth_mbps
+        self.jitter_ms = jitter_ms
+        self._objects = {}
+        self._generations = {}
+        self._next_generation = 0
+        self._lock = threading.Lock()
+        self._rng = random.Random(seed)
+
+    @classmethod
+    def from_profile(cls, profile, seed=0):
+        latency_ms, bandwidth_mbps, jitter_ms = LATENCY_PROFILES[profile]
+        return cls(latency_ms, bandwidth_mbps, jitter_ms, seed)
+
+    def delay_s(self, n_bytes):
+        """Simulated time for one request moving `n_bytes`."""
+        with self._lock:
+            jitter = self._rng.uniform(0, self.jitter_ms) if self.jitter_ms else 0.0
+        delay_s = (self.latency_ms + jitter) / 1000
+        if self.bandwidth_mbps:
+            delay_s += n_bytes / (self.bandwidth_mbps * 1024 * 1024)
+        return delay_s
+
+    def _simulate(self, n_bytes):
+        delay_s = self.delay_s(n_bytes)
+        if delay_s > 0:
+            time.sleep(delay_s)
+
+    # Object access without the simulated network, e.g. for storage/async_backends.py
+
+    def put_object(self, path, data):
+        """Store `data` at `path` under a new generation."""
+        with self._lock:
+            self._next_generation += 1
+            self._objects[path] = bytes(data)
+            self._generations[path] = self._next_generation
+
+    def get_object(self, path):
+        """The object's bytes, or None if there is no such object."""
+        with self._lock:
+            return self._objects.get(path)
+
+    def remove_object(self, path):
+        """Remove an object; returns False if there was none."""
+        with self._lock:
+            self._generations.pop(path, None)
+            return self._objects.pop(path, None) is not None
+
+    def upload(self, file, path):
+        with TimedBlock("send"):
+            data = file.read()
+            self._simulate(len(data))
+            self.put_object(path, data)
+
+    def download(self, path):
+        with TimedBlock("fetch"):
+            data = self.get_object(path)
+            if data is None:
+                self._simulate(0)
+                raise FileNotFoundError(path)
+            self._simulate(len(data))
+            return data
+
+    def download_with_generation(self, path):
+        with TimedBlock("fetch"):
+            with self._lock:
+                data, generation = self._objects.get(path), self._generations.get(path)
+            if data is None:
+                self._simulate(0)
+                raise FileNotFoundError(path)
+            self._simulate(len(data))
+            return data, generation
+
+    def download_range(self, path, start, end=None):
+        with TimedBlock("fetch"):
+            data = self.get_object(path)
+            if data is None:
+                self._simulate(0)
+                raise FileNotFoundError(path)
+            data = data[start:end]
+            self._simulate(len(data))
+            return data
+
+    def delete(self, path):
+        with TimedBlock("send"):
+            self._simulate(0)
+            if not self.remove_object(path):
+                raise FileNotFoundError(path)
+
+    def generation(self, path):
+        with TimedBlock("fetch"):
+            self._simulate(0)
+            with self._lock:
+                if path not in self._generations:
+                    raise FileNotFoundError(path)
+                return self._generations[path]
+
+    def open_writer(self, path, chunk_size):
+        return _MemoryWriter(self, path)
+
+    def clear(self):
+        with self._lock:
+            self._objects.clear()
+            self._generations.clear()
+
+
+class _MemoryWriter(io.BytesIO):
+    def __init__(self, backend, path):
+        super().__init__()
+        self._backend = backend
+        self._path = path
+
+    def close(self):
+        if not self.closed:
+            self.seek(0)
+            self._backend.upload(self, self._path)
+        super().close()
+
+    def discard(self):
+        super().close()
+
+
+def backend_from_env():
+    """
+    Build the backend selected by STORAGE_BACKEND (gcs | local | memory).
+    local uses LOCAL_STORAGE_DIR; memory uses MEMORY_STORAGE_PROFILE.
+    """
+    kind = os.getenv("STORAGE_BACKEND", "gcs").lower()
+    if kind == "gcs":
+        return GCSBackend(os.getenv("GCS_BUCKET"))
+    if kind == "local":
+        return LocalFSBackend(os.getenv("LOCAL_STORAGE_DIR", "local_storage"))
+    if kind == "memory":
+        return MemoryBackend.from_profile(os.getenv("MEMORY_STORAGE_PROFILE", "none"))
+    raise ValueError(f"Unknown STORAGE_BACKEND: {kind}")
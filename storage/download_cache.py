@@ -0,0 +1,235 @@
+"""
+storage/download_cache.py
+
+Process-wide read-through cache for downloaded document bytes, shared by
+GCS (storage/gcs.py) and Cloud SQL (db/queries.py) reads.
+
+Entries are keyed by (source, name) and carry the generation they were read
+at — the GCS object generation, a file's mtime, or the blob row's
+uploaded_at — so a lookup only hits when the caller's current generation
+matches and an overwritten object is never served. A caller that has just
+confirmed an entry's generation may trust it without asking again for
+DOWNLOAD_CACHE_TRUST_S (see get_recent). Least recently used
+entries are evicted from memory once DOWNLOAD_CACHE_MAX_BYTES is exceeded,
+and spilled to DOWNLOAD_CACHE_DISK_DIR when a disk tier is configured.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DOWNLOAD_CACHE_ENABLED = os.getenv("DOWNLOAD_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+DOWNLOAD_CACHE_MAX_BYTES = int(os.getenv("DOWNLOAD_CACHE_MAX_MB", "256")) * 1024 * 1024
+# Larger objects bypass the cache so one download can't flush everything else
+DOWNLOAD_CACHE_MAX_OBJECT_BYTES = int(os.getenv("DOWNLOAD_CACHE_MAX_OBJECT_MB", "32")) * 1024 * 1024
+# Optional second tier on local disk for entries evicted from memory
+DOWNLOAD_CACHE_DISK_DIR = os.getenv("DOWNLOAD_CACHE_DISK_DIR") or None
+DOWNLOAD_CACHE_DISK_MAX_BYTES = int(os.getenv("DOWNLOAD_CACHE_DISK_MAX_MB", "2048")) * 1024 * 1024
+# How long an entry whose generation was confirmed is served without checking again
+DOWNLOAD_CACHE_TRUST_S = float(os.getenv("DOWNLOAD_CACHE_TRUST_S", "10"))
+
+_SPILL_SUFFIX = ".cache"
+
+
+class DownloadCache:
+    """
+    Thread-safe, byte-budgeted LRU cache with an optional disk tier.
+
+    Memory entries: key -> (generation, data, fetch_ms). Disk entries:
+    key -> (generation, file path, size, fetch_ms). fetch_ms is how long the
+    read that filled the entry took, so callers can show hit vs miss latency.
+    The disk index lives in memory; spill files left by an earlier process
+    are removed on start.
+    """
+
+    def __init__(self, max_bytes=DOWNLOAD_CACHE_MAX_BYTES, disk_dir=DOWNLOAD_CACHE_DISK_DIR,
+                 disk_max_bytes=DOWNLOAD_CACHE_DISK_MAX_BYTES, max_object_bytes=DOWNLOAD_CACHE_MAX_OBJECT_BYTES):
+        self.max_bytes = max_bytes
+        self.max_object_bytes = min(max_object_bytes, max_bytes)
+        self.disk_dir = os.path.abspath(disk_dir) if disk_dir else None
+        self.disk_max_bytes = disk_max_bytes if disk_dir else 0
+        self._memory = OrderedDict()
+        self._disk = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._confirmed = {}    # key -> monotonic time its generation was last confirmed
+        self._lock = threading.Lock()
+        # Bumped on invalidate/clear so a spill that raced one isn't written back
+        self._version = 0
+        self._counters = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "stale": 0,
+                          "evictions": 0, "spills": 0, "invalidations": 0}
+        if self.disk_dir:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            for name in os.listdir(self.disk_dir):
+                if name.endswith(_SPILL_SUFFIX):
+                    os.remove(os.path.join(self.disk_dir, name))
+
+    def generation(self, key):
+        """The generation cached for `key` (either tier), or None. Doesn't count as a lookup."""
+        with self._lock:
+            entry = self._memory.get(key) or self._disk.get(key)
+            return entry[0] if entry else None
+
+    def get(self, key, generation):
+        """
+        Return (data, fetch_ms) if `key` is cached at `generation`, else None.
+        `generation` should be current, so a hit also confirms the entry.
+        """
+        return self._get(key, generation, confirm=True)
+
+    def get_recent(self, key, max_age_s=DOWNLOAD_CACHE_TRUST_S):
+        """
+        Return (data, fetch_ms) if `key` is cached and its generation was
+        confirmed (by put or get) within the last max_age_s seconds — or ever,
+        for max_age_s=None — without checking the generation. Otherwise
+        None, and nothing is counted: the caller falls back to get().
+        """
+        with self._lock:
+            confirmed = self._confirmed.get(key)
+            entry = self._memory.get(key) or self._disk.get(key)
+            if entry is None or confirmed is None:
+                return None
+            if max_age_s is not None and time.monotonic() - confirmed > max_age_s:
+                return None
+            generation = entry[0]
+        return self._get(key, generation, confirm=False)
+
+    def _get(self, key, generation, confirm):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] == generation:
+                    self._memory.move_to_end(key)
+                    self._counters["memory_hits"] += 1
+                    if confirm:
+                        self._confirmed[key] = time.monotonic()
+                    return entry[1], entry[2]
+                self._drop(key)
+                self._counters["stale"] += 1
+            entry = self._disk.get(key)
+            if entry is None:
+                self._counters["misses"] += 1
+                return None
+            if entry[0] != generation:
+                self._drop(key)
+                self._counters["stale"] += 1
+                self._counters["misses"] += 1
+                return None
+
+        try:
+            with open(entry[1], "rb") as f:
+                data = f.read()
+        except OSError:
+            with self._lock:
+                self._counters["misses"] += 1
+            return None
+        with self._lock:
+            self._counters["disk_hits"] += 1
+            confirmed = time.monotonic() if confirm else self._confirmed.get(key)
+        # Promote back to memory; put() drops the disk copy
+        self.put(key, generation, data, entry[3])
+        with self._lock:
+            if key in self._memory and confirmed is not None:
+                self._confirmed[key] = confirmed
+        return data, entry[3]
+
+    def put(self, key, generation, data, fetch_ms=None):
+        if len(data) > self.max_object_bytes:
+            return
+        data = bytes(data)
+        with self._lock:
+            self._drop(key)
+            self._memory[key] = (generation, data, fetch_ms)
+            self._confirmed[key] = time.monotonic()
+            self._memory_bytes += len(data)
+            evicted = []
+            version = self._version
+            while self._memory_bytes > self.max_bytes:
+                old_key, old = self._memory.popitem(last=False)
+                self._memory_bytes -= len(old[1])
+                self._counters["evictions"] += 1
+                evicted.append((old_key, old, self._confirmed.pop(old_key, None)))
+        for old_key, old, confirmed in evicted:
+            self._spill(version, old_key, *old, confirmed)
+
+    def _spill(self, version, key, generation, data, fetch_ms, confirmed):
+        """Write an entry evicted from memory to the disk tier, if there is one."""
+        if not self.disk_dir or len(data) > self.disk_max_bytes:
+            return
+        path = os.path.join(self.disk_dir, hashlib.sha256(repr(key).encode()).hexdigest() + _SPILL_SUFFIX)
+        fd, tmp = tempfile.mkstemp(dir=self.disk_dir, suffix=".part")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        with self._lock:
+            if key in self._memory or version != self._version:
+                # Re-read into memory or invalidated while we were writing
+                os.remove(tmp)
+                return
+            self._drop(key)
+            os.replace(tmp, path)
+            self._disk[key] = (generation, path, len(data), fetch_ms)
+            if confirmed is not None:
+                self._confirmed[key] = confirmed
+            self._disk_bytes += len(data)
+            self._counters["spills"] += 1
+            while self._disk_bytes > self.disk_max_bytes:
+                old_key, (_, old_path, size, _) = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                self._confirmed.pop(old_key, None)
+                self._remove_file(old_path)
+
+    def _drop(self, key):
+        """Remove `key` from both tiers. Caller holds the lock."""
+        self._confirmed.pop(key, None)
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= len(entry[1])
+        entry = self._disk.pop(key, None)
+        if entry is not None:
+            self._disk_bytes -= entry[2]
+            self._remove_file(entry[1])
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def invalidate(self, key):
+        """Forget `key`, e.g. after the object or row behind it was deleted."""
+        with self._lock:
+            self._version += 1
+            if key in self._memory or key in self._disk:
+                self._counters["invalidations"] += 1
+            self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            for key in list(self._memory) + list(self._disk):
+                self._drop(key)
+
+    def stats(self):
+        with self._lock:
+            hits = self._counters["memory_hits"] + self._counters["disk_hits"]
+            lookups = hits + self._counters["misses"]
+            return {
+                **self._counters,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+                "max_bytes": self.max_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_bytes,
+                "disk_max_bytes": self.disk_max_bytes,
+                "hit_ratio": round(hits / lookups, 3) if lookups else 0.0,
+            }
+
+
+download_cache = DownloadCache() if DOWNLOAD_CACHE_ENABLED else DownloadCache(max_bytes=0, disk_dir=None)
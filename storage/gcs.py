@@ -1,39 +1,219 @@
 import os
 import datetime
-from google.cloud import storage
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from storage.backends import backend_from_env
+from storage.download_cache import download_cache, DOWNLOAD_CACHE_TRUST_S
 from utils.timer import TimedBlock
 
 load_dotenv()
 
-client = storage.Client()
-bucket = client.bucket(os.getenv("GCS_BUCKET"))
+# The object store behind these helpers is chosen by STORAGE_BACKEND
+# (gcs | local | memory, see storage/backends.py) and created on first use,
+# so importing this module never builds a GCS client or looks up credentials.
+_backend = None
+_backend_factory = backend_from_env
+_backend_lock = threading.Lock()
+_override = threading.local()
 
+# Upper bound on on-demand downloads in flight across all sessions
+DOWNLOAD_CONCURRENCY = int(os.getenv("GCS_DOWNLOAD_CONCURRENCY", "4"))
+_download_slots = threading.BoundedSemaphore(DOWNLOAD_CONCURRENCY)
+
+# Prefix for deduplicated content. These objects are owned by content_objects and
+# written once under a unique name, so a cached copy never goes stale.
+CONTENT_PREFIX = "content/"
+
+
+def get_backend():
+    """Return the storage backend for this thread (an override, or the process default)."""
+    override = getattr(_override, "backend", None)
+    if override is not None:
+        return override
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = _backend_factory()
+    return _backend
+
+
+def set_backend(backend):
+    """Replace the process-wide default backend."""
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+def set_backend_factory(factory):
+    """
+    Build the default backend with `factory()` on first use instead of
+    backend_from_env — e.g. a st.cache_resource function, so every session
+    and script rerun shares one client.
+    """
+    global _backend, _backend_factory
+    with _backend_lock:
+        _backend_factory = factory
+        _backend = None
+
+
+@contextmanager
+def use_backend(backend):
+    """Route this thread's storage calls to `backend`, e.g. for an offline benchmark."""
+    previous = getattr(_override, "backend", None)
+    _override.backend = backend
+    try:
+        yield backend
+    finally:
+        _override.backend = previous
+
+
+# Phase spans the backends report to an active SpanRecorder (see utils/timer.py):
+#   prepare — building the GCS blob handle (no network)
+#   send    — the upload request(s), including any connection setup the
+#             client's HTTP session needs
+#   fetch   — the download request and response body
+#   queue   — waiting for a download slot (download_file_bounded)
 
 def upload_file(file, path):
     """Upload a file to GCS and return the path."""
-    blob = bucket.blob(path)
-    blob.upload_from_file(file)
+    backend = get_backend()
+    download_cache.invalidate((backend.name, path))
+    backend.upload(file, path)
     return path
 
 
 def upload_file_timed(file, path):
     """Upload a file to GCS and return (path, elapsed_ms)."""
-    blob = bucket.blob(path)
+    backend = get_backend()
+    download_cache.invalidate((backend.name, path))
     with TimedBlock() as t:
-        blob.upload_from_file(file)
+        backend.upload(file, path)
     return path, t.elapsed_ms
 
 
+def open_upload_stream(path, chunk_size):
+    """
+    Open a resumable-upload writer for `path`. Data is sent to GCS every
+    `chunk_size` bytes (rounded up to the 256 KiB multiple GCS requires);
+    close() finalises the object.
+    """
+    backend = get_backend()
+    download_cache.invalidate((backend.name, path))
+    return backend.open_writer(path, chunk_size)
+
+
 def download_file_timed(path):
     """Download a file from GCS and return (bytes, elapsed_ms)."""
-    blob = bucket.blob(path)
+    backend = get_backend()
+    with TimedBlock() as t:
+        data = backend.download(path)
+    return data, t.elapsed_ms
+
+
+def download_range_timed(path, start, end=None):
+    """
+    Download bytes [start, end) of an object (end=None reads to the end),
+    e.g. a file header for a preview. Returns (bytes, elapsed_ms).
+    """
+    if start < 0 or (end is not None and end < start):
+        raise ValueError(f"Invalid byte range: {start}-{end}")
+    backend = get_backend()
     with TimedBlock() as t:
-        data = blob.download_as_bytes()
+        data = backend.download_range(path, start, end) if end != start else b""
     return data, t.elapsed_ms
 
 
+def download_file_bounded(path):
+    """
+    Download a file on demand with at most DOWNLOAD_CONCURRENCY downloads
+    in flight. Returns (bytes, elapsed_ms); time spent queueing is excluded.
+    """
+    with TimedBlock("queue"):
+        _download_slots.acquire()
+    try:
+        return download_file_timed(path)
+    finally:
+        _download_slots.release()
+
+
+def _download_with_generation_bounded(backend, path):
+    """download_file_bounded, also returning the generation read with the bytes."""
+    with TimedBlock("queue"):
+        _download_slots.acquire()
+    try:
+        with TimedBlock() as t:
+            data, generation = backend.download_with_generation(path)
+        return data, generation, t.elapsed_ms
+    finally:
+        _download_slots.release()
+
+
+def download_file_cached(path):
+    """
+    download_file_bounded through the process-wide download cache.
+
+    A hit makes no request at all when the entry's generation was confirmed
+    within DOWNLOAD_CACHE_TRUST_S, or ever for content/ objects, which are
+    never rewritten. An older entry costs one metadata request (no body) to
+    check its generation. A miss is a single download whose generation
+    comes from the response itself, so a concurrent rewrite can't be cached
+    under the wrong generation. Uploads and deletes through this module
+    invalidate the entry; writes from other processes are seen once the
+    trust window has passed.
+    Returns (bytes, elapsed_ms, miss_ms): on a cache hit miss_ms is how long
+    the download that filled the cache took, on a miss it is None.
+    """
+    backend = get_backend()
+    key = (backend.name, path)
+    with TimedBlock() as t:
+        max_age_s = None if path.startswith(CONTENT_PREFIX) else DOWNLOAD_CACHE_TRUST_S
+        cached = download_cache.get_recent(key, max_age_s)
+        if cached is None and download_cache.generation(key) is not None:
+            try:
+                generation = backend.generation(path)
+            except FileNotFoundError:
+                download_cache.invalidate(key)
+                raise
+            cached = download_cache.get(key, generation)
+    if cached is not None:
+        data, miss_ms = cached
+        return data, t.elapsed_ms, miss_ms
+
+    data, generation, elapsed_ms = _download_with_generation_bounded(backend, path)
+    elapsed_ms = round(t.elapsed_ms + elapsed_ms, 2)
+    download_cache.put(key, generation, data, elapsed_ms)
+    return data, elapsed_ms, None
+
+
 def delete_file(path):
-    """Delete an object from the GCS bucket."""
-    blob = bucket.blob(path)
-    blob.delete()
+    """Delete an object from the GCS bucket. Raises FileNotFoundError if it doesn't exist."""
+    backend = get_backend()
+    download_cache.invalidate((backend.name, path))
+    backend.delete(path)
+
+
+def delete_files(paths, max_workers=8):
+    """
+    Delete many objects concurrently. Returns {path: error message or None}.
+    An object that is already gone counts as deleted.
+    """
+    backend = get_backend()
+
+    def delete_one(path):
+        download_cache.invalidate((backend.name, path))
+        try:
+            backend.delete(path)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            return path, str(e)
+        return path, None
+
+    paths = list(dict.fromkeys(paths))
+    if not paths:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(paths))) as pool:
+        return dict(pool.map(delete_one, paths))
@@ -0,0 +1,113 @@
+import asyncio
+import io
+
+import pytest
+
+from db import async_queries
+from services import async_service
+from storage.async_backends import AsyncMemoryBackend
+from storage.backends import MemoryBackend
+
+
+class CountingBackend(MemoryBackend):
+    def __init__(self):
+        super().__init__()
+        self.uploaded = set()
+
+    def put_object(self, path, data):
+        self.uploaded.add(path)
+        super().put_object(path, data)
+
+
+def test_engine_comparison_deletes_what_it_uploaded():
+    backend = CountingBackend()
+    rows = async_service.run_engine_comparison(
+        concurrency_levels=[1, 4], ops_per_client=2, sizes=[("1 KB", 1024)],
+        include_sql=False, storage_backend=backend, pool_size=3,
+    )
+    assert {(r["engine"], r["concurrency"], r["operation"]) for r in rows} == {
+        (engine, level, op) for engine in ("threaded", "asyncio") for level in (1, 4)
+        for op in ("upload", "download")
+    }
+    assert all(r["errors"] == 0 for r in rows)
+    # Both engines uploaded 1×2 + 4×2 objects, and none are left
+    assert len(backend.uploaded) == 2 * (2 + 8)
+    assert not any(backend.get_object(p) is not None for p in backend.uploaded)
+
+
+class FakeAsyncDb:
+    """Records the async_service → db.async_queries calls an upload makes."""
+
+    def __init__(self, monkeypatch, fail=None):
+        self.blobs = []
+        self.metadata = []
+        self.placements = []
+        self.fail = fail
+
+        async def create_student(*args):
+            pass
+
+        for name in ("create_student", "insert_blob_timed", "insert_metadata", "delete_blob_row"):
+            monkeypatch.setattr(async_queries, name, getattr(self, name, create_student))
+
+    async def insert_blob_timed(self, student_id, doc_type, filename, *args):
+        await asyncio.sleep(0)
+        if self.fail == "sql":
+            raise RuntimeError("sql down")
+        self.blobs.append((student_id, filename))
+        return 1.0
+
+    async def insert_metadata(self, student_id, doc_type, filename, path, size, codec, stored_size,
+                              storage_backend):
+        self.metadata.append((student_id, filename))
+        self.placements.append(storage_backend)
+
+    async def delete_blob_row(self, student_id, filename, content_hash=None):
+        self.blobs.remove((student_id, filename))
+
+
+class FailingAsyncBackend(AsyncMemoryBackend):
+    async def upload(self, data, path):
+        raise RuntimeError("gcs down")
+
+
+def upload_async(storage, placement="both"):
+    file = io.BytesIO(b"transcript")
+    file.name = "t.pdf"
+    return asyncio.run(async_service.upload_document_both_async(
+        "S1", "Ann", "Transcript", file, dedup=False, compress=False, placement=placement, storage=storage,
+    ))
+
+
+def test_async_upload_writes_metadata_after_both_stores(monkeypatch):
+    db = FakeAsyncDb(monkeypatch)
+    storage = AsyncMemoryBackend()
+    result = upload_async(storage)
+    assert db.blobs == db.metadata == [("S1", "t.pdf")]
+    assert storage.backend.get_object(result["gcs_path"]) == b"transcript"
+
+
+@pytest.mark.parametrize("fail", ["sql", "gcs"])
+def test_failed_async_upload_leaves_nothing_behind(monkeypatch, fail):
+    db = FakeAsyncDb(monkeypatch, fail=fail)
+    storage = FailingAsyncBackend() if fail == "gcs" else AsyncMemoryBackend()
+    with pytest.raises(RuntimeError, match=f"{fail} down"):
+        upload_async(storage)
+    assert db.metadata == [] and db.blobs == []
+    assert storage.backend.get_object("students/S1/t.pdf") is None
+
+
+@pytest.mark.parametrize("placement", ["sql", "gcs"])
+def test_async_upload_writes_only_the_placed_store(monkeypatch, placement):
+    db = FakeAsyncDb(monkeypatch)
+    storage = AsyncMemoryBackend()
+    result = upload_async(storage, placement)
+    assert result["storage_backend"] == placement and db.placements == [placement]
+    assert bool(db.blobs) == (placement == "sql")
+    assert (storage.backend.get_object("students/S1/t.pdf") is not None) == (placement == "gcs")
+
+
+def test_benchmark_cli_rejects_compression_on_asyncio():
+    from services.benchmark_service import main
+    with pytest.raises(SystemExit):
+        main(["--engine", "asyncio", "--compression", "gzip"])
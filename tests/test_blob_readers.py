@@ -0,0 +1,80 @@
+import gzip
+
+import pytest
+
+from db import queries
+
+CONTENT = bytes(range(256)) * 64
+
+
+class FakeCursor:
+    """Serves one documents_blob row stored under a content hash."""
+
+    def __init__(self, row):
+        self.row = row
+        self.result = None
+
+    def execute(self, query, params=None):
+        query = " ".join(query.split())
+        if "substring(file_bytes from %s for %s)" in query:
+            start, length, _ = params
+            self.result = {"chunk": memoryview(self.row["file_bytes"][start - 1:start - 1 + length])}
+            return
+        matches = params == (self.row["content_hash"],)
+        if "octet_length" in query:
+            self.result = matches and {"ctid": "(0,1)", "size": len(self.row["file_bytes"]),
+                                       "codec": self.row["codec"]}
+        else:
+            self.result = matches and {"file_bytes": memoryview(self.row["file_bytes"]), "codec": self.row["codec"]}
+
+    def fetchone(self):
+        return self.result or None
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self, row):
+        self.row = row
+
+    def cursor(self):
+        return FakeCursor(self.row)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture(params=["none", "gzip"])
+def stored(request, monkeypatch):
+    codec = request.param
+    row = {
+        "content_hash": "abc123",
+        "codec": codec,
+        "file_bytes": gzip.compress(CONTENT) if codec == "gzip" else CONTENT,
+    }
+    monkeypatch.setattr(queries, "get_conn", lambda: FakeConn(row))
+    return row
+
+
+def test_fetch_blob_timed_reads_deduplicated_content(stored):
+    data, _ = queries.fetch_blob_timed("S2", "copy.pdf", content_hash="abc123")
+    assert data == CONTENT
+
+
+def test_iter_blob_chunks_decompresses(stored):
+    chunks = list(queries.iter_blob_chunks("S2", "copy.pdf", chunk_size=1000, content_hash="abc123"))
+    assert b"".join(bytes(c) for c in chunks) == CONTENT
+    if stored["codec"] == "none":
+        assert all(len(c) <= 1000 for c in chunks)
+
+
+def test_fetch_blob_streamed_timed_reports_logical_size(stored):
+    received = bytearray()
+    size, _, _ = queries.fetch_blob_streamed_timed("S2", "copy.pdf", received.extend, 1000, content_hash="abc123")
+    assert size == len(CONTENT) and bytes(received) == CONTENT
+
+
+def test_missing_row(stored):
+    assert queries.fetch_blob_timed("S2", "copy.pdf", content_hash="other")[0] is None
+    assert list(queries.iter_blob_chunks("S2", "copy.pdf", content_hash="other")) == []
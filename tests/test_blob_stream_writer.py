@@ -0,0 +1,78 @@
+from db import queries
+
+
+class FakeLargeObject:
+    def __init__(self):
+        self.oid = 4242
+        self.data = bytearray()
+        self.closed = False
+
+    def write(self, chunk):
+        self.data += chunk
+        return len(chunk)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query, params=None):
+        self.conn.statements.append((" ".join(query.split()), params))
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self):
+        self.statements = []
+        self.lobjects = []
+        self.committed = self.rolled_back = self.closed = False
+
+    def lobject(self, oid, mode):
+        self.lobjects.append(FakeLargeObject())
+        return self.lobjects[-1]
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        self.rolled_back = True
+
+    def close(self):
+        self.closed = True
+
+
+def test_chunks_go_to_large_object_and_row_is_inserted_once(monkeypatch):
+    conn = FakeConn()
+    monkeypatch.setattr(queries, "get_conn", lambda: conn)
+
+    writer = queries.BlobStreamWriter("S1", "Transcript", "t.pdf", codec="zstd")
+    for chunk in (b"ab", b"cd", b"e"):
+        writer.write(chunk)
+    assert conn.statements == []
+    writer.commit(logical_size=12)
+
+    lobject = conn.lobjects[0]
+    assert bytes(lobject.data) == b"abcde" and lobject.closed
+    insert, unlink = conn.statements
+    assert insert[0].startswith("INSERT INTO documents_blob") and "lo_get(%s)" in insert[0]
+    assert insert[1] == ("S1", "Transcript", "t.pdf", 4242, 12, None, "zstd", 5)
+    assert unlink == ("SELECT lo_unlink(%s)", (4242,))
+    assert conn.committed and conn.closed
+
+
+def test_abort_rolls_back(monkeypatch):
+    conn = FakeConn()
+    monkeypatch.setattr(queries, "get_conn", lambda: conn)
+
+    writer = queries.BlobStreamWriter("S1", "Transcript", "t.pdf")
+    writer.write(b"abc")
+    writer.abort()
+    assert conn.rolled_back and conn.closed and not conn.committed
@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+from utils import compression
+from utils.compression import (StreamCompressor, StreamDecompressor, available_codec, choose_codec,
+                               compress_for_storage, decompress, _parse_policy)
+
+TEXT = b"Transcript line: course, grade, credits\n" * 500
+
+
+@pytest.fixture(autouse=True)
+def enabled(monkeypatch):
+    monkeypatch.setattr(compression, "COMPRESSION_ENABLED", True)
+
+
+def test_parse_policy():
+    assert _parse_policy(" Transcript=ZSTD, ID=none ,*=gzip,") == {"Transcript": "zstd", "ID": "none", "*": "gzip"}
+    with pytest.raises(ValueError):
+        _parse_policy("Transcript=brotli")
+
+
+def test_policy_by_type_and_size(monkeypatch):
+    monkeypatch.setattr(compression, "COMPRESSION_POLICY", {"Other": "gzip", "*": "none"})
+    assert choose_codec("Other", 100_000) == "gzip"
+    assert choose_codec("Certificate", 100_000) == "none"
+    assert choose_codec("Other", compression.COMPRESSION_MIN_BYTES - 1) == "none"
+    # Size unknown up front (streaming uploads)
+    assert choose_codec("Other", None) == "gzip"
+    monkeypatch.setattr(compression, "COMPRESSION_ENABLED", False)
+    assert choose_codec("Other", 100_000) == "none"
+
+
+def test_zstd_falls_back_to_gzip_without_zstandard(monkeypatch):
+    monkeypatch.setattr(compression, "_zstd", lambda: None)
+    assert available_codec("zstd") == "gzip"
+    assert available_codec("none") == "none"
+
+
+def test_compress_for_storage_round_trip(monkeypatch):
+    monkeypatch.setattr(compression, "COMPRESSION_POLICY", {"*": "gzip"})
+    stored, codec = compress_for_storage(TEXT, "Transcript")
+    assert codec == "gzip" and len(stored) < len(TEXT)
+    assert decompress(stored, codec) == TEXT
+
+
+def test_incompressible_data_is_stored_raw(monkeypatch):
+    monkeypatch.setattr(compression, "COMPRESSION_POLICY", {"*": "gzip"})
+    data = os.urandom(64 * 1024)
+    assert compress_for_storage(data, "ID") == (data, "none")
+
+
+@pytest.mark.parametrize("codec", ["none", "gzip", "zstd"])
+def test_stream_round_trip(codec):
+    if codec == "zstd" and compression._zstd() is None:
+        pytest.skip("zstandard not installed")
+    compressor = StreamCompressor(codec)
+    stored = b"".join(compressor.compress(TEXT[i:i + 1000]) for i in range(0, len(TEXT), 1000))
+    stored += compressor.flush()
+    # Whole-value and chunked reads both recover the original
+    assert decompress(stored, codec) == TEXT
+    decompressor = StreamDecompressor(codec)
+    restored = b"".join(decompressor.decompress(stored[i:i + 333]) for i in range(0, len(stored), 333))
+    assert restored + decompressor.flush() == TEXT
+
+
+def test_unknown_codec():
+    with pytest.raises(ValueError):
+        StreamCompressor("lz4")
+    with pytest.raises(ValueError):
+        decompress(b"", "lz4")
@@ -0,0 +1,155 @@
+import threading
+
+import pytest
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_INTRANS
+from psycopg2.pool import PoolError
+
+from db import connection
+from db.connection import ConnectionPool, PooledConnection, pooling, pooling_enabled
+
+
+class FakeConn:
+    """Just enough of a psycopg2 connection for the pool."""
+
+    def __init__(self):
+        self.closed = 0
+        self.status = TRANSACTION_STATUS_IDLE
+        self.rollbacks = 0
+
+    def get_transaction_status(self):
+        return self.status
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.status = TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+def make_pool(**kwargs):
+    opened = []
+
+    def connect():
+        conn = FakeConn()
+        opened.append(conn)
+        return conn
+
+    kwargs.setdefault("timeout_s", 0.05)
+    return ConnectionPool(connect_fn=connect, **kwargs), opened
+
+
+def test_released_connection_is_reused():
+    pool, opened = make_pool(max_size=2)
+    conn = pool.acquire()
+    pool.release(conn)
+    assert pool.acquire() is conn
+    assert len(opened) == 1
+    assert pool.stats()["hits"] == 1
+
+
+def test_release_rolls_back_open_transaction():
+    pool, _ = make_pool()
+    conn = pool.acquire()
+    conn.status = TRANSACTION_STATUS_INTRANS
+    pool.release(conn)
+    assert conn.rollbacks == 1
+
+
+def test_acquire_times_out_when_full():
+    pool, _ = make_pool(max_size=1)
+    pool.acquire()
+    with pytest.raises(PoolError):
+        pool.acquire()
+    assert pool.stats()["waits"] == 1
+
+
+def test_waiting_acquire_gets_released_connection():
+    pool, _ = make_pool(max_size=1, timeout_s=5)
+    conn = pool.acquire()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+    waiter.start()
+    pool.release(conn)
+    waiter.join(5)
+    assert got == [conn]
+
+
+def test_closed_connection_is_replaced():
+    pool, opened = make_pool(ping_after_s=0)
+    conn = pool.acquire()
+    pool.release(conn)
+    conn.closed = 1
+    assert pool.acquire() is not conn
+    assert len(opened) == 2
+    assert pool.stats()["failed_checks"] == 1
+
+
+def test_idle_connections_recycled_down_to_min_size():
+    pool, _ = make_pool(min_size=1, max_size=3, idle_recycle_s=0)
+    conns = [pool.acquire() for _ in range(3)]
+    for conn in conns:
+        pool.release(conn)
+    pool.acquire()
+    stats = pool.stats()
+    assert stats["recycled"] == 2
+    assert stats["size"] == 1
+
+
+def test_warm_opens_min_size():
+    pool, opened = make_pool(min_size=3, max_size=5)
+    pool.warm()
+    assert len(opened) == 3
+    assert pool.stats()["idle"] == 3
+    pool.warm()
+    assert len(opened) == 3
+
+
+def test_close_all_closes_checked_out_connections_on_release():
+    pool, _ = make_pool(max_size=2)
+    idle, busy = pool.acquire(), pool.acquire()
+    pool.release(idle)
+    pool.close_all()
+    assert idle.closed
+    pool.release(busy)
+    assert busy.closed
+    assert pool.stats()["size"] == 0
+
+
+def test_pooling_override_is_per_thread():
+    seen = []
+    with pooling(False):
+        assert not pooling_enabled()
+        other = threading.Thread(target=lambda: seen.append(pooling_enabled()))
+        other.start()
+        other.join()
+    assert seen == [connection.POOL_ENABLED]
+    assert pooling_enabled() == connection.POOL_ENABLED
+
+
+def test_use_pool_routes_get_conn_to_that_pool():
+    pool, opened = make_pool()
+    with connection.use_pool(pool):
+        conn = connection.get_conn()
+        conn.close()
+    assert len(opened) == 1
+    assert pool.stats()["idle"] == 1
+
+
+def test_discarded_connection_is_closed_and_frees_its_slot():
+    pool, opened = make_pool(max_size=1)
+    PooledConnection(pool, pool.acquire()).discard()
+    assert opened[0].closed
+    assert pool.acquire() is not opened[0]
+    assert len(opened) == 2
+
+
+def test_pool_stats_does_not_create_the_shared_pool(monkeypatch):
+    monkeypatch.setattr(connection, "_pool", None)
+    monkeypatch.setattr(connection, "ConnectionPool", lambda *a, **k: pytest.fail("pool created"))
+    assert connection.pool_stats() is None
+    assert connection._pool is None
+
+    pool, _ = make_pool()
+    monkeypatch.setattr(connection, "_pool", pool)
+    assert connection.pool_stats()["size"] == 0
@@ -0,0 +1,142 @@
+import io
+import os
+
+import pytest
+
+from services import document_service
+from storage.backends import LocalFSBackend, MemoryBackend
+from storage.gcs import use_backend
+
+
+class FakeDb:
+    """Records the document_service → db.queries calls an upload makes."""
+
+    def __init__(self, monkeypatch, fail=None):
+        self.blobs = []
+        self.metadata = []
+        self.fail = fail
+        monkeypatch.setattr(document_service, "create_student", lambda *a: None)
+        monkeypatch.setattr(document_service, "insert_blob_timed", self.insert_blob_timed)
+        monkeypatch.setattr(document_service, "insert_metadata", self.insert_metadata)
+        monkeypatch.setattr(document_service, "delete_blob_row", self.delete_blob_row)
+
+    def insert_blob_timed(self, student_id, doc_type, filename, *args):
+        if self.fail == "sql":
+            raise RuntimeError("sql down")
+        self.blobs.append((student_id, filename))
+        return 1.0
+
+    def insert_metadata(self, student_id, doc_type, filename, *args):
+        if self.fail == "metadata":
+            raise RuntimeError("metadata insert failed")
+        self.metadata.append((student_id, filename))
+
+    def delete_blob_row(self, student_id, filename, content_hash=None):
+        self.blobs.remove((student_id, filename))
+
+
+class FailingBackend(MemoryBackend):
+    def upload(self, file, path):
+        raise RuntimeError("gcs down")
+
+
+def upload(concurrent, backend):
+    file = io.BytesIO(b"transcript")
+    file.name = "t.pdf"
+    with use_backend(backend):
+        return document_service.upload_document_both(
+            "S1", "Ann", "Transcript", file, concurrent=concurrent, dedup=False, compress=False,
+            placement="both",
+        )
+
+
+def gcs_has(backend, path):
+    try:
+        backend.download(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+@pytest.mark.parametrize("concurrent", [True, False])
+def test_upload_writes_both_stores(monkeypatch, concurrent):
+    db, backend = FakeDb(monkeypatch), MemoryBackend()
+    result = upload(concurrent, backend)
+    assert db.blobs == db.metadata == [("S1", "t.pdf")]
+    assert gcs_has(backend, result["gcs_path"])
+
+
+@pytest.mark.parametrize("concurrent", [True, False])
+def test_sql_failure_removes_gcs_object(monkeypatch, concurrent):
+    db, backend = FakeDb(monkeypatch, fail="sql"), MemoryBackend()
+    with pytest.raises(RuntimeError, match="sql down"):
+        upload(concurrent, backend)
+    assert db.metadata == []
+    assert not gcs_has(backend, "students/S1/t.pdf")
+
+
+@pytest.mark.parametrize("concurrent", [True, False])
+def test_gcs_failure_removes_blob_row(monkeypatch, concurrent):
+    db = FakeDb(monkeypatch)
+    with pytest.raises(RuntimeError, match="gcs down"):
+        upload(concurrent, FailingBackend())
+    assert db.blobs == db.metadata == []
+
+
+@pytest.mark.parametrize("concurrent", [True, False])
+def test_metadata_failure_removes_both_writes(monkeypatch, concurrent):
+    db, backend = FakeDb(monkeypatch, fail="metadata"), MemoryBackend()
+    with pytest.raises(RuntimeError, match="metadata insert failed"):
+        upload(concurrent, backend)
+    assert db.blobs == []
+    assert not gcs_has(backend, "students/S1/t.pdf")
+
+
+def test_range_read_of_failed_write_behind_upload_uses_cloud_sql(monkeypatch):
+    calls = []
+
+    def fetch_blob_range_timed(student_id, filename, start, end, content_hash):
+        calls.append((student_id, filename, start, end))
+        return b"tran", "none", 1.0
+
+    monkeypatch.setattr(document_service, "fetch_blob_range_timed", fetch_blob_range_timed)
+    doc = {"student_id": "S1", "filename": "t.pdf", "gcs_object_name": "students/S1/t.pdf",
+           "storage_backend": "both", "upload_status": "failed", "codec": "none"}
+    with use_backend(MemoryBackend()):
+        assert document_service.read_document_range(doc, 0, 4) == (b"tran", 1.0)
+    assert calls == [("S1", "t.pdf", 0, 4)]
+
+
+class BrokenFile(io.BytesIO):
+    """Fails partway through, like a client that disconnects mid-upload."""
+
+    name = "big.pdf"
+
+    def read(self, size=-1):
+        if self.tell() >= 1024:
+            raise OSError("connection reset")
+        return super().read(size)
+
+
+def test_failed_streaming_upload_leaves_no_partial_file(monkeypatch, tmp_path):
+    FakeDb(monkeypatch)
+    backend = LocalFSBackend(str(tmp_path))
+    with use_backend(backend), pytest.raises(OSError, match="connection reset"):
+        document_service.upload_document_streaming(
+            "S1", "Ann", "Transcript", BrokenFile(b"x" * 4096), chunk_size=512,
+            dedup=False, compress=False, placement="gcs",
+        )
+    assert [f for _, _, files in os.walk(tmp_path) for f in files] == []
+
+
+def test_deduplicated_upload_reports_the_status_its_row_was_given(monkeypatch):
+    FakeDb(monkeypatch)
+    monkeypatch.setattr(document_service, "attach_existing_content", lambda *a: {
+        "gcs_object_name": "content/ab/abc-1234", "file_size_bytes": 10, "codec": "none",
+        "stored_size_bytes": 10, "storage_backend": "both", "upload_status": "pending",
+    })
+    file = io.BytesIO(b"transcript")
+    file.name = "t.pdf"
+    with use_backend(MemoryBackend()):
+        result = document_service.upload_document_both("S1", "Ann", "Transcript", file, compress=False)
+    assert result["deduplicated"] and result["upload_status"] == "pending"
@@ -0,0 +1,137 @@
+import io
+
+import pytest
+
+from storage import gcs
+from storage.backends import MemoryBackend
+from storage.download_cache import DownloadCache
+
+
+class CountingBackend(MemoryBackend):
+    def __init__(self):
+        super().__init__()
+        self.calls = []
+
+    def generation(self, path):
+        self.calls.append("generation")
+        return super().generation(path)
+
+    def download(self, path):
+        self.calls.append("download")
+        return super().download(path)
+
+    def download_with_generation(self, path):
+        self.calls.append("download")
+        return super().download_with_generation(path)
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    backend = CountingBackend()
+    monkeypatch.setattr(gcs, "download_cache", DownloadCache(max_bytes=1024 * 1024, disk_dir=None))
+    with gcs.use_backend(backend):
+        yield backend
+
+
+def test_lru_evicts_oldest_entry():
+    cache = DownloadCache(max_bytes=10, disk_dir=None)
+    cache.put("a", 1, b"aaaa")
+    cache.put("b", 1, b"bbbb")
+    assert cache.get("a", 1) == (b"aaaa", None)
+    cache.put("c", 1, b"cccc")
+    assert cache.get("b", 1) is None
+    assert cache.get("a", 1) is not None and cache.get("c", 1) is not None
+    assert cache.stats()["evictions"] == 1
+
+
+def test_stale_generation_is_dropped():
+    cache = DownloadCache(max_bytes=1024, disk_dir=None)
+    cache.put("a", 1, b"old")
+    assert cache.get("a", 2) is None
+    assert cache.generation("a") is None
+    assert cache.stats()["stale"] == 1
+
+
+def test_evicted_entries_spill_to_disk_and_come_back(tmp_path):
+    cache = DownloadCache(max_bytes=8, disk_dir=str(tmp_path))
+    cache.put("a", 1, b"aaaa", 5.0)
+    cache.put("b", 1, b"bbbbbb")
+    assert cache.stats()["disk_entries"] == 1
+    assert cache.get("a", 1) == (b"aaaa", 5.0)
+    assert cache.stats()["disk_hits"] == 1
+    # Promoting "a" pushed "b" out to disk in turn
+    assert cache.generation("b") == 1
+
+
+def test_get_recent_only_trusts_recently_confirmed_entries(monkeypatch):
+    cache = DownloadCache(max_bytes=1024, disk_dir=None)
+    now = [100.0]
+    monkeypatch.setattr("storage.download_cache.time.monotonic", lambda: now[0])
+    cache.put("a", 1, b"data")
+    now[0] += 5
+    assert cache.get_recent("a", max_age_s=10) == (b"data", None)
+    now[0] += 10
+    assert cache.get_recent("a", max_age_s=10) is None
+    assert cache.get_recent("a", max_age_s=None) is not None
+    # A checked get() confirms the entry again
+    cache.get("a", 1)
+    assert cache.get_recent("a", max_age_s=10) is not None
+
+
+def test_confirmation_times_dont_outlive_evicted_entries():
+    cache = DownloadCache(max_bytes=4, disk_dir=None)
+    for i in range(10):
+        cache.put(i, 1, b"xxxx")
+    assert list(cache._confirmed) == [9]
+
+
+def test_cache_hit_makes_no_request(backend):
+    backend.put_object("students/1/a.pdf", b"pdf bytes")
+    data, _, miss_ms = gcs.download_file_cached("students/1/a.pdf")
+    assert data == b"pdf bytes" and miss_ms is None
+    assert backend.calls == ["download"]
+
+    data, _, miss_ms = gcs.download_file_cached("students/1/a.pdf")
+    assert data == b"pdf bytes" and miss_ms is not None
+    assert backend.calls == ["download"]
+
+
+def test_expired_entry_is_checked_and_rewrite_is_fetched(backend, monkeypatch):
+    monkeypatch.setattr(gcs, "DOWNLOAD_CACHE_TRUST_S", 0)
+    backend.put_object("students/1/a.pdf", b"v1")
+    gcs.download_file_cached("students/1/a.pdf")
+    data, _, miss_ms = gcs.download_file_cached("students/1/a.pdf")
+    assert data == b"v1" and miss_ms is not None
+    assert backend.calls == ["download", "generation"]
+
+    backend.put_object("students/1/a.pdf", b"v2")
+    data, _, miss_ms = gcs.download_file_cached("students/1/a.pdf")
+    assert data == b"v2" and miss_ms is None
+    assert backend.calls == ["download", "generation", "generation", "download"]
+
+
+def test_content_objects_are_trusted_past_the_window(backend, monkeypatch):
+    monkeypatch.setattr(gcs, "DOWNLOAD_CACHE_TRUST_S", 0)
+    path = gcs.CONTENT_PREFIX + "ab/abcdef-1234"
+    backend.put_object(path, b"shared")
+    gcs.download_file_cached(path)
+    gcs.download_file_cached(path)
+    assert backend.calls == ["download"]
+
+
+def test_upload_drops_cached_copy(backend):
+    backend.put_object("students/1/a.pdf", b"v1")
+    gcs.download_file_cached("students/1/a.pdf")
+    gcs.upload_file(io.BytesIO(b"v2"), "students/1/a.pdf")
+    data, _, miss_ms = gcs.download_file_cached("students/1/a.pdf")
+    assert data == b"v2" and miss_ms is None
+
+
+def test_deleted_object_is_not_served(backend, monkeypatch):
+    monkeypatch.setattr(gcs, "DOWNLOAD_CACHE_TRUST_S", 0)
+    backend.put_object("students/1/a.pdf", b"v1")
+    gcs.download_file_cached("students/1/a.pdf")
+    backend.remove_object("students/1/a.pdf")
+    with pytest.raises(FileNotFoundError):
+        gcs.download_file_cached("students/1/a.pdf")
+    assert gcs.download_cache.generation(("memory", "students/1/a.pdf")) is None
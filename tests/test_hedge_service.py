@@ -0,0 +1,116 @@
+import threading
+
+import pytest
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE
+
+from db import queries
+from db.connection import ConnectionPool, PooledConnection
+from services.hedge_service import HedgedReader
+
+
+@pytest.fixture
+def reader():
+    reader = HedgedReader(pct=90, window=100, min_samples=5, initial_delay_ms=50, min_delay_ms=2, max_workers=4)
+    yield reader
+    reader.close()
+
+
+def test_size_classes_are_factor_four_buckets():
+    assert HedgedReader.size_class(0) == 0
+    assert HedgedReader.size_class(4095) == 0
+    assert HedgedReader.size_class(4096) == 1
+    assert HedgedReader.size_class(16383) == 1
+    assert HedgedReader.size_class(16384) == 2
+
+
+def test_initial_delay_until_enough_samples(reader):
+    for ms in (10, 20, 30, 40):
+        reader.observe("gcs", 1000, ms)
+    assert reader.delay_ms("gcs", 1000) == 50
+
+
+def test_delay_is_the_percentile_of_its_own_window(reader):
+    for ms in range(1, 11):
+        reader.observe("gcs", 1000, ms * 10)
+        reader.observe("sql", 1000, ms)
+    assert reader.delay_ms("gcs", 1000) == 91
+    assert reader.delay_ms("sql", 1000) == 9.1
+    # Another size class has no samples yet
+    assert reader.delay_ms("gcs", 1024 * 1024) == 50
+
+
+def test_delay_never_drops_below_the_floor(reader):
+    for _ in range(10):
+        reader.observe("sql", 1000, 0.1)
+    assert reader.delay_ms("sql", 1000) == 2
+
+
+def test_slow_primary_is_hedged(reader):
+    release = threading.Event()
+
+    def slow(canceller):
+        release.wait(1)
+        return b"primary"
+
+    try:
+        data, _, source, hedged = reader.read(("gcs", slow), ("sql", lambda c: b"secondary"), 1000, delay_ms=1)
+    finally:
+        release.set()
+    assert (data, source, hedged) == (b"secondary", "sql", True)
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, query, params=None):
+        if self.conn.on_execute:
+            self.conn.on_execute()
+
+    def fetchone(self):
+        return {"file_bytes": memoryview(b"data"), "codec": "none"}
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self):
+        self.closed = 0
+        self.on_execute = None
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def get_transaction_status(self):
+        return TRANSACTION_STATUS_IDLE
+
+    def cancel(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = ConnectionPool(min_size=0, max_size=2, connect_fn=FakeConn)
+    monkeypatch.setattr(queries, "get_conn", lambda: PooledConnection(pool, pool.acquire()))
+    return pool
+
+
+def test_connection_is_pooled_after_a_normal_read(pool):
+    queries.fetch_blob_timed("S1", "a.pdf", canceller=queries.QueryCanceller())
+    assert pool.stats()["idle"] == 1
+
+
+def test_connection_is_discarded_once_cancelled(pool):
+    canceller = queries.QueryCanceller()
+    conn = pool.acquire()
+    pool.release(conn)
+    # The cancel arrives while the query runs, but the read still completes
+    conn.on_execute = canceller.cancel
+    data, _ = queries.fetch_blob_timed("S1", "a.pdf", canceller=canceller)
+    assert data == b"data"
+    assert conn.closed
+    assert pool.stats()["idle"] == 0 and pool.stats()["size"] == 0
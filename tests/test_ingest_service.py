@@ -0,0 +1,93 @@
+import io
+import zipfile
+
+import pytest
+
+from services import ingest_service
+from storage.backends import MemoryBackend
+from storage.gcs import use_backend
+
+
+def make_zip(files):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as zf:
+        for name, data in files.items():
+            zf.writestr(name, data)
+    buf.seek(0)
+    return buf
+
+
+class FakeDb:
+    def __init__(self, monkeypatch, fail_batches=()):
+        self.blobs, self.metadata = [], []
+        self.batches = 0
+        self.fail_batches = fail_batches
+        monkeypatch.setattr(ingest_service, "upsert_students", lambda students: list(students))
+        monkeypatch.setattr(ingest_service, "insert_blobs_many", self.insert_blobs_many)
+
+    def insert_blobs_many(self, rows, metadata_rows=()):
+        self.batches += 1
+        if self.batches in self.fail_batches:
+            raise RuntimeError("insert failed")
+        self.blobs.extend(rows)
+        self.metadata.extend(metadata_rows)
+        return 1.0
+
+
+@pytest.fixture
+def backend():
+    backend = MemoryBackend()
+    with use_backend(backend):
+        yield backend
+
+
+def test_zip_keeps_subfolders_in_filename():
+    items = ingest_service.items_from_zip(make_zip({
+        "S1/a/report.pdf": b"first",
+        "S1/b/report.pdf": b"second",
+        "S2/id.png": b"id",
+    }))
+    assert sorted((i["student_id"], i["filename"]) for i in items) == [
+        ("S1", "a/report.pdf"), ("S1", "b/report.pdf"), ("S2", "id.png"),
+    ]
+
+
+def test_zip_files_in_subfolders_are_stored_separately(monkeypatch, backend):
+    db = FakeDb(monkeypatch)
+    items = ingest_service.items_from_zip(make_zip({"S1/a/report.pdf": b"first", "S1/b/report.pdf": b"second"}))
+    job = ingest_service.bulk_ingest(items, max_workers=2)
+    assert job["files"] == 2 and job["failed"] == []
+    assert backend.download("students/S1/a/report.pdf") == b"first"
+    assert backend.download("students/S1/b/report.pdf") == b"second"
+
+
+def test_duplicate_student_and_filename_is_reported(monkeypatch, backend):
+    db = FakeDb(monkeypatch)
+    items = [
+        ingest_service.make_item("S1", "Ann", "Other", "report.pdf", lambda: b"first"),
+        ingest_service.make_item("S1", "Ann", "Other", "report.pdf", lambda: b"second"),
+    ]
+    job = ingest_service.bulk_ingest(items, max_workers=2)
+    assert job["files"] == 1
+    assert [(f["student_id"], f["filename"]) for f in job["failed"]] == [("S1", "report.pdf")]
+    assert backend.download("students/S1/report.pdf") == b"first"
+    assert len(db.metadata) == 1
+
+
+def test_failed_batch_removes_its_objects_and_keeps_earlier_batches(monkeypatch, backend):
+    monkeypatch.setattr(ingest_service, "INGEST_SQL_BATCH_BYTES", 1)
+    db = FakeDb(monkeypatch, fail_batches=(2,))
+    items = [
+        ingest_service.make_item("S1", "Ann", "Other", f"f{i}.pdf", lambda i=i: b"x" * (i + 1))
+        for i in range(3)
+    ]
+    job = ingest_service.bulk_ingest(items, max_workers=1)
+
+    assert job["files"] == 2
+    assert len(job["failed"]) == 1
+    failed_path = f"students/S1/{job['failed'][0]['filename']}"
+    with pytest.raises(FileNotFoundError):
+        backend.download(failed_path)
+    for row in db.metadata:
+        assert backend.download(row[3])
+    assert len(db.metadata) == len(db.blobs) == 2
@@ -0,0 +1,98 @@
+import datetime
+
+from db import queries
+from db.search_cache import SearchCache, search_key
+
+
+def test_search_key_normalises_equivalent_filters():
+    assert search_key(" S1 ", "All", " Report ", None, None) == search_key("S1", None, "report", None, None)
+    assert search_key("", "", "", None, None)[:3] == (None, None, None)
+    key = search_key("S1", "pdf", None, datetime.date(2024, 1, 1), None, 20, (datetime.date(2024, 2, 1), "S1", "a"))
+    assert key == ("S1", "pdf", None, "2024-01-01", None, 20, ("2024-02-01", "S1", "a"))
+
+
+def test_hit_after_put():
+    cache = SearchCache(max_entries=4, ttl_s=60)
+    hit, _, version = cache.get("k")
+    assert not hit
+    cache.put("k", ["row"], version)
+    assert cache.get("k")[:2] == (True, ["row"])
+    assert cache.stats()["hit_ratio"] == 0.5
+
+
+def test_lru_eviction():
+    cache = SearchCache(max_entries=2, ttl_s=60)
+    for key in ("a", "b"):
+        cache.put(key, key, cache.get(key)[2])
+    cache.get("a")
+    cache.put("c", "c", cache.get("c")[2])
+    assert cache.get("b")[0] is False
+    assert cache.get("a")[0] and cache.get("c")[0]
+
+
+def test_expired_entries_miss(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("db.search_cache.time.monotonic", lambda: now[0])
+    cache = SearchCache(max_entries=4, ttl_s=60)
+    cache.put("k", "v", cache.get("k")[2])
+    now[0] += 61
+    assert cache.get("k")[0] is False
+    assert cache.stats()["expirations"] == 1
+
+
+def test_invalidate_student_drops_matching_and_unfiltered_searches():
+    cache = SearchCache(max_entries=8, ttl_s=60)
+    keys = [search_key(sid, None, None, None, None) for sid in ("S1", "S2", None)]
+    for key in keys:
+        cache.put(key, "rows", cache.get(key)[2])
+    cache.invalidate_student(" S1 ")
+    assert [cache.get(key)[0] for key in keys] == [False, True, False]
+
+
+def test_put_from_before_an_invalidation_is_ignored():
+    cache = SearchCache(max_entries=4, ttl_s=60)
+    key = search_key("S1", None, None, None, None)
+    _, _, version = cache.get(key)
+    # A write lands while the search is running
+    cache.invalidate_student("S1")
+    cache.put(key, "stale rows", version)
+    assert cache.get(key)[0] is False
+
+
+class RecordingCursor:
+    def __init__(self, executed):
+        self.executed = executed
+
+    def execute(self, query, params=None):
+        self.executed.append(params)
+
+    def fetchall(self):
+        return []
+
+    def close(self):
+        pass
+
+
+class RecordingConn:
+    def __init__(self, executed):
+        self.executed = executed
+
+    def cursor(self):
+        return RecordingCursor(self.executed)
+
+    def close(self):
+        pass
+
+
+def test_search_runs_the_query_its_cache_key_describes(monkeypatch):
+    executed = []
+    monkeypatch.setattr(queries, "get_conn", lambda: RecordingConn(executed))
+    monkeypatch.setattr(queries, "search_cache", SearchCache(max_entries=8, ttl_s=60))
+    queries.search_documents(" S1 ", "All", " Report ")
+    assert executed == [["S1", "%report%"]]
+    # Same key, so served from the cache
+    queries.search_documents("S1", None, "report")
+    assert len(executed) == 1
+    queries.search_cache.invalidate_student(" S1")
+    queries.search_documents_page("S1 ", None, "REPORT", limit=5)
+    assert executed[-1] == ["S1", "%report%", 6]
@@ -0,0 +1,43 @@
+import pytest
+
+from utils.stats import bootstrap_ci, mann_whitney_u, percentile, stddev, summarize
+
+
+def test_percentile_interpolates_like_numpy():
+    values = [40, 10, 30, 20]
+    assert percentile(values, 0) == 10
+    assert percentile(values, 50) == 25
+    assert percentile(values, 90) == pytest.approx(37)
+    assert percentile(values, 100) == 40
+    assert percentile([], 50) == 0.0
+
+
+def test_stddev_is_the_sample_deviation():
+    assert stddev([2, 4, 4, 4, 5, 5, 7, 9]) == pytest.approx(2.138, abs=1e-3)
+    assert stddev([5]) == 0.0
+
+
+def test_bootstrap_ci_is_seeded_and_brackets_the_mean():
+    values = [float(v) for v in range(1, 51)]
+    low, high = bootstrap_ci(values)
+    assert low < 25.5 < high
+    assert bootstrap_ci(values) == (low, high)
+
+
+def test_summarize_empty_and_single_samples():
+    assert summarize([])["n"] == 0
+    single = summarize([7.0])
+    assert single["p50"] == single["p99"] == single["ci95_low"] == single["ci95_high"] == 7.0
+
+
+def test_mann_whitney_separated_samples():
+    # scipy.stats.mannwhitneyu(a, b, method="asymptotic") gives 0.01219
+    a, b = [1, 2, 3, 4, 5], [6, 7, 8, 9, 10]
+    assert mann_whitney_u(a, b) == pytest.approx(0.01219, abs=1e-4)
+    assert mann_whitney_u(b, a) == mann_whitney_u(a, b)
+
+
+def test_mann_whitney_overlapping_samples_are_not_significant():
+    assert mann_whitney_u([1, 3, 5, 7], [2, 4, 6, 8]) > 0.5
+    assert mann_whitney_u([3, 3, 3], [3, 3]) == 1.0
+    assert mann_whitney_u([], [1, 2]) == 1.0
@@ -0,0 +1,137 @@
+import io
+import json
+import os
+import time
+
+import pytest
+
+from services import write_behind_service
+from services.write_behind_service import WriteBehindQueue
+from storage.backends import MemoryBackend
+
+
+class FlakyBackend(MemoryBackend):
+    def __init__(self, failures=0):
+        super().__init__()
+        self.failures = failures
+
+    def upload(self, file, path):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("GCS unavailable")
+        super().upload(file, path)
+
+
+@pytest.fixture
+def stores(monkeypatch):
+    """The backend the workers upload to, and the upload_status each path was set to."""
+    backend = FlakyBackend()
+    statuses = {}
+    referenced = {"value": True}
+
+    def set_upload_status(path, status):
+        statuses[path] = status
+        return referenced["value"]
+
+    monkeypatch.setattr(write_behind_service, "get_backend", lambda: backend)
+    monkeypatch.setattr(write_behind_service, "set_upload_status", set_upload_status)
+    monkeypatch.setattr(write_behind_service, "delete_file", backend.delete)
+    return backend, statuses, referenced
+
+
+def wait_for(condition, timeout_s=2.0):
+    deadline = time.monotonic() + timeout_s
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.005)
+
+
+def make_queue(spool_dir, **kwargs):
+    kwargs.setdefault("workers", 1)
+    kwargs.setdefault("retry_base_s", 0.01)
+    return WriteBehindQueue(spool_dir=str(spool_dir), **kwargs)
+
+
+def test_spooled_object_is_uploaded_and_committed(tmp_path, stores):
+    backend, statuses, _ = stores
+    wbq = make_queue(tmp_path)
+    wbq.spool_timed(io.BytesIO(b"data"), "students/1/a.pdf")
+    assert wbq.read_spooled("students/1/a.pdf") == b"data"
+    wbq.enqueue("students/1/a.pdf")
+    wait_for(lambda: statuses.get("students/1/a.pdf") == "committed" and not wbq.is_pending("students/1/a.pdf"))
+    assert backend.get_object("students/1/a.pdf") == b"data"
+    wait_for(lambda: os.listdir(tmp_path) == [])
+
+
+def test_jobs_left_in_the_spool_are_recovered(tmp_path, stores):
+    backend, statuses, _ = stores
+    crashed = make_queue(tmp_path, workers=0)
+    crashed.spool_timed(io.BytesIO(b"queued"), "students/1/a.pdf")
+    crashed.enqueue("students/1/a.pdf")
+    # Leftovers of an upload call that died mid-spool
+    (tmp_path / "x.part").write_bytes(b"partial")
+    (tmp_path / "orphan.data").write_bytes(b"no job file")
+
+    wbq = make_queue(tmp_path)
+    wbq.start()
+    assert wbq.stats()["recovered"] == 1
+    wait_for(lambda: statuses.get("students/1/a.pdf") == "committed")
+    assert backend.get_object("students/1/a.pdf") == b"queued"
+    wait_for(lambda: os.listdir(tmp_path) == [])
+
+
+def test_failed_upload_is_retried(tmp_path, stores):
+    backend, statuses, _ = stores
+    backend.failures = 2
+    wbq = make_queue(tmp_path, max_attempts=5)
+    wbq.spool_timed(io.BytesIO(b"data"), "students/1/a.pdf")
+    wbq.enqueue("students/1/a.pdf")
+    wait_for(lambda: statuses.get("students/1/a.pdf") == "committed")
+    assert wbq.stats()["retries"] == 2
+
+
+def test_job_fails_after_max_attempts_and_keeps_its_spool(tmp_path, stores):
+    backend, statuses, _ = stores
+    backend.failures = 100
+    wbq = make_queue(tmp_path, max_attempts=2)
+    wbq.spool_timed(io.BytesIO(b"data"), "students/1/a.pdf")
+    wbq.enqueue("students/1/a.pdf")
+    wait_for(lambda: statuses.get("students/1/a.pdf") == "failed" and not wbq.is_pending("students/1/a.pdf"))
+    assert wbq.read_spooled("students/1/a.pdf") == b"data"
+    assert wbq.stats()["failed"] == 1
+
+
+def test_unreferenced_object_is_removed_from_gcs(tmp_path, stores):
+    backend, statuses, referenced = stores
+    referenced["value"] = False
+    wbq = make_queue(tmp_path)
+    wbq.spool_timed(io.BytesIO(b"data"), "students/1/a.pdf")
+    wbq.enqueue("students/1/a.pdf")
+    wait_for(lambda: wbq.stats()["orphans_removed"] == 1)
+    assert backend.get_object("students/1/a.pdf") is None
+
+
+def test_discarded_job_is_never_uploaded(tmp_path, stores):
+    wbq = make_queue(tmp_path)
+    wbq.spool_timed(io.BytesIO(b"data"), "students/1/a.pdf")
+    wbq.discard("students/1/a.pdf")
+    assert not wbq.is_pending("students/1/a.pdf")
+    assert os.listdir(tmp_path) == []
+
+
+def test_start_drains_an_existing_spool(tmp_path, stores):
+    backend, statuses, _ = stores
+    # A spool as a previous process left it: data plus job file, nothing uploaded
+    earlier = make_queue(tmp_path, workers=0)
+    data_file, job_file = earlier._files("students/1/a.pdf")
+    with open(data_file, "wb") as f:
+        f.write(b"left behind")
+    with open(job_file, "w") as f:
+        f.write(json.dumps({"path": "students/1/a.pdf", "size": 11, "attempts": 0,
+                            "spooled_at": time.time(), "last_error": None}))
+
+    wbq = make_queue(tmp_path, workers=2)
+    wbq.start()
+    assert wbq.stats()["workers"] == 2
+    wait_for(lambda: statuses.get("students/1/a.pdf") == "committed")
+    assert backend.get_object("students/1/a.pdf") == b"left behind"
@@ -0,0 +1,159 @@
+"""
+utils/compression.py
+
+Optional compression stage for stored document bytes. The codec is chosen
+per doc_type and file size (see COMPRESSION_POLICY) and stored next to the
+row, so reads decompress transparently.
+
+Codecs: "none", "gzip" (standard library) and "zstd" (needs the optional
+`zstandard` package; gzip is used instead when it isn't installed).
+"""
+
+import gzip
+import os
+import zlib
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CODECS = ("none", "gzip", "zstd")
+
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "true").lower() in ("1", "true", "yes")
+
+# Files smaller than this are stored raw; the codec header would eat the saving
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "4096"))
+
+# Keep the compressed form only if it is at most this fraction of the original
+COMPRESSION_MAX_RATIO = float(os.getenv("COMPRESSION_MAX_RATIO", "0.9"))
+
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", "3"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+
+
+def _parse_policy(spec):
+    """Parse "Transcript=zstd,ID=none,*=gzip" into {doc_type: codec}."""
+    policy = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        doc_type, _, codec = item.partition("=")
+        codec = codec.strip().lower()
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec in COMPRESSION_POLICY: {item}")
+        policy[doc_type.strip()] = codec
+    return policy
+
+
+# doc_type -> codec; "*" covers every other type. IDs are photos/scans and
+# certificates are usually PDFs, which are already compressed.
+COMPRESSION_POLICY = {
+    "Transcript": "zstd",
+    "Other": "gzip",
+    "ID": "none",
+    "Certificate": "none",
+    "*": "none",
+    **_parse_policy(os.getenv("COMPRESSION_POLICY", "")),
+}
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def available_codec(codec):
+    """`codec`, or gzip when zstd is requested but zstandard isn't installed."""
+    if codec == "zstd" and _zstd() is None:
+        return "gzip"
+    return codec
+
+
+def choose_codec(doc_type, size_bytes) -> str:
+    """Codec the policy picks for a file of this type and size (None if unknown)."""
+    if not COMPRESSION_ENABLED or (size_bytes is not None and size_bytes < COMPRESSION_MIN_BYTES):
+        return "none"
+    codec = COMPRESSION_POLICY.get(doc_type, COMPRESSION_POLICY.get("*", "none"))
+    return available_codec(codec)
+
+
+def compress(data, codec) -> bytes:
+    if codec == "none":
+        return data
+    if codec == "gzip":
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    if codec == "zstd":
+        return _zstd().ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    raise ValueError(f"Unknown codec: {codec}")
+
+
+def decompress(data, codec) -> bytes:
+    if codec in (None, "none"):
+        return data
+    if codec == "gzip":
+        return gzip.decompress(data)
+    if codec == "zstd":
+        # Streamed frames don't record their content size, so always use the stream reader
+        return _zstd().ZstdDecompressor().decompressobj().decompress(data)
+    raise ValueError(f"Unknown codec: {codec}")
+
+
+def compress_for_storage(data, doc_type) -> tuple:
+    """
+    Apply the policy to a whole file. Returns (stored_bytes, codec); the
+    data is kept raw when the codec doesn't shrink it enough to pay for
+    decompressing it on every read.
+    """
+    codec = choose_codec(doc_type, len(data))
+    if codec == "none":
+        return data, "none"
+    packed = compress(data, codec)
+    if len(packed) > len(data) * COMPRESSION_MAX_RATIO:
+        return data, "none"
+    return packed, codec
+
+
+class StreamCompressor:
+    """
+    Incremental compressor for chunked uploads: compress(chunk) returns
+    whatever output is ready (possibly b""), flush() the remainder.
+    """
+
+    def __init__(self, codec):
+        self.codec = codec
+        if codec == "gzip":
+            # wbits=31 writes a gzip header/trailer, so gzip.decompress reads it back
+            self._obj = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+        elif codec == "zstd":
+            self._obj = _zstd().ZstdCompressor(level=ZSTD_LEVEL).compressobj()
+        elif codec == "none":
+            self._obj = None
+        else:
+            raise ValueError(f"Unknown codec: {codec}")
+
+    def compress(self, chunk) -> bytes:
+        return self._obj.compress(chunk) if self._obj else chunk
+
+    def flush(self) -> bytes:
+        return self._obj.flush() if self._obj else b""
+
+
+class StreamDecompressor:
+    """Incremental counterpart of StreamCompressor for chunked reads."""
+
+    def __init__(self, codec):
+        self.codec = codec
+        if codec == "gzip":
+            self._obj = zlib.decompressobj(31)
+        elif codec == "zstd":
+            self._obj = _zstd().ZstdDecompressor().decompressobj()
+        elif codec in (None, "none"):
+            self._obj = None
+        else:
+            raise ValueError(f"Unknown codec: {codec}")
+
+    def decompress(self, chunk) -> bytes:
+        return self._obj.decompress(chunk) if self._obj else chunk
+
+    def flush(self) -> bytes:
+        return self._obj.flush() if self._obj else b""
@@ -0,0 +1,104 @@
+"""
+utils/import_profile.py
+
+Cold-start import cost per module. Each module is imported in a fresh
+interpreter with `python -X importtime`, so nothing is already cached in
+sys.modules, and the report shows its total import time plus the heaviest
+modules it pulled in.
+
+    python -m utils.import_profile                     # the app's own modules
+    python -m utils.import_profile pandas plotly.graph_objects --top 10
+"""
+
+import os
+import subprocess
+import sys
+
+# Modules app.py imports on every Streamlit worker start, plus the heavy
+# third-party ones it now defers
+DEFAULT_MODULES = [
+    "db.queries",
+    "storage.gcs",
+    "services.document_service",
+    "services.ingest_service",
+    "services.benchmark_service",
+    "services.history_service",
+    "services.hedge_service",
+    "services.async_service",
+    "streamlit",
+    "pandas",
+    "plotly.graph_objects",
+    "openpyxl",
+    "google.cloud.storage",
+]
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _importtime(code):
+    """
+    Run `code` under -X importtime. Returns ({module: (self_us, cumulative_us,
+    top_level)}, process); top_level marks imports not nested in another.
+    """
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True, text=True, cwd=_ROOT,
+    )
+    timings = {}
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # Nested imports are indented by two spaces per level after the leading one
+        top_level = not name[1:].startswith(" ")
+        timings[name.strip()] = (int(self_us), int(cumulative_us), top_level)
+    return timings, proc
+
+
+def profile_import(module, top=5) -> dict:
+    """
+    Import `module` in a fresh interpreter. Returns {"module", "total_ms",
+    "self_ms", "heaviest": [(name, cumulative_ms), ...], "error"}.
+    """
+    timings, proc = _importtime(f"import {module}")
+    # Modules the interpreter loads at startup anyway (site, encodings, ...)
+    startup, _ = _importtime("pass")
+
+    error = proc.stderr.strip().splitlines()[-1] if proc.returncode else None
+    new = {name: t for name, t in timings.items() if name not in startup}
+    # Top-level entries include parent packages, e.g. plotly before plotly.graph_objects
+    total_us = sum(cum for _, cum, top_level in new.values() if top_level)
+    heaviest = sorted(
+        ((name, cum) for name, (_, cum, _) in new.items() if name != module),
+        key=lambda item: item[1], reverse=True,
+    )[:top]
+    return {
+        "module": module,
+        "total_ms": round(total_us / 1000, 1),
+        "self_ms": round(new.get(module, (0,))[0] / 1000, 1),
+        "heaviest": [(name, round(cum / 1000, 1)) for name, cum in heaviest],
+        "error": error,
+    }
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Report cold-start import time per module.")
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--top", type=int, default=5, help="heaviest dependencies to list per module")
+    args = parser.parse_args(argv)
+
+    print(f"{'Module':<30} {'Cold import (ms)':>17}  Heaviest dependencies (cumulative ms)")
+    for module in args.modules:
+        r = profile_import(module, args.top)
+        if r["error"]:
+            print(f"{module:<30} {'failed':>17}  {r['error']}")
+            continue
+        deps = ", ".join(f"{name} {ms}" for name, ms in r["heaviest"])
+        print(f"{module:<30} {r['total_ms']:>17}  {deps}")
+
+
+if __name__ == "__main__":
+    main()
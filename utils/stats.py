@@ -0,0 +1,100 @@
+import math
+import random
+
+
+def percentile(values, pct: float) -> float:
+    """
+    Linear-interpolated percentile (same method as numpy's default).
+    pct is 0–100. Returns 0.0 for an empty list.
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    lower = math.floor(rank)
+    upper = math.ceil(rank)
+    if lower == upper:
+        return ordered[int(rank)]
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (rank - lower)
+
+
+def mean(values) -> float:
+    return sum(values) / len(values) if values else 0.0
+
+
+def stddev(values) -> float:
+    """Sample standard deviation (n - 1). Returns 0.0 for fewer than two values."""
+    if len(values) < 2:
+        return 0.0
+    m = mean(values)
+    return math.sqrt(sum((v - m) ** 2 for v in values) / (len(values) - 1))
+
+
+def bootstrap_ci(values, stat=mean, confidence: float = 0.95,
+                 n_resamples: int = 1000, seed: int = 0) -> tuple:
+    """
+    Percentile-bootstrap confidence interval for stat(values).
+    Seeded so the same samples always give the same interval.
+    """
+    if not values:
+        return 0.0, 0.0
+    if len(values) == 1:
+        return values[0], values[0]
+    rng = random.Random(seed)
+    n = len(values)
+    estimates = [stat(rng.choices(values, k=n)) for _ in range(n_resamples)]
+    tail = (1 - confidence) / 2 * 100
+    return percentile(estimates, tail), percentile(estimates, 100 - tail)
+
+
+def summarize(values) -> dict:
+    """Latency summary: count, mean, stddev, min/max, p50/p90/p95/p99 and a 95% CI of the mean."""
+    ci_low, ci_high = bootstrap_ci(values)
+    return {
+        "n": len(values),
+        "mean": round(mean(values), 2),
+        "stddev": round(stddev(values), 2),
+        "min": round(min(values), 2) if values else 0.0,
+        "max": round(max(values), 2) if values else 0.0,
+        "p50": round(percentile(values, 50), 2),
+        "p90": round(percentile(values, 90), 2),
+        "p95": round(percentile(values, 95), 2),
+        "p99": round(percentile(values, 99), 2),
+        "ci95_low": round(ci_low, 2),
+        "ci95_high": round(ci_high, 2),
+    }
+
+
+def mann_whitney_u(a, b) -> float:
+    """
+    Two-sided Mann-Whitney U test p-value (normal approximation with tie
+    correction). Makes no normality assumption, which suits skewed latency
+    samples. Returns 1.0 when either sample is empty or all values tie.
+    """
+    n1, n2 = len(a), len(b)
+    if not n1 or not n2:
+        return 1.0
+
+    combined = sorted([(v, 0) for v in a] + [(v, 1) for v in b])
+    ranks = [0.0] * len(combined)
+    tie_term = 0
+    i = 0
+    while i < len(combined):
+        j = i
+        while j + 1 < len(combined) and combined[j + 1][0] == combined[i][0]:
+            j += 1
+        avg_rank = (i + j) / 2 + 1
+        for k in range(i, j + 1):
+            ranks[k] = avg_rank
+        t = j - i + 1
+        tie_term += t ** 3 - t
+        i = j + 1
+
+    rank_sum_a = sum(r for r, (_, group) in zip(ranks, combined) if group == 0)
+    u = rank_sum_a - n1 * (n1 + 1) / 2
+    n = n1 + n2
+    variance = n1 * n2 / 12 * ((n + 1) - tie_term / (n * (n - 1)))
+    if variance <= 0:
+        return 1.0
+    z = (abs(u - n1 * n2 / 2) - 0.5) / math.sqrt(variance)
+    return min(1.0, math.erfc(max(z, 0) / math.sqrt(2)))
@@ -1,12 +1,104 @@
 import time
+import threading
+
+_local = threading.local()
+
+
+class Span:
+    """One named, timed section of work; spans nest to form a tree."""
+
+    __slots__ = ("name", "wall_ns", "cpu_ns", "children")
+
+    def __init__(self, name):
+        self.name = name
+        self.wall_ns = 0
+        self.cpu_ns = 0
+        self.children = []
+
+    @property
+    def wall_ms(self):
+        return round(self.wall_ns / 1e6, 3)
+
+    @property
+    def cpu_ms(self):
+        return round(self.cpu_ns / 1e6, 3)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "wall_ms": self.wall_ms,
+            "cpu_ms": self.cpu_ms,
+            "children": [c.to_dict() for c in self.children],
+        }
 
 
 class TimedBlock:
-    """Context manager that records elapsed time in milliseconds."""
+    """
+    Context manager that records elapsed time in milliseconds.
+
+    Timing uses perf_counter_ns (wall) and thread_time_ns (CPU of the
+    current thread). Give it a name, e.g. TimedBlock("connect"), and it is
+    also recorded as a span by any SpanRecorder active on this thread;
+    named blocks opened inside it become its children.
+    """
+
+    def __init__(self, name=None):
+        self.name = name
+        self.span = None
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if self.name is not None and stack:
+            self.span = Span(self.name)
+            stack[-1].append(self.span)
+            stack.append(self.span.children)
+        self._cpu_start = time.thread_time_ns()
+        self._start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *args):
+        self.elapsed_ns = time.perf_counter_ns() - self._start
+        self.cpu_ns = time.thread_time_ns() - self._cpu_start
+        self.elapsed_ms = round(self.elapsed_ns / 1e6, 2)
+        self.cpu_ms = round(self.cpu_ns / 1e6, 2)
+        if self.span is not None:
+            self.span.wall_ns = self.elapsed_ns
+            self.span.cpu_ns = self.cpu_ns
+            _local.stack.pop()
+
+
+class SpanRecorder:
+    """
+    Collect the named TimedBlocks run on this thread while active.
+
+        with SpanRecorder() as rec:
+            insert_blob_timed(...)
+        rec.phases()   # {"connect": {"wall_ms": .., "cpu_ms": ..}, "serialize": ..., ...}
+
+    Recorders nest; an inner recorder captures its spans without the outer
+    one seeing them.
+    """
+
+    def __init__(self):
+        self.spans = []
 
     def __enter__(self):
-        self._start = time.perf_counter()
+        self._saved = getattr(_local, "stack", None)
+        _local.stack = [self.spans]
         return self
 
     def __exit__(self, *args):
-        self.elapsed_ms = round((time.perf_counter() - self._start) * 1000, 2)
+        _local.stack = self._saved
+
+    def phases(self):
+        """Wall and CPU ms per top-level span name, summed over repeats."""
+        totals = {}
+        for span in self.spans:
+            entry = totals.setdefault(span.name, {"wall_ms": 0.0, "cpu_ms": 0.0})
+            entry["wall_ms"] = round(entry["wall_ms"] + span.wall_ns / 1e6, 3)
+            entry["cpu_ms"] = round(entry["cpu_ms"] + span.cpu_ns / 1e6, 3)
+        return totals
+
+    def to_dicts(self):
+        """The full span tree, e.g. for logging or JSON export."""
+        return [s.to_dict() for s in self.spans]